@@ -0,0 +1,90 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import PlainTextResponse
+from ..config import settings
+from ..services.archive import archive_service
+from ..services.async_processor import async_processor
+from ..services.profiler import profile_process
+from ..services.quota import quota_service
+from ..services.retention import retention_service
+from .dependencies import verify_admin_token
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(verify_admin_token)])
+
+@router.post("/config/reload")
+async def reload_config():
+    """立即重新加载配置文件；校验失败时保留当前配置"""
+    previous = settings.snapshot()
+    try:
+        snapshot = settings.reload()
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"配置无效，未生效: {e}")
+    
+    restart_required = [
+        name for name in ("api_host", "api_port", "storage_path")
+        if getattr(previous, name) != getattr(snapshot, name)
+    ]
+    return {
+        "version": snapshot.version,
+        "loaded_at": snapshot.loaded_at,
+        "restart_required": restart_required
+    }
+
+@router.get("/clients")
+async def client_usage():
+    """各令牌的权重、限额、最近一分钟请求数和当前排队/处理中任务数（不返回令牌本身）"""
+    active = async_processor.scheduler.usage()
+    names = [client.name for client in settings.api_clients]
+    names += [name for name in active if name not in names]
+    clients = []
+    for name in names:
+        config = settings.get_api_client(name)
+        clients.append({
+            "name": name,
+            "weight": config.weight if config else 1,
+            "max_concurrency": config.max_concurrency if config else 0,
+            "requests_per_minute": config.requests_per_minute if config else 0,
+            "admin": config.admin if config else False,
+            "requests_last_minute": quota_service.recent(name),
+            **active.get(name, {"queued": 0, "in_flight": 0})
+        })
+    return {
+        "max_in_flight": settings.max_in_flight,
+        "clients": clients
+    }
+
+@router.get("/retention")
+async def retention_report():
+    """预演一次清理，返回可回收空间，不修改任何文件"""
+    report = await asyncio.to_thread(retention_service.sweep, True)
+    return {
+        "enabled": settings.retention_enabled,
+        "report": report,
+        "last_sweep": retention_service.last_report
+    }
+
+@router.post("/retention/sweep")
+async def retention_sweep(dry_run: bool = Query(default=False, description="只统计不删除")):
+    """立即按当前保留策略执行一次清理"""
+    return await asyncio.to_thread(retention_service.sweep, dry_run)
+
+@router.post("/archive/compact")
+async def archive_compact(dry_run: bool = Query(default=False, description="只统计不归档")):
+    """立即把超过 archive.after_days 天的已结束任务打包进段文件"""
+    report = await asyncio.to_thread(archive_service.compact, dry_run)
+    if report is None:
+        raise HTTPException(status_code=409, detail="已有归档正在进行")
+    return report
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=10, gt=0, description="采样时长（秒）"),
+    interval: float = Query(default=None, ge=0.001, description="采样间隔（秒），默认取 profiler.interval")
+):
+    """对运行中的进程采样seconds秒，返回折叠栈（可用flamegraph.pl或speedscope查看）"""
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(status_code=400, detail=f"采样时长不能超过 {settings.profiler_max_seconds} 秒")
+    result = await asyncio.to_thread(profile_process, seconds, interval)
+    if result is None:
+        raise HTTPException(status_code=409, detail="已有采样正在进行")
+    return PlainTextResponse(result)
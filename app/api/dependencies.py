@@ -1,18 +1,12 @@
+import math
 from fastapi import Header, HTTPException, Query, status
 from ..config import settings
+from ..services.quota import quota_service
+from ..services.scheduler import ANONYMOUS_CLIENT
 
 
-async def verify_api_token(
-    authorization: str | None = Header(default=None, convert_underscores=False),
-    token: str | None = Query(default=None)
-):
-    """校验API访问令牌，支持Bearer头或token查询参数。"""
-    expected_token = settings.api_token
-    
-    # 未配置令牌时不启用认证
-    if not expected_token:
-        return
-    
+def _provided_token(authorization: str | None, token: str | None) -> str | None:
+    """取Bearer头中的令牌，没有时取token查询参数。"""
     provided_token = None
     
     if authorization:
@@ -23,9 +17,68 @@ async def verify_api_token(
     if not provided_token and token:
         provided_token = token.strip()
     
-    if provided_token != expected_token:
+    return provided_token
+
+
+def _unauthorized() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or missing API token",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+
+async def verify_api_token(
+    authorization: str | None = Header(default=None, convert_underscores=False),
+    token: str | None = Query(default=None)
+) -> str:
+    """校验API访问令牌，支持Bearer头或token查询参数；返回令牌名称，未配置令牌时返回anonymous。"""
+    if not settings.api_clients:
+        return ANONYMOUS_CLIENT
+    client = settings.find_api_client(_provided_token(authorization, token))
+    if client is None:
+        raise _unauthorized()
+    return client.name
+
+
+async def verify_admin_token(
+    authorization: str | None = Header(default=None, convert_underscores=False),
+    token: str | None = Query(default=None)
+):
+    """校验管理接口令牌：auth.admin.token（未设置时为auth.api.token），或设置了admin的具名令牌；均未配置令牌时不校验。"""
+    if not _is_admin(_provided_token(authorization, token)):
+        raise _unauthorized()
+
+
+def _is_admin(provided_token: str | None) -> bool:
+    if not settings.admin_token and not settings.api_clients:
+        return True
+    if settings.admin_token and provided_token == settings.admin_token:
+        return True
+    client = settings.find_api_client(provided_token)
+    return client is not None and client.admin
+
+
+async def profile_requested(
+    x_profile: str | None = Header(default=None, description="设为1时采样本次请求（需管理接口令牌），折叠栈地址见响应头X-Profile-URL"),
+    authorization: str | None = Header(default=None, convert_underscores=False),
+    token: str | None = Query(default=None)
+) -> bool:
+    """是否对本次请求做单请求采样；采样线程有开销，只允许管理接口令牌开启。"""
+    if not x_profile or x_profile.lower() not in ("1", "true", "yes"):
+        return False
+    if not _is_admin(_provided_token(authorization, token)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="单请求采样需要管理接口令牌")
+    return True
+
+
+def check_quota(client: str) -> None:
+    """识别请求计入调用方的每分钟限额，超出时返回429并在Retry-After中给出等待秒数。
+    在请求校验通过、即将开始处理时调用，被拒绝的无效请求不占用限额。"""
+    retry_after = quota_service.acquire(client)
+    if retry_after is not None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or missing API token",
-            headers={"WWW-Authenticate": "Bearer"}
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"令牌 {client} 超出每分钟请求限额",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
         )
@@ -1,20 +1,83 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from ..config import settings
+from ..services.archive import archive_service
+from ..services.image_processor import image_processor
 from ..services.storage import storage_service
 from .dependencies import verify_api_token
 
 router = APIRouter(dependencies=[Depends(verify_api_token)])
 
+PREVIEW_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
 @router.get("/ics/{folder_name}")
 async def download_ics(folder_name: str):
     """下载ICS文件"""
-    ics_path = storage_service.get_ics_path(folder_name)
+    try:
+        ics_path = storage_service.get_ics_path(folder_name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="ICS文件不存在")
     
     if not ics_path.exists():
-        raise HTTPException(status_code=404, detail="ICS文件不存在")
+        # 已归档任务从段文件读取
+        ics_content = await storage_service.load_ics(folder_name)
+        if ics_content is None:
+            raise HTTPException(status_code=404, detail="ICS文件不存在")
+        return Response(
+            content=ics_content,
+            media_type="text/calendar",
+            headers={"Content-Disposition": 'attachment; filename="calendar.ics"'}
+        )
     
     return FileResponse(
         path=str(ics_path),
         filename="calendar.ics",
         media_type="text/calendar"
     )
+
+@router.get("/preview/{folder_name}/{size}")
+async def download_preview(folder_name: str, size: str):
+    """获取任务图片的缩略图/预览图（尺寸名见 image_processing.previews），可长期缓存"""
+    if size not in settings.image_preview_sizes:
+        raise HTTPException(status_code=404, detail="不支持的预览尺寸")
+    try:
+        preview_path = storage_service.get_preview_path(folder_name, size)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="预览图不存在")
+    
+    if not preview_path.exists():
+        # 接入预览前的旧任务：从原图补生成
+        original_path = storage_service.task_path(folder_name) / "original.jpg"
+        if not original_path.exists():
+            raise HTTPException(status_code=404, detail="预览图不存在")
+        content = await asyncio.to_thread(original_path.read_bytes)
+        previews = await asyncio.to_thread(image_processor.previews_from_file, content)
+        await storage_service.save_previews(folder_name, previews)
+    
+    # 预览图生成后不再变化；需要认证，只允许浏览器私有缓存
+    return FileResponse(
+        path=str(preview_path),
+        media_type="image/jpeg",
+        headers={"Cache-Control": PREVIEW_CACHE_CONTROL}
+    )
+
+@router.get("/storage/{folder_name}/{file_name}", include_in_schema=False)
+async def download_task_file(folder_name: str, file_name: str):
+    """按任务ID访问任务文件，兼容分片存储前的 /storage/{folder_name}/{file} 链接"""
+    try:
+        file_path = storage_service.task_path(folder_name) / file_name
+    except ValueError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if file_name.startswith("."):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if not file_path.is_file():
+        content = await asyncio.to_thread(archive_service.read_file, folder_name, file_name)
+        if content is None:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        media_type = "text/calendar" if file_name.endswith(".ics") else "application/json"
+        return Response(content=content, media_type=media_type)
+    
+    return FileResponse(path=str(file_path))
@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from ..services.export import export_service, EXPORT_FORMATS
+from .dependencies import verify_api_token
+
+router = APIRouter(dependencies=[Depends(verify_api_token)])
+
+MEDIA_TYPES = {"zip": "application/zip", "tar": "application/gzip"}
+EXTENSIONS = {"zip": "zip", "tar": "tar.gz"}
+
+@router.get("/export")
+async def export_tasks(
+    format: str = Query(default="zip", description="导出格式：zip 或 tar（tar.gz）"),
+    ids: Optional[str] = Query(default=None, description="逗号分隔的任务ID，不指定时导出全部"),
+    since: Optional[datetime] = Query(default=None, description="只导出该时间之后更新的任务"),
+    status: Optional[str] = Query(default=None, description="按任务状态过滤，如 completed"),
+    include_originals: bool = Query(default=False, description="是否包含原始图片")
+):
+    """流式导出任务的result.json、calendar.ics（及原图），边生成边发送"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="不支持的导出格式")
+    
+    id_list = [item.strip() for item in ids.split(",") if item.strip()] if ids else None
+    if since is not None and since.tzinfo is not None:
+        # 任务时间戳为本地时间（不带时区）
+        since = since.astimezone().replace(tzinfo=None)
+    
+    filename = f"tickets_{datetime.now():%Y%m%d_%H%M%S}.{EXTENSIONS[format]}"
+    return StreamingResponse(
+        export_service.stream(format, id_list, since, status, include_originals),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
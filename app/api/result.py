@@ -1,12 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from ..services.archive import archive_service
 from ..services.async_processor import async_processor
+from ..services.storage import storage_service, TERMINAL_STATUSES
 from ..models.response import ResultResponse
 from .dependencies import verify_api_token
 
 router = APIRouter(dependencies=[Depends(verify_api_token)])
 
 @router.get("/result/{folder_name}", response_model=ResultResponse)
-async def get_result(folder_name: str):
+async def get_result(
+    folder_name: str,
+    include_timings: bool = Query(default=False, description="附带耗时分段、图片尺寸和token用量")
+):
     """获取识别结果"""
     result = await async_processor.get_task_result(folder_name)
     
@@ -15,13 +20,34 @@ async def get_result(folder_name: str):
     
     response = ResultResponse(
         id=folder_name,
-        status=result["status"]
+        status=result["status"],
+        updated_at=result.get("timestamp")
     )
     
     if result["status"] == "completed" and result.get("data"):
         response.data = result["data"]
         response.ics_url = f"/ics/{folder_name}"
+    elif result["status"] == "processing" and (result.get("data") or {}).get("partial"):
+        response.partial = result["data"]["partial"]
     elif result["status"] == "failed":
         response.error = result.get("data", {}).get("error", "处理失败")
     
+    if include_timings:
+        response.timings = result.get("timings")
+    
     return response
+
+@router.delete("/result/{folder_name}", status_code=204)
+async def delete_result(folder_name: str):
+    """删除已结束的任务及其文件"""
+    result = await async_processor.get_task_result(folder_name)
+    
+    if result.get("status") == "not_found":
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if result["status"] not in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail="任务尚未结束，不能删除")
+    if archive_service.contains(folder_name):
+        raise HTTPException(status_code=409, detail="已归档的任务不能删除")
+    
+    await storage_service.delete_task(folder_name)
+    return Response(status_code=204)
@@ -1,29 +1,61 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Response
+from ..config import settings
 from ..services.async_processor import async_processor
+from ..services.batch import batch_processor
+from ..services.profiler import TaskSampler
+from ..services.storage import storage_service
 from ..models.response import UploadResponse, ProcessResponse
-from .dependencies import verify_api_token
+from .dependencies import check_quota, profile_requested, verify_api_token
 
 router = APIRouter(dependencies=[Depends(verify_api_token)])
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_ticket(file: UploadFile = File(...)):
+async def upload_ticket(
+    file: UploadFile = File(...),
+    batch: bool = Query(default=False, description="加入延迟批处理（成本更低，结果可能数小时后返回）"),
+    client: str = Depends(verify_api_token)
+):
     """上传票据图片进行识别"""
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="只支持图片文件")
+    if batch and not settings.batch_enabled:
+        raise HTTPException(status_code=400, detail="批处理模式未启用")
+    check_quota(client)
     
     content = await file.read()
-    folder_name = await async_processor.submit_task(file.filename, content)
+    
+    if batch:
+        folder_name = await batch_processor.submit_task(file.filename, content, client)
+        return UploadResponse(id=folder_name, status="queued")
+    
+    folder_name = await async_processor.submit_task(file.filename, content, client)
     
     return UploadResponse(id=folder_name, status="processing")
 
 @router.post("/process", response_model=ProcessResponse)
-async def process_ticket(file: UploadFile = File(...)):
+async def process_ticket(
+    response: Response,
+    file: UploadFile = File(...),
+    profile_enabled: bool = Depends(profile_requested),
+    client: str = Depends(verify_api_token)
+):
     """上传票据图片并同步返回识别结果"""
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="只支持图片文件")
+    check_quota(client)
     
     content = await file.read()
-    result = await async_processor.process_ticket_sync(file.filename, content)
+    sampler = None
+    if profile_enabled:
+        sampler = TaskSampler(asyncio.current_task(), settings.profiler_interval).start()
+    try:
+        result = await async_processor.process_ticket_sync(file.filename, content, client)
+    finally:
+        profile = sampler.stop() if sampler else None
+    if profile is not None:
+        await storage_service.save_profile(result["id"], profile)
+        response.headers["X-Profile-URL"] = f"/storage/{result['id']}/profile.txt"
     
     if result["status"] == "completed":
         return ProcessResponse(
@@ -1,101 +1,370 @@
 import os
 import json
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Tuple
 
-class Settings:
-    def __init__(self):
-        self._config = self._load_config()
-    
-    def _load_config(self) -> Dict[str, Any]:
-        config_path = Path("config/config.json")
-        if config_path.exists():
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        else:
-            config = {}
-        
-        # 环境变量覆盖
-        if os.getenv("OPENAI_API_KEY"):
-            config.setdefault("openai", {})["api_key"] = os.getenv("OPENAI_API_KEY")
-        if os.getenv("OPENAI_BASE_URL"):
-            config.setdefault("openai", {})["base_url"] = os.getenv("OPENAI_BASE_URL")
-        return config
-    
-    @property
-    def api_host(self) -> str:
-        return self._config.get("api", {}).get("host", "0.0.0.0")
+CONFIG_PATH = Path("config/config.json")
+DEFAULT_API_CLIENT = "default"
+
+logger = logging.getLogger(__name__)
+
+
+class _ConfigReader:
+    """按点分路径读取配置并校验类型，非法值抛出ValueError"""
     
-    @property
-    def api_port(self) -> int:
-        return self._config.get("api", {}).get("port", 8000)
+    def __init__(self, config: Dict[str, Any]):
+        self._config = config
     
-    @property
-    def openai_api_key(self) -> str:
-        return self._config.get("openai", {}).get("api_key", "")
+    def _get(self, path: str, default: Any) -> Any:
+        node = self._config
+        for part in path.split("."):
+            if not isinstance(node, dict) or part not in node:
+                return default
+            node = node[part]
+        return default if node is None else node
     
-    @property
-    def openai_base_url(self) -> str:
-        return self._config.get("openai", {}).get("base_url", "https://api.openai.com/v1")
+    def str(self, path: str, default: str) -> str:
+        value = self._get(path, default)
+        if not isinstance(value, str):
+            raise ValueError(f"配置项 {path} 应为字符串")
+        return value
     
-    @property
-    def openai_model(self) -> str:
-        return self._config.get("openai", {}).get("model", "gpt-4-vision-preview")
+    def bool(self, path: str, default: bool) -> bool:
+        value = self._get(path, default)
+        if not isinstance(value, bool):
+            raise ValueError(f"配置项 {path} 应为true/false")
+        return value
     
-    @property
-    def storage_path(self) -> str:
-        return self._config.get("storage", {}).get("path", "./storage")
+    def int(self, path: str, default: int, minimum: int = None, maximum: int = None) -> int:
+        value = self._get(path, default)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"配置项 {path} 应为整数")
+        self._check_range(path, value, minimum, maximum)
+        return value
     
-    @property
-    def async_enabled(self) -> bool:
-        return self._config.get("async", {}).get("enabled", True)
+    def float(self, path: str, default: float, minimum: float = None, maximum: float = None) -> float:
+        value = self._get(path, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"配置项 {path} 应为数字")
+        self._check_range(path, value, minimum, maximum)
+        return float(value)
     
-    @property
-    def max_workers(self) -> int:
-        return self._config.get("async", {}).get("max_workers", 4)
+    def choice(self, path: str, default: str, choices: tuple) -> str:
+        value = self.str(path, default)
+        if value not in choices:
+            raise ValueError(f"配置项 {path} 应为 {'/'.join(choices)} 之一")
+        return value
     
-    @property
-    def image_resize(self) -> bool:
-        return self._config.get("image_processing", {}).get("resize", True)
+    def int_map(self, path: str, default: Dict[str, int] = None, minimum: int = 0) -> Mapping[str, int]:
+        value = self._get(path, default or {})
+        if not isinstance(value, dict):
+            raise ValueError(f"配置项 {path} 应为对象")
+        for key, item in value.items():
+            if isinstance(item, bool) or not isinstance(item, int):
+                raise ValueError(f"配置项 {path}.{key} 应为整数")
+            self._check_range(f"{path}.{key}", item, minimum, None)
+        return MappingProxyType(dict(value))
     
-    @property
-    def image_max_width(self) -> int:
-        return self._config.get("image_processing", {}).get("max_width", 1024)
+    def api_clients(self, path: str) -> Tuple["ApiClient", ...]:
+        """具名API令牌列表，名称和令牌均不可重复"""
+        value = self._get(path, [])
+        if not isinstance(value, list):
+            raise ValueError(f"配置项 {path} 应为数组")
+        clients = []
+        for index, item in enumerate(value):
+            if not isinstance(item, dict):
+                raise ValueError(f"配置项 {path}[{index}] 应为对象")
+            entry = _ConfigReader(item)
+            try:
+                client = ApiClient(
+                    name=entry.str("name", ""),
+                    token=entry.str("token", ""),
+                    weight=entry.int("weight", 1, minimum=1),
+                    max_concurrency=entry.int("max_concurrency", 0, minimum=0),
+                    requests_per_minute=entry.int("requests_per_minute", 0, minimum=0),
+                    admin=entry.bool("admin", False)
+                )
+            except ValueError as e:
+                raise ValueError(f"{path}[{index}]: {e}")
+            if not client.name or not client.token:
+                raise ValueError(f"配置项 {path}[{index}] 缺少name或token")
+            if any(other.name == client.name or other.token == client.token for other in clients):
+                raise ValueError(f"配置项 {path}[{index}] 的name或token重复")
+            clients.append(client)
+        return tuple(clients)
     
-    @property
-    def image_max_height(self) -> int:
-        return self._config.get("image_processing", {}).get("max_height", 1024)
+    def _check_range(self, path: str, value, minimum, maximum) -> None:
+        if minimum is not None and value < minimum:
+            raise ValueError(f"配置项 {path} 不能小于 {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"配置项 {path} 不能大于 {maximum}")
+
+
+@dataclass(frozen=True)
+class ApiClient:
+    """具名API令牌：调度权重、同时处理的任务数上限和每分钟识别请求数上限（0表示不限），以及能否访问管理接口"""
+    name: str
+    token: str = field(repr=False)
+    weight: int = 1
+    max_concurrency: int = 0
+    requests_per_minute: int = 0
+    admin: bool = False
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """解析校验后的不可变配置快照"""
+    api_host: str = "0.0.0.0"
+    api_port: int = 8000
+    openai_api_key: str = ""
+    openai_base_url: str = "https://api.openai.com/v1"
+    openai_model: str = "gpt-4-vision-preview"
+    openai_max_tokens: int = 1000
+    openai_response_format: str = "json_object"
+    openai_repair_attempts: int = 1
+    openai_stream: bool = True
+    openai_stream_idle_timeout: float = 30
+    openai_stream_usage: bool = True
+    openai_backend: str = "live"
+    openai_recordings_path: str = "./recordings"
+    openai_replay_speed: float = 1.0
+    storage_path: str = "./storage"
+    storage_cache_size: int = 1024
+    storage_negative_ttl: float = 5
+    async_enabled: bool = True
+    max_workers: int = 4
+    max_in_flight: int = 0
+    image_resize: bool = True
+    image_max_width: int = 1024
+    image_max_height: int = 1024
+    image_quality: int = 85
+    image_auto_rotate: bool = True
+    image_denoise: bool = False
+    image_preview_sizes: Mapping[str, int] = field(
+        default_factory=lambda: MappingProxyType({"thumb": 160, "preview": 640})
+    )
+    barcode_enabled: bool = True
+    batch_enabled: bool = False
+    batch_base_url: str = ""
+    batch_max_size: int = 100
+    batch_flush_interval: float = 600
+    batch_poll_interval: float = 60
+    batch_completion_window: str = "24h"
+    timezone_enrich: bool = True
+    retention_enabled: bool = False
+    retention_interval: float = 3600
+    retention_completed_days: float = 30
+    retention_failed_days: float = 7
+    retention_downsample_max_side: int = 0
+    retention_max_total_mb: float = 0
+    archive_enabled: bool = False
+    archive_interval: float = 86400
+    archive_after_days: float = 90
+    archive_segment_mb: int = 64
+    health_max_queued: int = 20
+    health_min_free_mb: float = 200
+    health_upstream_window: float = 300
+    health_upstream_min_samples: int = 5
+    health_upstream_max_error_rate: float = 0.5
+    health_upstream_max_p95: float = 0
+    profiler_interval: float = 0.01
+    profiler_max_seconds: float = 120
+    profiler_signal_seconds: float = 30
+    profiler_output_path: str = "./profiles"
+    reminder_hours: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    streamlit_username: str | None = None
+    streamlit_password: str | None = None
+    api_token: str = ""
+    api_clients: Tuple[ApiClient, ...] = ()
+    admin_token: str = ""
+    config_watch_interval: float = 2
+    version: int = 0
+    loaded_at: str = ""
     
-    @property
-    def image_quality(self) -> int:
-        return self._config.get("image_processing", {}).get("quality", 85)
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any], version: int = 0) -> "ConfigSnapshot":
+        read = _ConfigReader(config)
+        api_token = read.str("auth.api.token", "") or os.getenv("API_AUTH_TOKEN", "")
+        api_clients = read.api_clients("auth.api.tokens")
+        # 单一令牌视为名为default的令牌，不设限额
+        if api_token and all(client.token != api_token for client in api_clients):
+            if any(client.name == DEFAULT_API_CLIENT for client in api_clients):
+                raise ValueError(f"auth.api.token 与 auth.api.tokens 中名为 {DEFAULT_API_CLIENT} 的令牌冲突")
+            api_clients += (ApiClient(name=DEFAULT_API_CLIENT, token=api_token),)
+        max_workers = read.int("async.max_workers", 4, minimum=1)
+        # 配置了具名令牌时默认限制总并发，否则加权公平调度不起作用；只有单一令牌时保持不限
+        named_clients = any(client.name != DEFAULT_API_CLIENT for client in api_clients)
+        return cls(
+            api_host=read.str("api.host", "0.0.0.0"),
+            api_port=read.int("api.port", 8000, minimum=1, maximum=65535),
+            openai_api_key=read.str("openai.api_key", ""),
+            openai_base_url=read.str("openai.base_url", "https://api.openai.com/v1"),
+            openai_model=read.str("openai.model", "gpt-4-vision-preview"),
+            openai_max_tokens=read.int("openai.max_tokens", 1000, minimum=1),
+            openai_response_format=read.choice(
+                "openai.response_format", "json_object", ("json_object", "json_schema", "none")
+            ),
+            openai_repair_attempts=read.int("openai.repair_attempts", 1, minimum=0),
+            openai_stream=read.bool("openai.stream", True),
+            openai_stream_idle_timeout=read.float("openai.stream_idle_timeout", 30, minimum=1),
+            openai_stream_usage=read.bool("openai.stream_usage", True),
+            openai_backend=read.choice("openai.backend", "live", ("live", "record", "replay")),
+            openai_recordings_path=read.str("openai.recordings_path", "./recordings"),
+            openai_replay_speed=read.float("openai.replay_speed", 1.0, minimum=0),
+            storage_path=read.str("storage.path", "./storage"),
+            storage_cache_size=read.int("storage.cache_size", 1024, minimum=0),
+            storage_negative_ttl=read.float("storage.negative_ttl", 5, minimum=0),
+            async_enabled=read.bool("async.enabled", True),
+            max_workers=max_workers,
+            max_in_flight=read.int("async.max_in_flight", max_workers if named_clients else 0, minimum=0),
+            image_resize=read.bool("image_processing.resize", True),
+            image_max_width=read.int("image_processing.max_width", 1024, minimum=1),
+            image_max_height=read.int("image_processing.max_height", 1024, minimum=1),
+            image_quality=read.int("image_processing.quality", 85, minimum=1, maximum=100),
+            image_auto_rotate=read.bool("image_processing.auto_rotate", True),
+            image_denoise=read.bool("image_processing.denoise", False),
+            image_preview_sizes=read.int_map(
+                "image_processing.previews", {"thumb": 160, "preview": 640}, minimum=16
+            ),
+            barcode_enabled=read.bool("barcode.enabled", True),
+            batch_enabled=read.bool("batch.enabled", False),
+            batch_base_url=read.str("batch.base_url", ""),
+            batch_max_size=read.int("batch.max_size", 100, minimum=1),
+            batch_flush_interval=read.float("batch.flush_interval", 600, minimum=0),
+            batch_poll_interval=read.float("batch.poll_interval", 60, minimum=0.1),
+            batch_completion_window=read.str("batch.completion_window", "24h"),
+            timezone_enrich=read.bool("timezone.enrich", True),
+            retention_enabled=read.bool("retention.enabled", False),
+            retention_interval=read.float("retention.interval", 3600, minimum=1),
+            retention_completed_days=read.float("retention.completed_days", 30, minimum=0),
+            retention_failed_days=read.float("retention.failed_days", 7, minimum=0),
+            retention_downsample_max_side=read.int("retention.downsample_max_side", 0, minimum=0),
+            retention_max_total_mb=read.float("retention.max_total_mb", 0, minimum=0),
+            archive_enabled=read.bool("archive.enabled", False),
+            archive_interval=read.float("archive.interval", 86400, minimum=1),
+            archive_after_days=read.float("archive.after_days", 90, minimum=0),
+            archive_segment_mb=read.int("archive.segment_mb", 64, minimum=1),
+            health_max_queued=read.int("health.max_queued", 20, minimum=1),
+            health_min_free_mb=read.float("health.min_free_mb", 200, minimum=0),
+            health_upstream_window=read.float("health.upstream_window", 300, minimum=1),
+            health_upstream_min_samples=read.int("health.upstream_min_samples", 5, minimum=1),
+            health_upstream_max_error_rate=read.float("health.upstream_max_error_rate", 0.5, minimum=0, maximum=1),
+            health_upstream_max_p95=read.float("health.upstream_max_p95", 0, minimum=0),
+            profiler_interval=read.float("profiler.interval", 0.01, minimum=0.001),
+            profiler_max_seconds=read.float("profiler.max_seconds", 120, minimum=1),
+            profiler_signal_seconds=read.float("profiler.signal_seconds", 30, minimum=1),
+            profiler_output_path=read.str("profiler.output_path", "./profiles"),
+            reminder_hours=read.int_map("ics.reminder_hours"),
+            streamlit_username=read.str("auth.streamlit.username", "") or os.getenv("STREAMLIT_USERNAME"),
+            streamlit_password=read.str("auth.streamlit.password", "") or os.getenv("STREAMLIT_PASSWORD"),
+            api_token=api_token,
+            api_clients=api_clients,
+            admin_token=read.str("auth.admin.token", "") or os.getenv("ADMIN_AUTH_TOKEN", "") or api_token,
+            config_watch_interval=read.float("config.watch_interval", 2, minimum=0),
+            version=version,
+            loaded_at=datetime.now().isoformat()
+        )
     
-    @property
-    def image_auto_rotate(self) -> bool:
-        return self._config.get("image_processing", {}).get("auto_rotate", True)
+    def find_api_client(self, token: str | None) -> ApiClient | None:
+        """按令牌查找调用方"""
+        if not token:
+            return None
+        return next((client for client in self.api_clients if client.token == token), None)
     
-    @property
-    def image_denoise(self) -> bool:
-        return self._config.get("image_processing", {}).get("denoise", False)
+    def get_api_client(self, name: str) -> ApiClient | None:
+        """按名称查找调用方的权重和限额"""
+        return next((client for client in self.api_clients if client.name == name), None)
     
     def get_reminder_hours(self, ticket_type: str) -> int:
-        return self._config.get("ics", {}).get("reminder_hours", {}).get(ticket_type, 1)
+        return self.reminder_hours.get(ticket_type, 1)
     
     @property
     def streamlit_credentials(self) -> Dict[str, Any]:
-        auth_config = self._config.get("auth", {}).get("streamlit", {})
-        username = auth_config.get("username") or os.getenv("STREAMLIT_USERNAME")
-        password = auth_config.get("password") or os.getenv("STREAMLIT_PASSWORD")
         return {
-            "username": username,
-            "password": password
+            "username": self.streamlit_username,
+            "password": self.streamlit_password
         }
+
+
+class Settings:
+    """持有当前配置快照；配置文件变化时整体替换，任务可固定使用开始时的快照"""
     
-    @property
-    def api_token(self) -> str:
-        token = self._config.get("auth", {}).get("api", {}).get("token")
-        if token:
-            return token
-        return os.getenv("API_AUTH_TOKEN", "")
+    def __init__(self, config_path: Path = CONFIG_PATH):
+        self._config_path = Path(config_path)
+        self._pinned: ContextVar[ConfigSnapshot | None] = ContextVar("pinned_settings", default=None)
+        self._mtime = self._current_mtime()
+        self._snapshot = ConfigSnapshot.from_dict(self._load_config())
+    
+    def _load_config(self) -> Dict[str, Any]:
+        if self._config_path.exists():
+            with open(self._config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        else:
+            config = {}
+        
+        # 环境变量覆盖
+        if os.getenv("OPENAI_API_KEY"):
+            config.setdefault("openai", {})["api_key"] = os.getenv("OPENAI_API_KEY")
+        if os.getenv("OPENAI_BASE_URL"):
+            config.setdefault("openai", {})["base_url"] = os.getenv("OPENAI_BASE_URL")
+        return config
+    
+    def _current_mtime(self) -> int | None:
+        try:
+            return self._config_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def snapshot(self) -> ConfigSnapshot:
+        """当前上下文使用的配置快照"""
+        return self._pinned.get() or self._snapshot
+    
+    def reload(self) -> ConfigSnapshot:
+        """重新读取配置文件，校验通过后原子替换快照；失败时保留旧快照并抛出异常"""
+        mtime = self._current_mtime()
+        snapshot = ConfigSnapshot.from_dict(self._load_config(), version=self._snapshot.version + 1)
+        self._snapshot = snapshot
+        self._mtime = mtime
+        return snapshot
+    
+    def reload_if_changed(self) -> bool:
+        if self._current_mtime() == self._mtime:
+            return False
+        try:
+            self.reload()
+        except (ValueError, OSError) as e:
+            # 记录新的修改时间，避免对同一份错误配置反复重试
+            self._mtime = self._current_mtime()
+            logger.error("配置重新加载失败，继续使用旧配置: %s", e)
+            return False
+        logger.info("配置已重新加载 (version=%s)", self._snapshot.version)
+        return True
+    
+    @contextmanager
+    def pinned(self, snapshot: ConfigSnapshot | None = None):
+        """在当前上下文（任务）内固定使用进入时的配置快照（或指定的快照）"""
+        token = self._pinned.set(snapshot or self.snapshot())
+        try:
+            yield self._pinned.get()
+        finally:
+            self._pinned.reset(token)
+    
+    async def watch(self) -> None:
+        """后台轮询配置文件修改时间，变化时热加载"""
+        while True:
+            interval = self._snapshot.config_watch_interval
+            await asyncio.sleep(interval or 5)
+            if interval:
+                self.reload_if_changed()
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.snapshot(), name)
 
 settings = Settings()
@@ -7,6 +7,9 @@ from typing import Any, Dict, Tuple
 import requests
 import streamlit as st
 
+from app.services.archive import archive_service
+from app.services.storage import storage_service
+
 # 页面配置
 st.set_page_config(
     page_title="票据识别转ICS",
@@ -27,8 +30,11 @@ def load_config() -> Dict[str, Any]:
 def save_config(config_data: Dict[str, Any]) -> None:
     config_path = Path("config/config.json")
     config_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(config_path, "w", encoding="utf-8") as f:
+    # 先写临时文件再替换，避免后端热加载读到写了一半的配置
+    tmp_path = config_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(config_data, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(config_path)
     st.cache_data.clear()  # 清除缓存以重新加载
 
 
@@ -107,41 +113,100 @@ if not API_TOKEN:
     st.warning("⚠️ 未配置API认证令牌。若后端已启用认证，请在config.json或环境变量中设置 API_AUTH_TOKEN。")
 
 
+# 轮询结果时允许的最长无进展时间（秒）
+STALL_SECONDS = 30
+
+
+def task_filename(folder_name: str) -> str:
+    """从任务ID中取出原始文件名"""
+    parts = folder_name.split("_")
+    if len(parts) >= 4 and len(parts[0]) == 8:
+        # yyyymmdd_hhmmss_mmm_随机串_文件名
+        return "_".join(parts[4:]) or folder_name
+    # 旧版：yyyy_mm_dd_hh_mm_ss_文件名
+    return "_".join(parts[6:]) if len(parts) >= 7 else folder_name
+
+
+SPAN_LABELS = {
+    "queued": "排队",
+    "preprocess": "预处理",
+    "upstream": "模型",
+    "parse": "解析",
+    "ics": "ICS",
+    "persist": "写入"
+}
+
+
+def format_timings(timings: Dict[str, Any] | None) -> str:
+    """把任务耗时分段压缩成一行摘要，如：12.3s · 模型 11.5s · 排队 0.4s"""
+    if not timings:
+        return ""
+    spans = sorted(timings.get("spans", {}).items(), key=lambda item: item[1], reverse=True)
+    parts = [f"{timings.get('total', 0):.1f}s"]
+    parts += [f"{SPAN_LABELS.get(name, name)} {seconds:.1f}s" for name, seconds in spans[:3] if seconds >= 0.05]
+    tokens = timings.get("tokens")
+    if tokens:
+        parts.append(f"{tokens.get('prompt', 0) + tokens.get('completion', 0)} tokens")
+    return " · ".join(parts)
+
+
 # 获取任务列表
 @st.cache_data(ttl=5)  # 5秒缓存
 def get_task_list() -> list[Dict[str, Any]]:
-    storage_path = Path("storage")
+    storage_path = storage_service.base_path
     tasks = []
     if storage_path.exists():
-        for folder in storage_path.iterdir():
-            if not folder.is_dir():
-                continue
-            
+        # 归档索引含状态和时间，无需解压段文件；复制一份，下面逐个取出仍有目录的任务
+        archived = dict(archive_service.entries())
+        for folder in storage_service.iter_task_dirs():
             status_file = folder / "status.json"
             status_data: Dict[str, Any] = {}
+            is_archived = False
             if status_file.exists():
                 try:
                     with open(status_file, "r", encoding="utf-8") as f:
                         status_data = json.load(f)
                 except Exception:
                     status_data = {}
+            elif folder.name in archived:
+                # 状态已归档、原图仍保留
+                status_data = archived.pop(folder.name)
+                is_archived = True
             else:
                 if (folder / "calendar.ics").exists():
                     status_data = {"status": "completed"}
             
-            folder_parts = folder.name.split("_")
-            filename = "_".join(folder_parts[6:]) if len(folder_parts) >= 7 else folder.name
-            
             task_info = {
                 "folder": folder.name,
-                "filename": filename,
+                "path": folder.relative_to(storage_path).as_posix(),
+                "filename": task_filename(folder.name),
                 "status": status_data.get("status", "unknown"),
                 "timestamp": status_data.get("timestamp", ""),
+                "timings": status_data.get("timings"),
+                "archived": is_archived,
                 "has_image": (folder / "original.jpg").exists(),
-                "has_result": (folder / "result.json").exists(),
-                "has_ics": (folder / "calendar.ics").exists()
+                # 原图被保留策略删除后预览图仍保留
+                "has_preview": (folder / "original.jpg").exists() or (folder / "preview_preview.jpg").exists(),
+                "has_result": is_archived or (folder / "result.json").exists(),
+                "has_ics": (folder / "calendar.ics").exists() or (is_archived and status_data.get("status") == "completed")
             }
             tasks.append(task_info)
+        
+        # 已整体归档的任务通过任务ID访问（/storage/{id}/result.json 由后端从段文件读取）
+        for folder_name, entry in archived.items():
+            tasks.append({
+                "folder": folder_name,
+                "path": folder_name,
+                "filename": task_filename(folder_name),
+                "status": entry.get("status") or "unknown",
+                "timestamp": entry.get("timestamp") or "",
+                "timings": None,
+                "archived": True,
+                "has_image": False,
+                "has_preview": False,
+                "has_result": True,
+                "has_ics": entry.get("status") == "completed"
+            })
     
     tasks.sort(key=lambda x: x["timestamp"], reverse=True)
     return tasks
@@ -150,7 +215,7 @@ def get_task_list() -> list[Dict[str, Any]]:
 tasks = get_task_list()
 
 # 当前处理中的任务
-processing_tasks = [t for t in tasks if t["status"] == "processing"]
+processing_tasks = [t for t in tasks if t["status"] in ("processing", "queued")]
 if processing_tasks:
     st.markdown("### 🔄 处理中的任务")
     for task in processing_tasks:
@@ -158,7 +223,7 @@ if processing_tasks:
             col1, col2, col3 = st.columns(3)
             with col1:
                 if task["has_image"]:
-                    image_url = add_auth_token(f"{API_BASE}/storage/{task['folder']}/original.jpg", API_TOKEN)
+                    image_url = add_auth_token(f"{API_BASE}/preview/{task['folder']}/preview", API_TOKEN)
                     st.markdown(f"[🖼️ 查看图片]({image_url})")
             with col2:
                 st.text(f"状态: {task['status']}")
@@ -192,10 +257,17 @@ if uploaded_file:
                 
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                partial_view = st.empty()
                 
-                for i in range(30):
+                # 状态记录持续更新（部分字段、心跳、状态或耗时变化）时继续等待，超过STALL_SECONDS无新进展才判定超时
+                last_partial = None
+                last_state = None
+                last_progress = time.time()
+                polls = 0
+                while time.time() - last_progress < STALL_SECONDS:
                     time.sleep(1)
-                    progress_bar.progress((i + 1) / 30)
+                    polls += 1
+                    progress_bar.progress(min(polls / STALL_SECONDS, 1.0))
                     
                     status_response = requests.get(
                         f"{API_BASE}/result/{folder_name}",
@@ -211,7 +283,22 @@ if uploaded_file:
                     status_data = status_response.json()
                     status_text.text(f"状态: {status_data['status']}")
                     
+                    state = (status_data["status"], status_data.get("updated_at"), status_data.get("timings"))
+                    if state != last_state:
+                        last_state = state
+                        last_progress = time.time()
+                    
+                    partial = status_data.get("partial")
+                    if partial and partial != last_partial:
+                        last_partial = partial
+                        last_progress = time.time()
+                        with partial_view.container():
+                            st.caption("已识别的部分字段")
+                            st.json(partial)
+                    
                     if status_data["status"] == "completed":
+                        partial_view.empty()
+                        progress_bar.progress(1.0)
                         st.success("识别完成！")
                         if status_data.get("data"):
                             st.subheader("识别结果")
@@ -255,27 +342,34 @@ if tasks:
             col1, col2, col3, col4, col5, col6, col7 = st.columns([2, 1, 2, 1, 1, 1, 1])
             
             with col1:
+                if task["has_preview"]:
+                    st.image(add_auth_token(f"{API_BASE}/preview/{task['folder']}/thumb", API_TOKEN), width=80)
                 st.text(task["filename"])
             
             with col2:
                 status_emoji = {
                     "completed": "✅",
                     "processing": "🔄",
+                    "queued": "⏳",
                     "failed": "❌"
                 }.get(task["status"], "❓")
                 st.text(f"{status_emoji} {task['status']}")
             
             with col3:
                 st.text(task["timestamp"][:19] if task["timestamp"] else "")
+                if task["timings"]:
+                    st.caption(format_timings(task["timings"]))
             
             with col4:
-                if task["has_image"]:
-                    image_url = add_auth_token(f"{API_BASE}/storage/{task['folder']}/original.jpg", API_TOKEN)
+                if task["has_preview"]:
+                    image_url = add_auth_token(f"{API_BASE}/preview/{task['folder']}/preview", API_TOKEN)
                     st.link_button("🖼️", image_url)
             
             with col5:
                 if task["has_result"]:
-                    json_url = add_auth_token(f"{API_BASE}/storage/{task['folder']}/result.json", API_TOKEN)
+                    # 已归档的结果按任务ID访问，由后端从段文件读取
+                    result_path = task["folder"] if task["archived"] else task["path"]
+                    json_url = add_auth_token(f"{API_BASE}/storage/{result_path}/result.json", API_TOKEN)
                     st.link_button("📄", json_url)
             
             with col6:
@@ -284,14 +378,21 @@ if tasks:
                     st.link_button("📅", ics_url)
             
             with col7:
-                if st.button("🗑️", key=f"delete_{task['folder']}", help="删除任务"):
-                    import shutil
-                    folder_path = Path("storage") / task["folder"]
-                    if folder_path.exists():
-                        shutil.rmtree(folder_path)
-                        st.success(f"已删除任务: {task['filename']}")
-                        st.cache_data.clear()
-                        st.experimental_rerun()
+                if task["archived"]:
+                    st.caption("已归档")
+                elif st.button("🗑️", key=f"delete_{task['folder']}", help="删除任务"):
+                    # 通过API删除，后端同时清除缓存的任务状态
+                    try:
+                        response = requests.delete(f"{API_BASE}/result/{task['folder']}", headers=API_HEADERS, timeout=10)
+                    except requests.RequestException as e:
+                        st.error(f"删除失败: {e}")
+                    else:
+                        if response.status_code in (204, 404):
+                            st.success(f"已删除任务: {task['filename']}")
+                            st.cache_data.clear()
+                            st.experimental_rerun()
+                        else:
+                            st.error(f"删除失败: {response.text}")
             
             if i < len(tasks) - 1:
                 st.divider()
@@ -457,6 +558,7 @@ with st.sidebar:
             new_config = config.copy()
             
             new_config["openai"] = {
+                **openai_config,
                 "api_key": api_key,
                 "base_url": base_url,
                 "model": model,
@@ -485,6 +587,7 @@ with st.sidebar:
             }
             
             new_config["auth"] = {
+                **config.get("auth", {}),
                 "streamlit": {
                     "username": streamlit_username,
                     "password": streamlit_password
@@ -497,7 +600,7 @@ with st.sidebar:
             try:
                 save_config(new_config)
                 st.success("✅ 配置已保存！")
-                st.info("⚠️ 修改端口或认证信息后请重启服务以生效。")
+                st.info("ℹ️ 后端会在几秒内自动加载新配置；修改端口或存储路径后仍需重启服务。")
             except Exception as e:
                 st.error(f"❌ 保存失败: {str(e)}")
 
@@ -1,11 +1,41 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Depends, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from .api import upload, result, download
+from fastapi.responses import JSONResponse, PlainTextResponse
+from .api import upload, result, download, export, admin
 from .config import settings
-from .api.dependencies import verify_api_token
+from .api.dependencies import verify_api_token, verify_admin_token
+from .services import metrics
+from .services.archive import archive_service
+from .services.batch import batch_processor
+from .services.health import health_service
+from .services.profiler import install_signal_handler
+from .services.retention import retention_service
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台监视配置文件（修改后自动热加载），按保留策略定期清理存储并归档旧任务，测量事件循环延迟
+    install_signal_handler()
+    background = [
+        asyncio.create_task(settings.watch()),
+        asyncio.create_task(metrics.monitor_loop_lag()),
+        asyncio.create_task(retention_service.run()),
+        asyncio.create_task(archive_service.run())
+    ]
+    if settings.batch_enabled:
+        # 继续轮询重启前已提交的批处理，未提交的任务重新排队
+        background.append(asyncio.create_task(batch_processor.resume()))
+    yield
+    for task in background:
+        task.cancel()
+    for task in background:
+        with suppress(asyncio.CancelledError):
+            await task
 
 app = FastAPI(
+    lifespan=lifespan,
     title="🎫 票据识别转ICS服务",
     description="""
     🤖 智能票据识别服务，支持多种票据类型自动识别并生成ICS日历文件。
@@ -21,7 +51,8 @@ app = FastAPI(
     2. POST /upload - 上传票据图片开启异步识别
     3. GET /result/{folder_name} - 查询异步识别结果
     4. GET /ics/{folder_name} - 下载ICS日历文件
-    5. GET /storage/{folder_name}/{file} - 访问静态文件
+    5. GET /preview/{folder_name}/{size} - 获取缩略图/预览图
+    6. GET /storage/{folder_name}/{file} - 访问静态文件
     
     ## Web界面
     访问 http://localhost:8501 使用可视化界面。
@@ -36,19 +67,21 @@ app = FastAPI(
     },
 )
 
-# 挂载静态文件
-app.mount("/storage", StaticFiles(directory="storage"), name="storage")
-
 # 注册路由
 app.include_router(upload.router, tags=["上传"])
 app.include_router(result.router, tags=["结果"])
 app.include_router(download.router, tags=["下载"])
+app.include_router(export.router, tags=["导出"])
+app.include_router(admin.router, tags=["管理"])
+
+# 挂载静态文件（在路由之后，/storage/{folder_name}/{file} 优先按任务ID解析）
+app.mount("/storage", StaticFiles(directory="storage"), name="storage")
 
 @app.middleware("http")
 async def auth_middleware(request: Request, call_next):
     """保护静态文件等需要认证的路径。"""
     protected_prefixes = ("/storage",)
-    if settings.api_token and request.url.path.startswith(protected_prefixes):
+    if settings.api_clients and request.url.path.startswith(protected_prefixes):
         try:
             await verify_api_token(
                 authorization=request.headers.get("Authorization"),
@@ -64,6 +97,31 @@ async def auth_middleware(request: Request, call_next):
             raise
     return await call_next(request)
 
+_route_templates = {}
+
+def _route_label(request: Request) -> str:
+    """按路由模板而不是实际路径统计，避免任务ID使标签无限增长"""
+    if not _route_templates:
+        for route in app.routes:
+            endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+            if endpoint is not None:
+                _route_templates.setdefault(endpoint, route.path if hasattr(route, "endpoint") else f"{route.path}/{{path}}")
+    return _route_templates.get(request.scope.get("endpoint"), "unmatched")
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """统计各路由的请求数和耗时（最外层，包含认证失败的请求）"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = _route_label(request)
+        metrics.http_requests.inc(method=request.method, route=route, status=status)
+        metrics.http_duration.observe(time.perf_counter() - started, method=request.method, route=route)
+
 @app.get("/", summary="服务信息", description="获取服务基本信息")
 async def root():
     return {
@@ -81,13 +139,20 @@ async def root():
             "upload": "/upload",
             "result": "/result/{folder_name}",
             "download": "/ics/{folder_name}",
+            "preview": "/preview/{folder_name}/{size}",
+            "export": "/export",
             "static": "/storage/{folder_name}/{file}",
             "docs": "/docs",
-            "health": "/health"
+            "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "metrics": "/metrics",
+            "config_reload": "/admin/config/reload",
+            "client_usage": "/admin/clients"
         },
         "auth": {
             "streamlit": bool(settings.streamlit_credentials.get("username")),
-            "api_token_required": bool(settings.api_token)
+            "api_token_required": bool(settings.api_clients)
         },
         "web_ui": "http://localhost:8501"
     }
@@ -102,6 +167,20 @@ async def health():
         "version": "1.0.0"
     }
 
+@app.get("/health/live", summary="存活检查", description="进程和事件循环可响应即返回200，用于重启判断")
+async def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready", summary="就绪检查", description="队列饱和、存储不可写或空间不足、上游近期错误率或延迟过高时返回503，用于摘除流量")
+async def health_ready():
+    report = await health_service.readiness()
+    report["status"] = "ready" if report["ready"] else "not_ready"
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.get("/metrics", summary="监控指标", description="Prometheus文本格式的请求、流水线阶段、队列和上游用量指标", dependencies=[Depends(verify_admin_token)])
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.api_host, port=settings.api_port)
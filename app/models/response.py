@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any
 from .ticket import TicketData
 
 class UploadResponse(BaseModel):
@@ -10,8 +10,11 @@ class ResultResponse(BaseModel):
     id: str
     status: str
     data: Optional[TicketData] = None
+    partial: Optional[Dict[str, Any]] = None
     ics_url: Optional[str] = None
     error: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None
+    updated_at: Optional[str] = None
 
 class ProcessResponse(BaseModel):
     id: str
@@ -1,10 +1,27 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, Literal
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 class TimeInfo(BaseModel):
     datetime: str
     timezone: str
+    
+    @field_validator("datetime")
+    @classmethod
+    def check_datetime(cls, value: str) -> str:
+        # 与ICS生成保持一致，必须能被fromisoformat解析
+        datetime.fromisoformat(value)
+        return value
+    
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"无效的IANA时区: {value}")
+        return value
 
 class LocationInfo(BaseModel):
     name: str
@@ -14,6 +31,8 @@ class DetailsInfo(BaseModel):
     seat: Optional[str] = None
     gate: Optional[str] = None
     reference: Optional[str] = None
+    departure_airport: Optional[str] = None
+    arrival_airport: Optional[str] = None
 
 class TicketData(BaseModel):
     id: str
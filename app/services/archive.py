@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Any, Tuple
+
+from .storage import storage_service, TERMINAL_STATUSES
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = ".archive"
+INDEX_FILE = "index.jsonl"
+SEGMENT_PATTERN = "segment-{:06d}.bin"
+# 每条记录前的长度头，便于索引丢失时顺序扫描重建
+RECORD_HEADER = struct.Struct(">I")
+ARCHIVED_FILES = ("status.json", "result.json", "calendar.ics")
+
+# (段序号, 偏移, 长度)
+Location = Tuple[int, int, int]
+
+
+class ArchiveService:
+    """把旧任务的小文件打包进只追加的压缩段文件，通过偏移索引随机读取"""
+    
+    def __init__(self):
+        self.root = storage_service.base_path / ARCHIVE_DIR
+        self._index: Dict[str, Location] | None = None
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # 已加载的索引文件大小，其他进程追加索引后据此重新加载
+        self._index_size = 0
+        self._lock = threading.Lock()
+        # 后台归档与管理接口触发的归档不能同时进行：两者会向同一段文件追加并删除同一批文件
+        self._compact_lock = threading.Lock()
+    
+    def _segment_path(self, segment: int) -> Path:
+        return self.root / SEGMENT_PATTERN.format(segment)
+    
+    def _load_index(self) -> Dict[str, Location]:
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            index_path = self.root / INDEX_FILE
+            if not index_path.exists() and any(self.root.glob("segment-*.bin")):
+                self._rebuild_index()
+            self._index = {}
+            self._entries = {}
+            if index_path.exists():
+                with open(index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # 写入中断留下的不完整行
+                            continue
+                        # 同一任务重复归档时以最后一条为准
+                        self._index[entry["id"]] = (entry["segment"], entry["offset"], entry["length"])
+                        self._entries[entry["id"]] = entry
+                    self._index_size = f.tell()
+            return self._index
+    
+    def _rebuild_index(self) -> None:
+        """顺序扫描段文件重建索引"""
+        lines = []
+        for segment_path in sorted(self.root.glob("segment-*.bin")):
+            segment = int(segment_path.stem.split("-")[1])
+            with open(segment_path, "rb") as f:
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    (length,) = RECORD_HEADER.unpack(header)
+                    offset = f.tell()
+                    blob = f.read(length)
+                    if len(blob) < length:
+                        break
+                    record = json.loads(zlib.decompress(blob))
+                    lines.append(self._index_line(record, segment, offset, length))
+        with open(self.root / INDEX_FILE, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+    
+    def _index_line(self, record: Dict[str, Any], segment: int, offset: int, length: int) -> str:
+        status = record.get("status") or {}
+        entry = {
+            "id": record["id"],
+            "segment": segment,
+            "offset": offset,
+            "length": length,
+            "status": status.get("status"),
+            "timestamp": status.get("timestamp")
+        }
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+    
+    def contains(self, folder_name: str) -> bool:
+        return folder_name in self._load_index()
+    
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """已归档任务的索引信息（状态、时间），无需解压；索引文件被其他进程追加后重新加载"""
+        try:
+            size = (self.root / INDEX_FILE).stat().st_size
+        except FileNotFoundError:
+            size = 0
+        with self._lock:
+            if size != self._index_size:
+                self._index = None
+        self._load_index()
+        return self._entries
+    
+    def read(self, folder_name: str) -> Dict[str, Any] | None:
+        """读取归档记录：{"id", "status", "result", "ics"}"""
+        location = self._load_index().get(folder_name)
+        if location is None:
+            return None
+        segment, offset, length = location
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(zlib.decompress(f.read(length)))
+    
+    def read_file(self, folder_name: str, file_name: str) -> bytes | None:
+        """按原文件名取出归档内容"""
+        if file_name not in ARCHIVED_FILES:
+            return None
+        record = self.read(folder_name)
+        if record is None:
+            return None
+        if file_name == "calendar.ics":
+            return record["ics"].encode("utf-8") if record.get("ics") is not None else None
+        value = record.get("status" if file_name == "status.json" else "result")
+        return None if value is None else storage_service.dumps(value)
+    
+    def _read_task_files(self, task_dir: Path) -> Dict[str, Any]:
+        def read(name: str) -> bytes | None:
+            try:
+                return (task_dir / name).read_bytes()
+            except FileNotFoundError:
+                return None
+        
+        status, result, ics = (read(name) for name in ARCHIVED_FILES)
+        return {
+            "id": task_dir.name,
+            "status": json.loads(status) if status else None,
+            "result": json.loads(result) if result else None,
+            "ics": ics.decode("utf-8") if ics else None
+        }
+    
+    def _current_segment(self) -> int:
+        segments = sorted(self.root.glob("segment-*.bin"))
+        if not segments:
+            return 1
+        segment = int(segments[-1].stem.split("-")[1])
+        if segments[-1].stat().st_size >= settings.archive_segment_mb * 1024 * 1024:
+            segment += 1
+        return segment
+    
+    def compact(self, dry_run: bool = False) -> Dict[str, Any] | None:
+        """把结束超过 archive.after_days 天的任务打包进段文件，原图（如有）保留在原目录；已有归档在进行时返回None"""
+        if not self._compact_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._compact(dry_run)
+        finally:
+            self._compact_lock.release()
+    
+    def _compact(self, dry_run: bool) -> Dict[str, Any]:
+        config = settings.snapshot()
+        started = time.time()
+        cutoff = started - config.archive_after_days * 86400
+        self._load_index()
+        report = {"dry_run": dry_run, "archived": 0, "files": 0, "bytes_in": 0, "bytes_out": 0, "errors": 0}
+        
+        self.root.mkdir(parents=True, exist_ok=True)
+        segment = self._current_segment()
+        segment_file = None
+        index_file = None
+        try:
+            for task_dir in storage_service.iter_task_dirs():
+                try:
+                    if (task_dir / "status.json").stat().st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                record = self._read_task_files(task_dir)
+                if (record["status"] or {}).get("status") not in TERMINAL_STATUSES:
+                    continue
+                
+                blob = zlib.compress(storage_service.dumps(record), 6)
+                files = [task_dir / name for name in ARCHIVED_FILES if (task_dir / name).exists()]
+                report["archived"] += 1
+                report["files"] += len(files)
+                report["bytes_in"] += sum(path.stat().st_size for path in files)
+                report["bytes_out"] += RECORD_HEADER.size + len(blob)
+                if dry_run:
+                    continue
+                
+                if segment_file is None:
+                    segment_file = open(self._segment_path(segment), "ab")
+                    index_file = open(self.root / INDEX_FILE, "a", encoding="utf-8")
+                if segment_file.tell() >= config.archive_segment_mb * 1024 * 1024:
+                    segment_file.close()
+                    segment += 1
+                    segment_file = open(self._segment_path(segment), "ab")
+                
+                # 长度头和数据一次写入，记录在段文件中总是连续的
+                offset = segment_file.tell() + RECORD_HEADER.size
+                segment_file.write(RECORD_HEADER.pack(len(blob)) + blob)
+                # 段数据落盘后才写索引、删除原文件，中途中断最多留下重复记录
+                segment_file.flush()
+                os.fsync(segment_file.fileno())
+                line = self._index_line(record, segment, offset, len(blob))
+                index_file.write(line)
+                index_file.flush()
+                # 索引也需落盘后才能删除原文件，否则断电后只剩段数据、索引缺少该任务
+                os.fsync(index_file.fileno())
+                with self._lock:
+                    if self._index is not None:
+                        self._index[record["id"]] = (segment, offset, len(blob))
+                    self._entries[record["id"]] = json.loads(line)
+                    self._index_size = os.fstat(index_file.fileno()).st_size
+                
+                try:
+                    for path in files:
+                        path.unlink()
+                    if not any(task_dir.iterdir()):
+                        shutil.rmtree(task_dir)
+                except OSError as e:
+                    logger.warning("删除已归档文件 %s 失败: %s", task_dir, e)
+                    report["errors"] += 1
+        finally:
+            if segment_file is not None:
+                segment_file.close()
+                index_file.close()
+        
+        report["seconds"] = round(time.time() - started, 3)
+        return report
+    
+    async def run(self) -> None:
+        """后台定期归档"""
+        while True:
+            await asyncio.sleep(settings.archive_interval)
+            if not settings.archive_enabled:
+                continue
+            try:
+                report = await asyncio.to_thread(self.compact)
+                if report is None:
+                    logger.info("已有归档正在进行，跳过本轮")
+                    continue
+                logger.info("任务归档完成: %s", report)
+            except Exception as e:
+                logger.error("任务归档失败: %s", e)
+
+archive_service = ArchiveService()
@@ -1,81 +1,173 @@
 import asyncio
+import time
 import uuid
 from typing import Dict, Any
 
+from pydantic import ValidationError
+
 from .vision import vision_service
 from .ics import ics_service
 from .storage import storage_service
 from .image_processor import image_processor
+from .barcode import barcode_service
+from .timezone import timezone_service
+from .scheduler import ANONYMOUS_CLIENT, FairScheduler
+from . import metrics, tracing
+from ..config import settings
 
 class AsyncProcessor:
     def __init__(self):
-        pass
+        self.scheduler = FairScheduler()
+        metrics.tasks_queued.set_function(lambda: self.queued)
+        metrics.tasks_in_flight.set_function(lambda: self.in_flight)
+    
+    @property
+    def queued(self) -> int:
+        return self.scheduler.queued
+    
+    @property
+    def in_flight(self) -> int:
+        return self.scheduler.in_flight
     
-    async def _run_pipeline(self, folder_name: str, image_content: bytes, persist_status: bool) -> Dict[str, Any]:
-        """执行票据识别流水线，可选持久化状态"""
+    async def _run_pipeline(
+        self,
+        folder_name: str,
+        image_content: bytes,
+        persist_status: bool,
+        client: str = ANONYMOUS_CLIENT
+    ) -> Dict[str, Any]:
+        """执行票据识别流水线，可选持久化状态；整个任务固定使用开始时的配置快照"""
+        with tracing.task_trace() as trace:
+            async with self.scheduler.slot(client):
+                waited = time.perf_counter() - trace.started
+                trace.add_span("queued", waited)
+                metrics.client_queue_wait.observe(waited, client=client)
+                with settings.pinned():
+                    result = await self._run_pinned_pipeline(folder_name, image_content, persist_status)
+        metrics.tasks_total.inc(status=result["status"])
+        metrics.client_tasks.inc(client=client, status=result["status"])
+        for kind, count in trace.tokens.items():
+            metrics.client_tokens.inc(count, client=client, type=kind)
+        return result
+    
+    async def _run_pinned_pipeline(self, folder_name: str, image_content: bytes, persist_status: bool) -> Dict[str, Any]:
         if persist_status:
             await storage_service.save_task_status(folder_name, "processing")
         
         try:
-            processed_image = image_processor.process_image(image_content)
-            result = await vision_service.extract_ticket_info(processed_image)
-            
-            if "error" in result:
-                error_msg = result["error"]
+            # 图片解码、缩放和编码耗时数百毫秒，放到线程中执行，不阻塞其他请求
+            processed_image, previews = await asyncio.to_thread(image_processor.process_with_previews, image_content)
+            await storage_service.save_previews(folder_name, previews)
+            result = None
+            if settings.barcode_enabled:
+                result = await self._extract_from_barcode(image_content, processed_image)
+            if result is None:
+                on_partial = None
                 if persist_status:
-                    await storage_service.save_task_status(folder_name, "failed", {"error": error_msg})
-                return {
-                    "id": folder_name,
-                    "status": "failed",
-                    "error": error_msg
-                }
-            
-            result["id"] = folder_name
-            
-            if persist_status:
-                await storage_service.save_result(folder_name, result)
-            
-            ics_content = ics_service.generate_ics(result)
-            await storage_service.save_ics(folder_name, ics_content)
+                    async def on_partial(partial: Dict[str, Any]) -> None:
+                        await storage_service.save_task_status(folder_name, "processing", {"partial": partial})
+                result = await vision_service.extract_ticket_info(processed_image, on_partial)
             
+            return await self.finish_task(folder_name, result, persist_status)
+        
+        except Exception as e:
+            metrics.errors.inc(cause=metrics.classify_error(e))
+            error_msg = str(e)
             if persist_status:
-                await storage_service.save_task_status(folder_name, "completed", result)
-            
+                await storage_service.save_task_status(folder_name, "failed", {"error": error_msg}, self._timings())
             return {
                 "id": folder_name,
-                "status": "completed",
-                "data": result,
-                "ics_url": f"/ics/{folder_name}"
+                "status": "failed",
+                "error": error_msg
             }
-        
-        except Exception as e:
-            error_msg = str(e)
+    
+    def _timings(self) -> Dict[str, Any] | None:
+        """当前任务的耗时摘要（不含最终状态写入本身；批处理回填的任务没有记录）"""
+        trace = tracing.current_trace()
+        return trace.to_dict() if trace else None
+    
+    async def finish_task(self, folder_name: str, result: Dict[str, Any], persist_status: bool = True) -> Dict[str, Any]:
+        """根据识别结果生成ICS并写入任务状态"""
+        if "error" in result:
+            error_msg = result["error"]
             if persist_status:
-                await storage_service.save_task_status(folder_name, "failed", {"error": error_msg})
+                await storage_service.save_task_status(folder_name, "failed", {"error": error_msg}, self._timings())
             return {
                 "id": folder_name,
                 "status": "failed",
                 "error": error_msg
             }
+        
+        result["id"] = folder_name
+        
+        if settings.timezone_enrich:
+            result = timezone_service.enrich(result)
+        
+        with metrics.time_stage("ics"):
+            ics_content = ics_service.generate_ics(result)
+        if persist_status:
+            await storage_service.commit_task(folder_name, result, ics_content, self._timings())
+        else:
+            await storage_service.save_ics(folder_name, ics_content)
+        
+        return {
+            "id": folder_name,
+            "status": "completed",
+            "data": result,
+            "ics_url": f"/ics/{folder_name}"
+        }
+    
+    async def _extract_from_barcode(self, image_content: bytes, processed_image: bytes) -> Dict[str, Any] | None:
+        """登机牌条码快速通道：本地解码条码，仅让模型补充起降时间。
+        条码信息不足以构建票据时不发起补充请求，补充请求的上游错误直接使任务失败，
+        只有模型回复不可用时才回退到完整识别"""
+        boarding_pass = await asyncio.to_thread(barcode_service.scan, image_content)
+        if not boarding_pass or not barcode_service.can_build(boarding_pass):
+            return None
+        
+        times = await vision_service.extract_flight_times(processed_image, boarding_pass)
+        if "error" in times:
+            return None
+        
+        ticket = barcode_service.build_ticket(boarding_pass, times)
+        if ticket is None:
+            return None
+        # 与模型识别结果一样按TicketData校验
+        try:
+            return vision_service.validate_ticket(ticket)
+        except ValidationError:
+            return None
     
-    async def process_ticket(self, folder_name: str, image_content: bytes) -> None:
-        """异步处理票据识别"""
-        await self._run_pipeline(folder_name, image_content, persist_status=True)
+    async def process_ticket(
+        self,
+        folder_name: str,
+        image_content: bytes,
+        client: str = ANONYMOUS_CLIENT
+    ) -> Dict[str, Any]:
+        """异步处理票据识别，状态写入存储"""
+        return await self._run_pipeline(folder_name, image_content, persist_status=True, client=client)
     
-    async def process_ticket_sync(self, filename: str, image_content: bytes) -> Dict[str, Any]:
+    async def process_ticket_sync(
+        self,
+        filename: str,
+        image_content: bytes,
+        client: str = ANONYMOUS_CLIENT
+    ) -> Dict[str, Any]:
         """同步处理票据识别并返回最终结果"""
         folder_name = await storage_service.save_image(str(uuid.uuid4()), filename, image_content)
-        return await self._run_pipeline(folder_name, image_content, persist_status=False)
+        return await self._run_pipeline(folder_name, image_content, persist_status=False, client=client)
     
-    async def submit_task(self, filename: str, image_content: bytes) -> str:
+    async def submit_task(self, filename: str, image_content: bytes, client: str = ANONYMOUS_CLIENT) -> str:
         """提交处理任务"""
         task_id = str(uuid.uuid4())
         
         # 保存图片并创建文件夹
         folder_name = await storage_service.save_image(task_id, filename, image_content)
+        # 等待处理名额期间 /result 返回queued，而不是任务不存在
+        await storage_service.save_task_status(folder_name, "queued")
         
         # 创建异步任务
-        asyncio.create_task(self.process_ticket(folder_name, image_content))
+        asyncio.create_task(self.process_ticket(folder_name, image_content, client))
         
         return folder_name
     
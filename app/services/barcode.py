@@ -0,0 +1,206 @@
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from typing import Dict, Any, List, Optional
+from zoneinfo import ZoneInfo
+
+from .timezone import timezone_service
+
+# IATA BCBP（Resolution 792）固定长度字段定义
+BCBP_HEADER_FIELDS = [
+    ("format_code", 1),
+    ("legs", 1),
+    ("passenger_name", 20),
+    ("eticket_indicator", 1),
+]
+
+BCBP_LEG_FIELDS = [
+    ("pnr", 7),
+    ("from_airport", 3),
+    ("to_airport", 3),
+    ("carrier", 3),
+    ("flight_number", 5),
+    ("julian_date", 3),
+    ("compartment", 1),
+    ("seat", 4),
+    ("sequence", 5),
+    ("passenger_status", 1),
+    ("variable_size", 2),
+]
+
+
+class BarcodeService:
+    def __init__(self):
+        self._reader = None
+        self._available = None
+
+    def _get_reader(self):
+        """按需加载zxing-cpp，未安装时禁用条码识别"""
+        if self._available is None:
+            try:
+                import zxingcpp
+                self._reader = zxingcpp
+                self._available = True
+            except ImportError:
+                self._available = False
+        return self._reader if self._available else None
+
+    def decode(self, image_content: bytes) -> List[str]:
+        """识别图片中的二维码/PDF417/Aztec条码，返回文本内容"""
+        reader = self._get_reader()
+        if reader is None:
+            return []
+
+        try:
+            from PIL import Image
+            image = Image.open(BytesIO(image_content))
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("RGB")
+            formats = (
+                reader.BarcodeFormat.PDF417,
+                reader.BarcodeFormat.Aztec,
+                reader.BarcodeFormat.QRCode,
+                reader.BarcodeFormat.DataMatrix,
+            )
+            return [barcode.text for barcode in reader.read_barcodes(image, formats=formats) if barcode.text]
+        except Exception:
+            return []
+
+    def parse_bcbp(self, text: str) -> Optional[Dict[str, Any]]:
+        """解析IATA BCBP登机牌条码，非BCBP内容返回None"""
+        if not text or len(text) < 60 or text[0] != "M" or not text[1].isdigit():
+            return None
+
+        pos = 0
+        header = {}
+        for name, size in BCBP_HEADER_FIELDS:
+            header[name] = text[pos:pos + size]
+            pos += size
+
+        legs = []
+        for _ in range(int(header["legs"])):
+            if len(text) < pos + 37:
+                break
+            leg = {}
+            for name, size in BCBP_LEG_FIELDS:
+                leg[name] = text[pos:pos + size]
+                pos += size
+            try:
+                # 条件字段长度为十六进制，跳过后即为下一航段
+                pos += int(leg.pop("variable_size"), 16)
+            except ValueError:
+                return None
+            legs.append(self._normalize_leg(leg))
+
+        if not legs or not all(leg["from_airport"].isalpha() and leg["to_airport"].isalpha() for leg in legs):
+            return None
+
+        return {
+            "passenger_name": header["passenger_name"].strip(),
+            "legs": legs
+        }
+
+    def _normalize_leg(self, leg: Dict[str, str]) -> Dict[str, Any]:
+        """清理航段字段中的填充空格和前导零"""
+        # 航班号为4位数字加可选的1位后缀
+        flight_number = leg["flight_number"].strip()
+        digits, suffix = flight_number[:4].lstrip("0"), flight_number[4:]
+        seat = leg["seat"].strip().lstrip("0")
+        julian = leg["julian_date"].strip()
+        return {
+            "pnr": leg["pnr"].strip(),
+            "from_airport": leg["from_airport"].upper(),
+            "to_airport": leg["to_airport"].upper(),
+            "carrier": leg["carrier"].strip(),
+            "flight": f"{leg['carrier'].strip()}{digits or '0'}{suffix}",
+            "flight_date": self._resolve_julian_date(int(julian)) if julian.isdigit() else None,
+            "compartment": leg["compartment"].strip(),
+            "seat": seat or None,
+        }
+
+    def _resolve_julian_date(self, day_of_year: int, today: date = None) -> Optional[date]:
+        """BCBP只包含年内天数，取距离今天最近的年份"""
+        if not 1 <= day_of_year <= 366:
+            return None
+        today = today or date.today()
+        candidates = []
+        for year in (today.year - 1, today.year, today.year + 1):
+            candidate = date(year, 1, 1) + timedelta(days=day_of_year - 1)
+            if candidate.year == year:
+                candidates.append(candidate)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda d: abs((d - today).days))
+
+    def scan(self, image_content: bytes) -> Optional[Dict[str, Any]]:
+        """识别登机牌条码，返回首个航段信息"""
+        for text in self.decode(image_content):
+            bcbp = self.parse_bcbp(text)
+            if bcbp:
+                leg = dict(bcbp["legs"][0])
+                leg["passenger_name"] = bcbp["passenger_name"]
+                leg["from_timezone"] = timezone_service.get_timezone_by_airport(leg["from_airport"])
+                leg["to_timezone"] = timezone_service.get_timezone_by_airport(leg["to_airport"])
+                leg["from_name"] = self._airport_name(leg["from_airport"])
+                return leg
+        return None
+
+    def _airport_name(self, iata_code: str) -> str:
+        airport = timezone_service.get_airport(iata_code)
+        return airport["name"] if airport else iata_code
+
+    def can_build(self, boarding_pass: Dict[str, Any]) -> bool:
+        """出发机场时区已知时，补充起降时间后即可构建票据"""
+        return bool(boarding_pass.get("from_timezone"))
+
+    def build_ticket(self, boarding_pass: Dict[str, Any], times: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """结合条码字段和补充的起降时间构建TicketData字典"""
+        flight_date = boarding_pass.get("flight_date")
+        if not flight_date and times.get("departure_date"):
+            try:
+                flight_date = date.fromisoformat(times["departure_date"])
+            except ValueError:
+                flight_date = None
+        departure_time = self._parse_time(times.get("departure_time"))
+        from_tz = boarding_pass.get("from_timezone")
+        if not flight_date or departure_time is None or not from_tz:
+            return None
+
+        start_dt = datetime.combine(flight_date, departure_time)
+        end = None
+        arrival_time = self._parse_time(times.get("arrival_time"))
+        to_tz = boarding_pass.get("to_timezone")
+        if arrival_time is not None and to_tz:
+            end_dt = datetime.combine(flight_date, arrival_time)
+            # 按UTC比较，到达早于出发说明跨天
+            if end_dt.replace(tzinfo=ZoneInfo(to_tz)) <= start_dt.replace(tzinfo=ZoneInfo(from_tz)):
+                end_dt += timedelta(days=1)
+            end = {"datetime": end_dt.isoformat(), "timezone": to_tz}
+
+        return {
+            "type": "flight",
+            "title": f"{boarding_pass['flight']} {boarding_pass['from_airport']} → {boarding_pass['to_airport']}",
+            "start": {"datetime": start_dt.isoformat(), "timezone": from_tz},
+            "end": end,
+            "location": {
+                "name": boarding_pass["from_name"],
+                "address": ""
+            },
+            "details": {
+                "seat": boarding_pass.get("seat"),
+                "gate": times.get("gate"),
+                "reference": boarding_pass.get("pnr") or None,
+                "departure_airport": boarding_pass["from_airport"],
+                "arrival_airport": boarding_pass["to_airport"]
+            },
+            "confidence": 0.95
+        }
+
+    def _parse_time(self, value: Optional[str]):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value.strip()[:5], "%H:%M").time()
+        except ValueError:
+            return None
+
+barcode_service = BarcodeService()
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import uuid
+from typing import Dict, Any, List, Tuple
+
+from .async_processor import async_processor
+from .image_processor import image_processor
+from .scheduler import ANONYMOUS_CLIENT
+from .storage import storage_service
+from .vision import vision_service
+from . import metrics
+from ..config import settings
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_FAILURES = ("failed", "expired", "cancelled")
+# 下载批处理结果文件的最大尝试次数，间隔为 batch.poll_interval
+BATCH_DOWNLOAD_ATTEMPTS = 5
+
+
+class BatchProcessor:
+    """延迟批处理：累积任务后提交供应商Batch API，完成后回填各任务结果"""
+    
+    def __init__(self):
+        self.client = None
+        self._client_key = None
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._background: set = set()
+        # 未结束任务所属的令牌，用于按令牌统计任务数和token用量（同时写入任务状态，重启后恢复）
+        self._owners: Dict[str, str] = {}
+    
+    def _get_client(self):
+        key = (settings.openai_api_key, settings.batch_base_url or settings.openai_base_url)
+        if self.client is None or key != self._client_key:
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(api_key=key[0], base_url=key[1])
+            self._client_key = key
+        return self.client
+    
+    def _spawn(self, coro) -> None:
+        # 保留后台任务引用，避免被垃圾回收
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    async def submit_task(self, filename: str, image_content: bytes, client: str = ANONYMOUS_CLIENT) -> str:
+        """保存图片并加入待提交批次"""
+        folder_name = await storage_service.save_image(str(uuid.uuid4()), filename, image_content)
+        self._owners[folder_name] = client
+        
+        try:
+            processed_image, previews = await asyncio.to_thread(image_processor.process_with_previews, image_content)
+            await storage_service.save_previews(folder_name, previews)
+        except Exception as e:
+            await self._fail(folder_name, str(e))
+            return folder_name
+        
+        await storage_service.save_task_status(folder_name, "queued", {"mode": "batch", "client": client})
+        await self._enqueue(folder_name, processed_image)
+        return folder_name
+    
+    async def _enqueue(self, folder_name: str, processed_image: bytes) -> None:
+        self._pending.append((folder_name, vision_service.build_ticket_request(processed_image)))
+        
+        if len(self._pending) >= settings.batch_max_size:
+            await self.flush()
+        elif self._flush_timer is None:
+            loop = asyncio.get_running_loop()
+            self._flush_timer = loop.call_later(
+                settings.batch_flush_interval,
+                lambda: self._spawn(self.flush())
+            )
+    
+    def _scan_batch_tasks(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """存储中未结束的批处理任务（已归档的任务都已结束，无需检查）"""
+        tasks = []
+        for task_dir in storage_service.iter_task_dirs():
+            try:
+                with open(task_dir / "status.json", "rb") as f:
+                    status = json.loads(f.read())
+            except (FileNotFoundError, ValueError):
+                continue
+            if not status or status.get("status") not in ("queued", "processing"):
+                continue
+            if (status.get("data") or {}).get("mode") == "batch":
+                tasks.append((task_dir.name, status))
+        return tasks
+    
+    async def resume(self) -> None:
+        """服务重启后恢复批处理任务：已提交的批次继续轮询，内存中丢失的待提交任务重新排队"""
+        batches: Dict[str, List[str]] = {}
+        for folder_name, status in await asyncio.to_thread(self._scan_batch_tasks):
+            data = status.get("data") or {}
+            self._owners[folder_name] = data.get("client") or ANONYMOUS_CLIENT
+            batch_id = data.get("batch_id")
+            if status["status"] == "processing" and batch_id:
+                batches.setdefault(batch_id, []).append(folder_name)
+                continue
+            try:
+                image_path = storage_service.task_path(folder_name) / "original.jpg"
+                image_content = await asyncio.to_thread(image_path.read_bytes)
+                processed_image = await asyncio.to_thread(image_processor.process_image, image_content)
+            except Exception as e:
+                await self._fail(folder_name, f"批处理任务恢复失败: {e}")
+                continue
+            await self._enqueue(folder_name, processed_image)
+        
+        for batch_id, folders in batches.items():
+            self._spawn(self._poll(batch_id, folders))
+    
+    async def flush(self) -> str | None:
+        """立即提交所有待处理任务，返回batch id"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        
+        items, self._pending = self._pending, []
+        if not items:
+            return None
+        
+        folders = [folder_name for folder_name, _ in items]
+        lines = [
+            json.dumps({
+                "custom_id": folder_name,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body
+            }, ensure_ascii=False)
+            for folder_name, body in items
+        ]
+        
+        try:
+            client = self._get_client()
+            batch_file = await client.files.create(
+                file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=settings.batch_completion_window
+            )
+        except Exception as e:
+            await self._fail_all(folders, f"批处理提交失败: {e}")
+            return None
+        
+        for folder_name in folders:
+            await storage_service.save_task_status(folder_name, "processing", {
+                "mode": "batch",
+                "batch_id": batch.id,
+                "client": self._owners.get(folder_name, ANONYMOUS_CLIENT)
+            })
+        
+        self._spawn(self._poll(batch.id, folders))
+        return batch.id
+    
+    async def _poll(self, batch_id: str, folders: List[str]) -> None:
+        """轮询批处理状态，完成后分发结果"""
+        client = self._get_client()
+        while True:
+            await asyncio.sleep(settings.batch_poll_interval)
+            try:
+                batch = await client.batches.retrieve(batch_id)
+            except Exception:
+                # 临时网络错误，下次继续轮询
+                continue
+            
+            if batch.status == "completed":
+                break
+            if batch.status in BATCH_FINAL_FAILURES:
+                await self._fail_all(folders, f"批处理任务{batch.status}")
+                return
+        
+        records: Dict[str, Dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            try:
+                text = await self._download(client, file_id)
+            except Exception as e:
+                await self._fail_all(folders, f"批处理结果下载失败: {e}")
+                return
+            for line in text.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 单行损坏只影响该行对应的任务（按缺少结果处理）
+                    continue
+                if isinstance(record, dict):
+                    records[record.get("custom_id")] = record
+        
+        for folder_name in folders:
+            record = records.get(folder_name)
+            try:
+                result = await self._parse_record(record)
+                finished = await async_processor.finish_task(folder_name, result)
+            except Exception as e:
+                await self._fail(folder_name, str(e))
+                continue
+            self._count(folder_name, finished["status"], self._usage(record))
+    
+    async def _download(self, client, file_id: str) -> str:
+        """下载结果文件，临时错误时按轮询间隔重试"""
+        for attempt in range(BATCH_DOWNLOAD_ATTEMPTS):
+            try:
+                content = await client.files.content(file_id)
+                return content.text
+            except Exception:
+                if attempt == BATCH_DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(settings.batch_poll_interval)
+    
+    @staticmethod
+    def _usage(record: Dict[str, Any] | None) -> Dict[str, int]:
+        body = ((record or {}).get("response") or {}).get("body")
+        usage = body.get("usage") if isinstance(body, dict) else None
+        return usage if isinstance(usage, dict) else {}
+    
+    def _count(self, folder_name: str, status: str, usage: Dict[str, int] | None = None) -> None:
+        """按令牌统计结束的批处理任务及其token用量"""
+        client = self._owners.pop(folder_name, ANONYMOUS_CLIENT)
+        metrics.client_tasks.inc(client=client, status=status)
+        for kind in ("prompt", "completion"):
+            count = (usage or {}).get(f"{kind}_tokens") or 0
+            if count:
+                metrics.client_tokens.inc(count, client=client, type=kind)
+    
+    async def _fail(self, folder_name: str, error: str) -> None:
+        await storage_service.save_task_status(folder_name, "failed", {"error": error})
+        self._count(folder_name, "failed")
+    
+    async def _parse_record(self, record: Dict[str, Any] | None) -> Dict[str, Any]:
+        """解析批处理输出中的单条记录"""
+        if record is None:
+            return {"error": "批处理结果中缺少该任务"}
+        if record.get("error"):
+            return {"error": str(record["error"].get("message", record["error"]))}
+        
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            return {"error": f"批处理请求失败: HTTP {response.get('status_code')}"}
+        
+        content = response["body"]["choices"][0]["message"]["content"]
+        return await vision_service.parse_or_repair(content)
+    
+    async def _fail_all(self, folders: List[str], error: str) -> None:
+        for folder_name in folders:
+            await self._fail(folder_name, error)
+
+batch_processor = BatchProcessor()
@@ -0,0 +1,170 @@
+import io
+import json
+import tarfile
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .archive import archive_service
+from .storage import storage_service
+
+CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = ("zip", "tar")
+
+
+class _StreamBuffer(io.RawIOBase):
+    """不可seek的写入缓冲：归档库写入后由生成器取走，内存只保留当前块"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService:
+    """按条件流式导出任务结果、ICS和原图"""
+    
+    def _task_status(self, folder_name: str, task_dir: Optional[Path]) -> Dict[str, Any] | None:
+        if task_dir is not None:
+            try:
+                with open(task_dir / "status.json", "rb") as f:
+                    return json.loads(f.read())
+            except (FileNotFoundError, ValueError):
+                pass
+        entry = archive_service.entries().get(folder_name)
+        return {"status": entry.get("status"), "timestamp": entry.get("timestamp")} if entry else None
+    
+    def _candidates(self, ids: Optional[List[str]]) -> Iterator[Tuple[str, Optional[Path]]]:
+        if ids:
+            for folder_name in ids:
+                try:
+                    task_dir = storage_service.task_path(folder_name)
+                except ValueError:
+                    continue
+                yield folder_name, task_dir if task_dir.is_dir() else None
+            return
+        
+        seen = set()
+        for task_dir in storage_service.iter_task_dirs():
+            seen.add(task_dir.name)
+            yield task_dir.name, task_dir
+        for folder_name in list(archive_service.entries()):
+            if folder_name not in seen:
+                yield folder_name, None
+    
+    def select(
+        self,
+        ids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        status: Optional[str] = None
+    ) -> Iterator[Tuple[str, Optional[Path], Dict[str, Any]]]:
+        """逐个产出符合条件的任务，不预先收集列表"""
+        for folder_name, task_dir in self._candidates(ids):
+            record = self._task_status(folder_name, task_dir)
+            if record is None:
+                continue
+            if status and record.get("status") != status:
+                continue
+            if since:
+                try:
+                    if datetime.fromisoformat(record.get("timestamp") or "") < since:
+                        continue
+                except ValueError:
+                    continue
+            yield folder_name, task_dir, record
+    
+    def _task_files(
+        self,
+        folder_name: str,
+        task_dir: Optional[Path],
+        include_originals: bool
+    ) -> Iterator[Tuple[str, bytes | Path]]:
+        """任务导出内容：小文件返回字节，原图返回路径以便分块复制"""
+        archived = None
+        for file_name in ("result.json", "calendar.ics"):
+            path = task_dir / file_name if task_dir is not None else None
+            if path is not None and path.exists():
+                yield file_name, path.read_bytes()
+                continue
+            if archived is None:
+                archived = archive_service.read(folder_name) or {}
+            if file_name == "result.json" and archived.get("result") is not None:
+                yield file_name, storage_service.dumps(archived["result"])
+            elif file_name == "calendar.ics" and archived.get("ics") is not None:
+                yield file_name, archived["ics"].encode("utf-8")
+        
+        if include_originals and task_dir is not None and (task_dir / "original.jpg").exists():
+            yield "original.jpg", task_dir / "original.jpg"
+    
+    def _modified(self, record: Dict[str, Any]) -> float:
+        try:
+            return datetime.fromisoformat(record.get("timestamp") or "").timestamp()
+        except ValueError:
+            return time.time()
+    
+    def iter_zip(self, tasks: Iterator[Tuple[str, Optional[Path], Dict[str, Any]]], include_originals: bool) -> Iterator[bytes]:
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, mode="w", allowZip64=True) as archive:
+            for folder_name, task_dir, record in tasks:
+                date_time = time.localtime(max(self._modified(record), 315532800))[:6]
+                for file_name, content in self._task_files(folder_name, task_dir, include_originals):
+                    info = zipfile.ZipInfo(f"{folder_name}/{file_name}", date_time=date_time)
+                    if isinstance(content, Path):
+                        # JPEG已压缩，直接存储
+                        info.compress_type = zipfile.ZIP_STORED
+                        with open(content, "rb") as source, archive.open(info, "w", force_zip64=True) as target:
+                            while chunk := source.read(CHUNK_SIZE):
+                                target.write(chunk)
+                                yield buffer.drain()
+                    else:
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        archive.writestr(info, content)
+                    yield buffer.drain()
+        yield buffer.drain()
+    
+    def iter_tar(self, tasks: Iterator[Tuple[str, Optional[Path], Dict[str, Any]]], include_originals: bool) -> Iterator[bytes]:
+        buffer = _StreamBuffer()
+        with tarfile.open(fileobj=buffer, mode="w|gz") as archive:
+            for folder_name, task_dir, record in tasks:
+                modified = self._modified(record)
+                for file_name, content in self._task_files(folder_name, task_dir, include_originals):
+                    info = tarfile.TarInfo(f"{folder_name}/{file_name}")
+                    info.mtime = modified
+                    if isinstance(content, Path):
+                        with open(content, "rb") as source:
+                            info.size = content.stat().st_size
+                            archive.addfile(info, source)
+                    else:
+                        info.size = len(content)
+                        archive.addfile(info, io.BytesIO(content))
+                    yield buffer.drain()
+        yield buffer.drain()
+    
+    def stream(
+        self,
+        export_format: str = "zip",
+        ids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        status: Optional[str] = None,
+        include_originals: bool = False
+    ) -> Iterator[bytes]:
+        """生成导出文件的字节流，跳过空块"""
+        tasks = self.select(ids, since, status)
+        chunks = self.iter_tar(tasks, include_originals) if export_format == "tar" else self.iter_zip(tasks, include_originals)
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+
+export_service = ExportService()
@@ -0,0 +1,203 @@
+import difflib
+import re
+import sys
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+GAZETTEER_PATH = Path(__file__).resolve().parent.parent / "data" / "gazetteer.tsv"
+
+# 精选地名优先于机场城市；同名机场城市按机场数量排序
+CURATED_RANK = 0
+AIRPORT_RANK = 1
+
+CJK_RUN_PATTERN = re.compile(r"[぀-ヿ㐀-鿿가-힯]+")
+LATIN_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_NGRAM_WORDS = 4
+MIN_LATIN_KEY = 4
+MIN_CJK_KEY = 2
+# 单个拉丁单词至少3个字母才参与匹配（如USA、NYC），避免误匹配常见短词
+MIN_SHORT_WORD = 3
+FUZZY_CUTOFF = 0.88
+
+# (rank, -机场数, 时区, 国家代码)
+Candidate = Tuple[int, int, str, str]
+
+
+def fold_name(text: str) -> str:
+    """去除变音符号并统一大小写（Zürich → zurich）"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return unicodedata.normalize("NFKC", text)
+
+
+def normalize_name(name: str) -> str:
+    """地名归一化为索引键：折叠后去除空白和标点"""
+    return re.sub(r"[\s\-'’.,·/()]+", "", fold_name(name))
+
+
+class Gazetteer:
+    """离线地名→时区索引，以排序数组存储，支持精确、最长前缀和模糊匹配"""
+    
+    def __init__(self, airport_loader: Callable[[], Dict[str, List[str]]] | None = None):
+        self._airport_loader = airport_loader
+        self._keys: List[str] | None = None
+        self._values: List[Tuple[Candidate, ...]] = []
+        self._countries: Dict[str, Tuple[str | None, str]] = {}
+        self._max_cjk_len = MIN_CJK_KEY
+    
+    def _ensure_loaded(self) -> None:
+        if self._keys is None:
+            self._load()
+    
+    def _load(self) -> None:
+        entries: Dict[str, List[Candidate]] = {}
+        
+        with open(GAZETTEER_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                kind, tz, country, names = line.rstrip("\n").split("\t")
+                for name in names.split("|"):
+                    key = normalize_name(name)
+                    if kind == "country":
+                        self._countries[key] = (None if tz == "-" else tz, country)
+                    else:
+                        entries.setdefault(key, []).append((CURATED_RANK, 0, sys.intern(tz), country))
+        
+        if self._airport_loader:
+            counts = Counter()
+            for tz, _, city, country in self._airport_loader().values():
+                if city:
+                    counts[(normalize_name(city), sys.intern(tz), country)] += 1
+            for (key, tz, country), count in counts.items():
+                if len(key) >= MIN_LATIN_KEY:
+                    entries.setdefault(key, []).append((AIRPORT_RANK, -count, tz, country))
+        
+        self._keys = sorted(entries)
+        self._values = [tuple(sorted(entries[key])) for key in self._keys]
+        self._max_cjk_len = max(
+            (len(key) for key in self._keys if CJK_RUN_PATTERN.fullmatch(key)),
+            default=MIN_CJK_KEY
+        )
+    
+    def _get(self, key: str) -> Tuple[Candidate, ...] | None:
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return self._values[index]
+        return None
+    
+    def _pick(self, candidates: Tuple[Candidate, ...], country: str | None) -> str | None:
+        """按国家过滤后选择时区；存在无法区分的歧义时返回None"""
+        if country:
+            candidates = tuple(c for c in candidates if c[3] == country.upper())
+        if not candidates:
+            return None
+        
+        best = candidates[0]
+        if best[0] == CURATED_RANK:
+            return best[2]
+        # 仅有机场城市时，机场数量明显多的一方胜出
+        rivals = [c for c in candidates[1:] if c[2] != best[2]]
+        if all(c[1] > best[1] for c in rivals):
+            return best[2]
+        return None
+    
+    def lookup(self, name: str, country: str = None) -> Optional[str]:
+        """按城市名查询时区：精确匹配 → 最长前缀匹配 → 模糊匹配"""
+        self._ensure_loaded()
+        key = normalize_name(name or "")
+        if not key:
+            return None
+        
+        candidates = self._get(key)
+        if candidates:
+            return self._pick(candidates, country)
+        
+        # 最长前缀：如"上海市" → "上海"、"Frankfurt am Main" → "frankfurt"
+        for length in range(len(key) - 1, MIN_CJK_KEY - 1, -1):
+            candidates = self._get(key[:length])
+            if candidates and (length >= MIN_LATIN_KEY or CJK_RUN_PATTERN.fullmatch(key[:length])):
+                return self._pick(candidates, country)
+        
+        if len(key) >= MIN_LATIN_KEY and not CJK_RUN_PATTERN.search(key):
+            # 只在首字母相同的区间内做模糊匹配
+            start = bisect_left(self._keys, key[0])
+            end = bisect_left(self._keys, chr(ord(key[0]) + 1))
+            close = difflib.get_close_matches(key, self._keys[start:end], n=1, cutoff=FUZZY_CUTOFF)
+            if close:
+                return self._pick(self._get(close[0]), country)
+        
+        return None
+    
+    def find_in_text(self, text: str, country: str = None, airport_words: bool = False) -> Optional[str]:
+        """在场馆名、地址等文本中查找地名并返回时区。
+        仅来自机场城市的单个拉丁单词（Hollywood、Independence、Victoria等）常是场馆名的一部分，
+        默认不参与匹配，airport_words=True 时才使用"""
+        self._ensure_loaded()
+        if not text:
+            return None
+        
+        cities = []
+        countries = []
+        
+        for run in CJK_RUN_PATTERN.findall(text):
+            index = 0
+            while index < len(run):
+                matched = None
+                for length in range(min(self._max_cjk_len, len(run) - index), MIN_CJK_KEY - 1, -1):
+                    fragment = run[index:index + length]
+                    if fragment in self._countries:
+                        countries.append(fragment)
+                        matched = fragment
+                        break
+                    if self._get(fragment):
+                        cities.append(fragment)
+                        matched = fragment
+                        break
+                index += len(matched) if matched else 1
+        
+        cjk_count = len(cities)
+        words = LATIN_WORD_PATTERN.findall(fold_name(text))
+        index = 0
+        while index < len(words):
+            matched_size = 1
+            for size in range(min(MAX_NGRAM_WORDS, len(words) - index), 0, -1):
+                key = "".join(words[index:index + size])
+                if size == 1 and len(key) < MIN_SHORT_WORD:
+                    continue
+                if key in self._countries:
+                    countries.append(key)
+                    matched_size = size
+                    break
+                candidates = self._get(key)
+                if size == 1 and candidates and not airport_words and candidates[0][0] == AIRPORT_RANK:
+                    continue
+                if candidates:
+                    cities.append(key)
+                    matched_size = size
+                    break
+            index += matched_size
+        
+        if not country:
+            hints = {self._countries[key][1] for key in countries}
+            country = hints.pop() if len(hints) == 1 else None
+        
+        # 中文地址城市在前、英文地址城市在后；精选地名优先于机场城市
+        ordered = cities[:cjk_count] + cities[cjk_count:][::-1]
+        ordered.sort(key=lambda key: self._get(key)[0][0])
+        for key in ordered:
+            tz = self._pick(self._get(key), country)
+            if tz:
+                return tz
+        
+        # 只提到单一时区国家时退回该国时区
+        if country and not cities:
+            for key in countries:
+                tz, code = self._countries[key]
+                if tz and code == country:
+                    return tz
+        return None
+
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import shutil
+import uuid
+from typing import Any, Dict
+
+from ..config import settings
+from . import metrics
+from .async_processor import async_processor
+from .storage import storage_service
+
+PROBE_FILE = ".health_probe"
+
+
+class HealthService:
+    """就绪检查：队列饱和、存储可写与剩余空间、近期上游错误率与延迟"""
+    
+    def _check_queue(self) -> Dict[str, Any]:
+        """积压 = 排队数 + 超出处理能力的在途数；未设置 async.max_in_flight 时任务不会排队，
+        处理能力按 async.max_workers 计算，超出部分同样视为积压"""
+        queued = async_processor.queued
+        in_flight = async_processor.in_flight
+        capacity = settings.max_in_flight or settings.max_workers
+        backlog = queued + max(0, in_flight - capacity)
+        return {
+            "ok": backlog < settings.health_max_queued,
+            "queued": queued,
+            "in_flight": in_flight,
+            "capacity": capacity,
+            "backlog": backlog,
+            "max_queued": settings.health_max_queued
+        }
+    
+    def _check_storage(self) -> Dict[str, Any]:
+        """写入并删除探测文件，同时检查剩余空间"""
+        base_path = storage_service.base_path
+        result: Dict[str, Any] = {"writable": True}
+        try:
+            # 文件名唯一，并发的就绪检查不会删除彼此的探测文件
+            probe = base_path / f"{PROBE_FILE}.{os.getpid()}.{uuid.uuid4().hex}"
+            # 不经过write_atomic，探测写入不计入存储耗时指标
+            probe.write_bytes(b"ok")
+            probe.unlink(missing_ok=True)
+        except OSError as e:
+            result["writable"] = False
+            result["error"] = str(e)
+        try:
+            free_mb = shutil.disk_usage(base_path).free / 1024 / 1024
+        except OSError:
+            free_mb = 0.0
+        result["free_mb"] = round(free_mb, 1)
+        result["min_free_mb"] = settings.health_min_free_mb
+        result["ok"] = result["writable"] and free_mb >= settings.health_min_free_mb
+        return result
+    
+    def _check_upstream(self) -> Dict[str, Any]:
+        """样本不足时不判定失败，避免冷启动或低流量时误摘除"""
+        summary = metrics.recent_upstream.summary(settings.health_upstream_window)
+        enough = summary["count"] >= settings.health_upstream_min_samples
+        ok = True
+        if enough and summary["error_rate"] > settings.health_upstream_max_error_rate:
+            ok = False
+        max_p95 = settings.health_upstream_max_p95
+        if enough and max_p95 and summary["p95"] is not None and summary["p95"] > max_p95:
+            ok = False
+        return {
+            "ok": ok,
+            "window_seconds": settings.health_upstream_window,
+            **summary
+        }
+    
+    async def readiness(self) -> Dict[str, Any]:
+        checks = {
+            "queue": self._check_queue(),
+            "storage": await asyncio.to_thread(self._check_storage),
+            "upstream": self._check_upstream()
+        }
+        return {
+            "ready": all(check["ok"] for check in checks.values()),
+            "checks": checks
+        }
+
+health_service = HealthService()
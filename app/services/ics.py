@@ -1,4 +1,3 @@
-from icalendar import Calendar, Event, Alarm
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 import uuid
@@ -6,6 +5,8 @@ import uuid
 class ICSService:
     def generate_ics(self, data: dict) -> bytes:
         """生成ICS文件内容"""
+        from icalendar import Calendar, Event, Alarm
+        
         cal = Calendar()
         cal.add('prodid', '-//Ticket2Calendar//EN')
         cal.add('version', '2.0')
@@ -51,7 +52,7 @@ class ICSService:
         
         # 根据配置设置提醒时间
         from ..config import settings
-        reminder_hours = settings.get_reminder_hours(data['type'])
+        reminder_hours = settings.snapshot().get_reminder_hours(data['type'])
         trigger_time = timedelta(hours=-reminder_hours)
         
         alarm.add('trigger', trigger_time)
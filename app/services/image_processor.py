@@ -1,42 +1,94 @@
-from PIL import Image, ImageOps
-import cv2
-import numpy as np
 from io import BytesIO
+from typing import Dict, Mapping, Tuple
 from ..config import settings
+from .metrics import time_stage
+from .tracing import record_image
+
+PREVIEW_QUALITY = 80
 
 class ImageProcessor:
-    def process_image(self, image_content: bytes) -> bytes:
-        """处理图片：调整大小、旋转、去噪等"""
-        # 使用PIL打开图片
-        image = Image.open(BytesIO(image_content))
-        
-        # 自动旋转（根据EXIF信息）
-        if settings.image_auto_rotate:
-            image = ImageOps.exif_transpose(image)
-        
-        # 转换为RGB模式
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+    def _prepare(self, image_content: bytes, config):
+        """解码并完成旋转、缩放、去噪，返回PIL图片"""
+        from PIL import Image, ImageOps
         
-        # 调整尺寸（如果启用resize）
-        if settings.image_resize:
-            max_width = settings.image_max_width
-            max_height = settings.image_max_height
+        with time_stage("decode"):
+            # 使用PIL打开图片
+            image = Image.open(BytesIO(image_content))
+            record_image("original", image.width, image.height, len(image_content))
             
-            if image.width > max_width or image.height > max_height:
-                image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            # 自动旋转（根据EXIF信息）
+            if config.image_auto_rotate:
+                image = ImageOps.exif_transpose(image)
+            
+            # 转换为RGB模式
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
         
-        # 去噪处理（可选）
-        if settings.image_denoise:
-            image = self._denoise_image(image)
+        with time_stage("resize"):
+            # 调整尺寸（如果启用resize）
+            if config.image_resize:
+                max_width = config.image_max_width
+                max_height = config.image_max_height
+                
+                if image.width > max_width or image.height > max_height:
+                    image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            
+            # 去噪处理（可选）
+            if config.image_denoise:
+                image = self._denoise_image(image)
         
-        # 保存为字节流
+        return image
+    
+    @staticmethod
+    def _save_jpeg(image, quality: int) -> bytes:
         output = BytesIO()
-        image.save(output, format='JPEG', quality=settings.image_quality, optimize=True)
+        image.save(output, format='JPEG', quality=quality, optimize=True)
         return output.getvalue()
     
-    def _denoise_image(self, pil_image: Image.Image) -> Image.Image:
-        """使用OpenCV进行去噪处理"""
+    def _encode(self, image, quality: int) -> bytes:
+        with time_stage("encode"):
+            return self._save_jpeg(image, quality)
+    
+    def process_image(self, image_content: bytes) -> bytes:
+        """处理图片：调整大小、旋转、去噪等"""
+        config = settings.snapshot()
+        return self._encode(self._prepare(image_content, config), config.image_quality)
+    
+    def make_previews(self, image, sizes: Mapping[str, int]) -> Dict[str, bytes]:
+        """从已解码的图片生成各尺寸预览图（长边不超过指定像素）"""
+        from PIL import Image
+        
+        previews = {}
+        # 从大到小依次缩放，每次以上一级结果为源；预览图的编码计入previews阶段，不再单独计入encode
+        with time_stage("previews"):
+            for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+                if max(image.size) > size:
+                    image = image.copy()
+                    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+                previews[name] = self._save_jpeg(image, PREVIEW_QUALITY)
+        return previews
+    
+    def process_with_previews(self, image_content: bytes) -> Tuple[bytes, Dict[str, bytes]]:
+        """处理图片并复用同一次解码生成缩略图和预览图"""
+        config = settings.snapshot()
+        image = self._prepare(image_content, config)
+        processed = self._encode(image, config.image_quality)
+        record_image("processed", image.width, image.height, len(processed))
+        return processed, self.make_previews(image, config.image_preview_sizes)
+    
+    def previews_from_file(self, image_content: bytes) -> Dict[str, bytes]:
+        """为接入预览前的旧任务补生成预览图"""
+        from PIL import Image, ImageOps
+        
+        image = ImageOps.exif_transpose(Image.open(BytesIO(image_content))).convert('RGB')
+        return self.make_previews(image, settings.image_preview_sizes)
+    
+    def _denoise_image(self, pil_image):
+        """使用OpenCV进行去噪处理（仅在启用去噪时加载OpenCV）"""
+        import cv2
+        import numpy as np
+        from PIL import Image
+        
         # PIL转OpenCV
         cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
         
@@ -0,0 +1,289 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from . import tracing
+
+# 覆盖毫秒级本地处理到分钟级模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# 事件循环延迟通常在毫秒级，阻塞时可达秒级
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LAG_INTERVAL = 0.25
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Callable[[], float] | None = None
+    
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+    
+    def set_function(self, function: Callable[[], float]) -> None:
+        """抓取时才计算取值（无标签），用于暴露其他模块已有的计数"""
+        self._function = function
+    
+    def render(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., 总和, 总数]
+        self._states: Dict[LabelValues, List[float]] = {}
+    
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._states.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(state[-1])}")
+        return lines
+
+
+class RecentCalls:
+    """最近一段时间的调用记录（耗时、是否成功），用于就绪检查的错误率和延迟分位数"""
+    
+    def __init__(self, max_entries: int = 10000):
+        self._entries: deque = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+    
+    def add(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._entries.append((time.monotonic(), seconds, ok))
+    
+    def summary(self, window: float) -> Dict[str, float]:
+        cutoff = time.monotonic() - window
+        with self._lock:
+            while self._entries and self._entries[0][0] < cutoff:
+                self._entries.popleft()
+            entries = list(self._entries)
+        latencies = sorted(seconds for _, seconds, _ in entries)
+        errors = sum(1 for _, _, ok in entries if not ok)
+        summary = {
+            "count": len(entries),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 3) if entries else 0.0
+        }
+        for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            index = min(len(latencies) - 1, int(quantile * len(latencies)))
+            summary[name] = round(latencies[index], 3) if latencies else None
+        return summary
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按Prometheus文本格式输出"""
+    
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+    
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+    
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+    
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+    
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "ics_http_requests_total", "HTTP请求数", ("method", "route", "status")
+)
+http_duration = registry.histogram(
+    "ics_http_request_duration_seconds", "HTTP请求耗时", ("method", "route")
+)
+stage_duration = registry.histogram(
+    "ics_stage_duration_seconds", "流水线各阶段耗时", ("stage",)
+)
+tasks_queued = registry.gauge("ics_tasks_queued", "等待处理名额的任务数")
+tasks_in_flight = registry.gauge("ics_tasks_in_flight", "正在处理的任务数")
+tasks_total = registry.counter("ics_tasks_total", "结束的任务数", ("status",))
+errors = registry.counter("ics_errors_total", "处理错误数（按原因）", ("cause",))
+upstream_requests = registry.counter("ics_upstream_requests_total", "模型调用次数", ("kind", "outcome"))
+upstream_tokens = registry.counter("ics_upstream_tokens_total", "模型token用量", ("type",))
+recent_upstream = RecentCalls()
+loop_lag = registry.histogram("ics_event_loop_lag_seconds", "事件循环调度延迟", buckets=LAG_BUCKETS)
+loop_lag_last = registry.gauge("ics_event_loop_lag_last_seconds", "最近一次测得的事件循环调度延迟")
+client_requests = registry.counter(
+    "ics_client_requests_total", "各令牌的识别请求数（rejected为超出每分钟限额）", ("client", "outcome")
+)
+client_tasks = registry.counter("ics_client_tasks_total", "各令牌结束的任务数", ("client", "status"))
+client_tokens = registry.counter("ics_client_upstream_tokens_total", "各令牌的模型token用量", ("client", "type"))
+client_queued = registry.gauge("ics_client_tasks_queued", "各令牌等待处理名额的任务数", ("client",))
+client_in_flight = registry.gauge("ics_client_tasks_in_flight", "各令牌正在处理的任务数", ("client",))
+client_queue_wait = registry.histogram(
+    "ics_client_queue_wait_seconds", "各令牌任务等待处理名额的时间", ("client",)
+)
+cache_hits = registry.counter("ics_result_cache_hits_total", "任务状态缓存命中次数")
+cache_misses = registry.counter("ics_result_cache_misses_total", "任务状态缓存未命中次数")
+
+
+@contextmanager
+def time_stage(stage: str):
+    """记录一个流水线阶段的耗时，同时计入当前任务的耗时分段"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage)
+        tracing.record_stage(stage, elapsed)
+
+
+@contextmanager
+def upstream_call(kind: str):
+    """记录一次模型调用的耗时和结果（计数器、阶段耗时和最近调用窗口）"""
+    started = time.perf_counter()
+    try:
+        with time_stage("upstream"):
+            yield
+    except Exception as e:
+        upstream_requests.inc(kind=kind, outcome=classify_error(e))
+        recent_upstream.add(time.perf_counter() - started, False)
+        raise
+    upstream_requests.inc(kind=kind, outcome="ok")
+    recent_upstream.add(time.perf_counter() - started, True)
+
+
+async def monitor_loop_lag(interval: float = LAG_INTERVAL) -> None:
+    """定期sleep并测量实际唤醒比预期晚了多久；同步阻塞事件循环的代码会直接体现为延迟"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+
+
+def record_usage(usage) -> None:
+    """累计上游响应中的token用量（兼容缺少usage的服务）"""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or 0
+    if prompt:
+        upstream_tokens.inc(prompt, type="prompt")
+    if completion:
+        upstream_tokens.inc(completion, type="completion")
+    if prompt or completion:
+        tracing.record_tokens(prompt, completion)
+
+
+def classify_error(error: BaseException) -> str:
+    """把异常归类为有限的原因标签"""
+    name = type(error).__name__
+    if isinstance(error, TimeoutError) or "Timeout" in name:
+        return "timeout"
+    if name in ("RateLimitError",):
+        return "rate_limit"
+    if name in ("APIError", "APIConnectionError", "APIStatusError", "AuthenticationError", "BadRequestError",
+                "InternalServerError", "PermissionDeniedError", "NotFoundError"):
+        return "upstream"
+    if name == "UnidentifiedImageError":
+        return "image"
+    if isinstance(error, OSError):
+        return "storage"
+    if isinstance(error, ValueError):
+        return "validation"
+    return "other"
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+WAITING_FRAME = "(waiting)"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = Path(code.co_filename)
+    try:
+        location = path.resolve().relative_to(PROJECT_ROOT).as_posix()
+    except ValueError:
+        location = "/".join(path.parts[-2:])
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({location})"
+
+
+def _thread_stack(frame) -> List:
+    """线程栈，由外到内"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _coroutine_stack(coro) -> List:
+    """挂起协程的await链，由外到内"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+def collapse(samples: Counter) -> str:
+    """折叠栈格式（每行"栈;帧 次数"），可直接用于flamegraph.pl或speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+class _Sampler(ABC):
+    """后台线程按固定间隔采样调用栈，只读取帧对象，不插桩被测代码"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+    
+    @abstractmethod
+    def _take_sample(self) -> None:
+        """采集一次样本，计入 self.samples"""
+    
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._take_sample()
+    
+    def start(self) -> "_Sampler":
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return collapse(self.samples)
+
+
+class ProcessSampler(_Sampler):
+    """采样进程内所有线程（事件循环、to_thread工作线程、批处理等）"""
+    
+    def _take_sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = [names.get(thread_id, str(thread_id))]
+            stack += [_frame_label(item) for item in _thread_stack(frame)]
+            self.samples[";".join(stack)] += 1
+
+
+class TaskSampler(_Sampler):
+    """只采样一个asyncio任务：运行中取事件循环线程的栈，挂起时取await链，
+    因此结果覆盖整个请求的墙钟时间（含等待上游的时间）"""
+    
+    def __init__(self, task: asyncio.Task, interval: float):
+        super().__init__(interval)
+        self.task = task
+        self.loop_thread = threading.get_ident()
+    
+    def _take_sample(self) -> None:
+        if self.task.done():
+            return
+        coro = self.task.get_coro()
+        top = getattr(coro, "cr_frame", None)
+        if getattr(coro, "cr_running", False):
+            frames = _thread_stack(sys._current_frames().get(self.loop_thread))
+            # 去掉事件循环自身的帧，从任务协程开始
+            if top in frames:
+                frames = frames[frames.index(top):]
+            labels = [_frame_label(item) for item in frames]
+        else:
+            labels = [_frame_label(item) for item in _coroutine_stack(coro)] + [WAITING_FRAME]
+        self.samples[";".join(labels)] += 1
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_process(seconds: float, interval: float | None = None) -> str | None:
+    """阻塞采样整个进程seconds秒；已有采样在进行时返回None"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = ProcessSampler(interval or settings.profiler_interval).start()
+        time.sleep(seconds)
+        return sampler.stop()
+    finally:
+        _profile_lock.release()
+
+
+def _write_signal_profile(seconds: float) -> None:
+    profile = profile_process(seconds)
+    if profile is None:
+        logger.warning("已有采样正在进行，忽略本次信号")
+        return
+    # 不写入存储目录：进程级采样只应通过管理接口或服务器本地获取
+    output_dir = Path(settings.profiler_output_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"profile-{datetime.now():%Y%m%d_%H%M%S}-{os.getpid()}.txt"
+    path.write_text(profile, encoding="utf-8")
+    logger.warning("采样完成（%s秒），折叠栈已写入 %s", seconds, path)
+
+
+def install_signal_handler() -> bool:
+    """注册 SIGUSR2：收到后在后台采样 profiler.signal_seconds 秒并写入 profiler.output_path"""
+    if not hasattr(signal, "SIGUSR2") or threading.current_thread() is not threading.main_thread():
+        return False
+    
+    def handle(signum, frame) -> None:
+        seconds = settings.profiler_signal_seconds
+        logger.warning("收到SIGUSR2，开始采样%s秒", seconds)
+        threading.Thread(target=_write_signal_profile, args=(seconds,), name="signal-profiler", daemon=True).start()
+    
+    signal.signal(signal.SIGUSR2, handle)
+    return True
@@ -0,0 +1,40 @@
+import time
+from collections import deque
+from typing import Dict
+
+from ..config import settings
+from . import metrics
+
+WINDOW_SECONDS = 60
+
+
+class QuotaService:
+    """按令牌统计最近一分钟的识别请求数（滑动窗口），超出 requests_per_minute 时拒绝"""
+    
+    def __init__(self):
+        self._requests: Dict[str, deque] = {}
+    
+    def _window(self, client: str, now: float) -> deque:
+        window = self._requests.setdefault(client, deque())
+        while window and window[0] <= now - WINDOW_SECONDS:
+            window.popleft()
+        return window
+    
+    def acquire(self, client: str) -> float | None:
+        """计入一次请求；超出限额时不计入并返回最早可重试的等待秒数"""
+        config = settings.get_api_client(client)
+        limit = config.requests_per_minute if config else 0
+        now = time.monotonic()
+        window = self._window(client, now)
+        if limit and len(window) >= limit:
+            metrics.client_requests.inc(client=client, outcome="rejected")
+            return window[-limit] + WINDOW_SECONDS - now
+        window.append(now)
+        metrics.client_requests.inc(client=client, outcome="accepted")
+        return None
+    
+    def recent(self, client: str) -> int:
+        """最近一分钟已计入的请求数"""
+        return len(self._window(client, time.monotonic()))
+
+quota_service = QuotaService()
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from ..config import settings
+
+
+class RecordingNotFound(LookupError):
+    """回放模式下没有与请求匹配的录制响应"""
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """图片替换为内容哈希，使键只取决于图片、提示词和模型"""
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if part.get("type") == "image_url":
+                    url = part["image_url"]["url"]
+                    parts.append({"image_sha256": hashlib.sha256(url.encode("utf-8")).hexdigest()})
+                else:
+                    parts.append({"text": part.get("text", "")})
+            content = parts
+        normalized.append({"role": message.get("role"), "content": content})
+    return normalized
+
+
+def request_key(kwargs: Dict[str, Any]) -> str:
+    """录制键：模型 + 规范化后的消息（不含stream、max_tokens等不影响内容的参数）"""
+    payload = {"model": kwargs.get("model"), "messages": _normalize_messages(kwargs.get("messages", []))}
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _usage_dict(usage) -> Dict[str, int] | None:
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+    }
+
+
+class RecordingStore:
+    """按请求键保存模型响应，每条一个JSON文件（recordings/ab/abcd….json）"""
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+    
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+    
+    def load(self, key: str) -> Dict[str, Any] | None:
+        try:
+            with open(self._file(key), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+    
+    def save(self, key: str, kwargs: Dict[str, Any], record: Dict[str, Any]) -> None:
+        record = {
+            "key": key,
+            "model": kwargs.get("model"),
+            "recorded_at": datetime.now().isoformat(),
+            **record
+        }
+        file_path = self._file(key)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        # 不经过write_atomic，录制写入不计入存储耗时指标；临时文件名唯一，并发录制同一请求时互不覆盖
+        temp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            temp_path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+
+def _completion(content: str, usage: Dict[str, int] | None):
+    """与OpenAI响应对象同形的最小结构（VisionService只读取这些属性）"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(**usage) if usage else None
+    )
+
+
+def _chunk(content: str | None, usage: Dict[str, int] | None = None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=SimpleNamespace(**usage) if usage else None)
+
+
+class _RecordingStream:
+    """透传上游流，同时记录每个分块相对请求开始的时间，流结束后写入录制"""
+    
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._on_complete = on_complete
+        self._started = time.perf_counter()
+        self._chunks: List[List] = []
+        self._usage = None
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            chunk = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            await self._on_complete(self._chunks, self._usage, time.perf_counter() - self._started)
+            raise
+        if getattr(chunk, "usage", None) is not None:
+            self._usage = _usage_dict(chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            self._chunks.append([round(time.perf_counter() - self._started, 4), chunk.choices[0].delta.content])
+        return chunk
+    
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class _ReplayStream:
+    """按录制时的时间间隔重新产出分块，最后附带token用量"""
+    
+    def __init__(self, record: Dict[str, Any], speed: float):
+        self._record = record
+        self._speed = speed
+        self._events = self._generate()
+    
+    async def _sleep_until(self, started: float, offset: float) -> None:
+        if self._speed:
+            await asyncio.sleep(max(0.0, started + offset / self._speed - time.perf_counter()))
+    
+    async def _generate(self):
+        started = time.perf_counter()
+        chunks = self._record.get("chunks") or [[self._record["latency"], self._record["content"]]]
+        for offset, content in chunks:
+            await self._sleep_until(started, offset)
+            yield _chunk(content)
+        await self._sleep_until(started, self._record["latency"])
+        if self._record.get("usage"):
+            yield _chunk(None, self._record["usage"])
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        return await self._events.__anext__()
+    
+    async def close(self) -> None:
+        await self._events.aclose()
+
+
+class _Client(ABC):
+    """提供 chat.completions.create 接口，可替换 AsyncOpenAI 客户端"""
+    
+    def __init__(self, store: RecordingStore):
+        self.store = store
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    @abstractmethod
+    async def create(self, **kwargs):
+        """与 AsyncOpenAI 的 chat.completions.create 参数和返回值相同"""
+
+
+class RecordingClient(_Client):
+    """调用真实上游并录制响应（内容、分块时间、token用量和耗时）"""
+    
+    def __init__(self, client, store: RecordingStore):
+        super().__init__(store)
+        self.client = client
+    
+    async def create(self, **kwargs):
+        key = request_key(kwargs)
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            async def on_complete(chunks, usage, latency):
+                content = "".join(text for _, text in chunks)
+                await asyncio.to_thread(self.store.save, key, kwargs, {
+                    "content": content,
+                    "chunks": chunks,
+                    "usage": usage,
+                    "latency": round(latency, 4)
+                })
+            return _RecordingStream(response, on_complete)
+        
+        await asyncio.to_thread(self.store.save, key, kwargs, {
+            "content": response.choices[0].message.content,
+            "chunks": None,
+            "usage": _usage_dict(getattr(response, "usage", None)),
+            "latency": round(time.perf_counter() - started, 4)
+        })
+        return response
+
+
+class ReplayClient(_Client):
+    """离线回放录制的响应；openai.replay_speed 为1时按原始耗时回放，0时立即返回"""
+    
+    async def create(self, **kwargs):
+        key = request_key(kwargs)
+        record = await asyncio.to_thread(self.store.load, key)
+        if record is None:
+            raise RecordingNotFound(f"没有匹配的录制响应（{key[:12]}），请先以 record 模式运行")
+        speed = settings.openai_replay_speed
+        if kwargs.get("stream"):
+            return _ReplayStream(record, speed)
+        if speed:
+            await asyncio.sleep(record["latency"] / speed)
+        return _completion(record["content"], record.get("usage"))
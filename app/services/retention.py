@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+from .archive import archive_service
+from .storage import storage_service
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+
+class RetentionService:
+    """存储保留策略：按状态和时间清理或缩小原始图片，始终保留识别结果和ICS"""
+    
+    def __init__(self):
+        self.last_report: Dict[str, Any] | None = None
+    
+    def _scan(self, now: float) -> Tuple[List[Dict[str, Any]], int]:
+        """收集仍保留原图的任务及其原图大小和状态修改时间"""
+        tasks = []
+        total_bytes = 0
+        for task_dir in storage_service.iter_task_dirs():
+            original = task_dir / "original.jpg"
+            try:
+                size = original.stat().st_size
+            except FileNotFoundError:
+                continue
+            total_bytes += size
+            status_file = task_dir / "status.json"
+            task = {"dir": task_dir, "original": original, "size": size, "age": 0}
+            try:
+                # 终态写入后status.json不再变化，其修改时间即任务结束时间
+                task["age"] = now - status_file.stat().st_mtime
+            except FileNotFoundError:
+                # 状态已归档、原图仍保留的任务
+                entry = archive_service.entries().get(task_dir.name)
+                if entry and entry.get("timestamp"):
+                    task["status"] = entry.get("status")
+                    task["age"] = now - datetime.fromisoformat(entry["timestamp"]).timestamp()
+            tasks.append(task)
+        return tasks, total_bytes
+    
+    def _status_of(self, task_dir: Path) -> str | None:
+        try:
+            with open(task_dir / "status.json", "rb") as f:
+                return json.loads(f.read()).get("status")
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def _expired(self, task: Dict[str, Any], config) -> bool:
+        min_days = min(config.retention_completed_days, config.retention_failed_days)
+        if task["age"] < min_days * DAY_SECONDS:
+            return False
+        # 仅对足够旧的任务读取状态，处理中/排队中的任务不清理
+        task["status"] = task.get("status") or self._status_of(task["dir"])
+        limit = {
+            "completed": config.retention_completed_days,
+            "failed": config.retention_failed_days
+        }.get(task["status"])
+        return limit is not None and task["age"] >= limit * DAY_SECONDS
+    
+    def _downsample(self, original: Path, max_side: int, dry_run: bool) -> int:
+        """缩小原图并返回节省的字节数；已不超过目标尺寸时返回0"""
+        from PIL import Image
+        
+        with Image.open(original) as image:
+            if max(image.size) <= max_side:
+                return 0
+            if dry_run:
+                # 按面积比例估算
+                ratio = max_side / max(image.size)
+                return int(original.stat().st_size * (1 - ratio * ratio))
+            image = image.convert("RGB")
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            output = BytesIO()
+            image.save(output, format="JPEG", quality=settings.image_quality, optimize=True)
+        
+        content = output.getvalue()
+        saved = original.stat().st_size - len(content)
+        if saved <= 0:
+            return 0
+        storage_service.write_atomic(original, content)
+        return saved
+    
+    def _delete(self, original: Path, size: int, dry_run: bool) -> int:
+        if not dry_run:
+            original.unlink(missing_ok=True)
+        return size
+    
+    def sweep(self, dry_run: bool = False) -> Dict[str, Any]:
+        """执行一次清理；dry_run时只统计可回收空间"""
+        config = settings.snapshot()
+        started = time.time()
+        tasks, total_bytes = self._scan(started)
+        report = {
+            "dry_run": dry_run,
+            "scanned": len(tasks),
+            "originals_bytes": total_bytes,
+            "deleted": 0,
+            "downsampled": 0,
+            "reclaimable_bytes": 0,
+            "errors": 0
+        }
+        remaining = total_bytes
+        
+        # 按年龄规则处理过期原图
+        max_side = config.retention_downsample_max_side
+        for task in tasks:
+            if not self._expired(task, config):
+                continue
+            try:
+                if max_side:
+                    saved = self._downsample(task["original"], max_side, dry_run)
+                    task["size"] -= saved
+                    report["downsampled"] += 1 if saved else 0
+                else:
+                    saved = self._delete(task["original"], task["size"], dry_run)
+                    task["size"] = 0
+                    report["deleted"] += 1
+            except Exception as e:
+                logger.warning("清理 %s 失败: %s", task["dir"], e)
+                report["errors"] += 1
+                continue
+            report["reclaimable_bytes"] += saved
+            remaining -= saved
+        
+        # 超出总容量预算时从最旧的已结束任务开始删除原图
+        budget = int(config.retention_max_total_mb * 1024 * 1024)
+        if budget and remaining > budget:
+            for task in sorted(tasks, key=lambda item: item["age"], reverse=True):
+                if remaining <= budget:
+                    break
+                if not task["size"]:
+                    continue
+                task["status"] = task.get("status") or self._status_of(task["dir"])
+                if task["status"] not in ("completed", "failed"):
+                    continue
+                try:
+                    saved = self._delete(task["original"], task["size"], dry_run)
+                except OSError as e:
+                    logger.warning("清理 %s 失败: %s", task["dir"], e)
+                    report["errors"] += 1
+                    continue
+                report["deleted"] += 1
+                report["reclaimable_bytes"] += saved
+                remaining -= saved
+        
+        report["originals_bytes_after"] = remaining
+        report["seconds"] = round(time.time() - started, 3)
+        if not dry_run:
+            self.last_report = report
+        return report
+    
+    async def run(self) -> None:
+        """后台定期清理；未启用时仅按间隔检查配置"""
+        while True:
+            await asyncio.sleep(settings.retention_interval)
+            if not settings.retention_enabled:
+                continue
+            try:
+                report = await asyncio.to_thread(self.sweep)
+                logger.info("存储清理完成: %s", report)
+            except Exception as e:
+                logger.error("存储清理失败: %s", e)
+
+retention_service = RetentionService()
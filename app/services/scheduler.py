@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Tuple
+
+from ..config import settings
+from . import metrics
+
+# 未启用API认证时的请求，以及命令行工具提交的任务
+ANONYMOUS_CLIENT = "anonymous"
+
+
+class _ClientQueue:
+    def __init__(self):
+        self.waiters: deque = deque()
+        self.running = 0
+        self.virtual_time = 0.0
+
+
+class FairScheduler:
+    """按令牌加权公平分配处理名额（起始时间公平排队）：
+    总并发不超过 async.max_in_flight（0为不限），单个令牌不超过其 max_concurrency；
+    空闲名额交给虚拟时间最小的令牌，每获得一个名额其虚拟时间增加 1/weight，
+    因此积压大量任务的令牌只能按权重分得名额，不会饿死其他令牌的交互请求"""
+    
+    def __init__(self):
+        self.queued = 0
+        self.in_flight = 0
+        self._clients: Dict[str, _ClientQueue] = {}
+        self._virtual_time = 0.0
+        self._loop = None
+    
+    def _limits(self, client: str) -> Tuple[int, int]:
+        """(权重, 并发上限)，每次按当前配置读取，热加载后立即生效"""
+        config = settings.get_api_client(client)
+        return (config.weight, config.max_concurrency) if config else (1, 0)
+    
+    def _update_gauges(self, client: str) -> None:
+        queue = self._clients.get(client)
+        metrics.client_queued.set(len(queue.waiters) if queue else 0, client=client)
+        metrics.client_in_flight.set(queue.running if queue else 0, client=client)
+    
+    def _dispatch(self) -> None:
+        """把空闲名额依次分给虚拟时间最小且未达并发上限的令牌"""
+        while not settings.max_in_flight or self.in_flight < settings.max_in_flight:
+            candidates = []
+            for name, queue in self._clients.items():
+                if not queue.waiters:
+                    continue
+                _, max_concurrency = self._limits(name)
+                if max_concurrency and queue.running >= max_concurrency:
+                    continue
+                candidates.append((queue.virtual_time, name))
+            if not candidates:
+                return
+            _, name = min(candidates)
+            queue = self._clients[name]
+            waiter = queue.waiters.popleft()
+            self.queued -= 1
+            if waiter.cancelled():
+                self._update_gauges(name)
+                continue
+            weight, _ = self._limits(name)
+            self._virtual_time = queue.virtual_time
+            queue.virtual_time += 1 / weight
+            queue.running += 1
+            self.in_flight += 1
+            self._update_gauges(name)
+            waiter.set_result(None)
+    
+    def _release(self, client: str) -> None:
+        queue = self._clients.get(client)
+        if queue is None:
+            # 名额属于已重建前的事件循环
+            return
+        queue.running -= 1
+        self.in_flight -= 1
+        # 空闲令牌重新排队时虚拟时间会追平全局值，不再需要保留
+        if not queue.running and not queue.waiters:
+            del self._clients[client]
+        self._update_gauges(client)
+        self._dispatch()
+    
+    @asynccontextmanager
+    async def slot(self, client: str = ANONYMOUS_CLIENT):
+        """等待并占用一个处理名额"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Future绑定事件循环，命令行工具多次asyncio.run时重建等待队列
+            self._clients.clear()
+            self.queued = self.in_flight = 0
+            self._virtual_time = 0.0
+            self._loop = loop
+        queue = self._clients.setdefault(client, _ClientQueue())
+        if not queue.waiters:
+            # 从空闲变为积压时不能使用空闲期间累积的额度
+            queue.virtual_time = max(queue.virtual_time, self._virtual_time)
+        waiter = loop.create_future()
+        queue.waiters.append(waiter)
+        self.queued += 1
+        self._update_gauges(client)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in queue.waiters:
+                queue.waiters.remove(waiter)
+                self.queued -= 1
+                if not queue.running and not queue.waiters:
+                    del self._clients[client]
+                self._update_gauges(client)
+            elif not waiter.cancelled():
+                # 已分到名额但在恢复执行前被取消
+                self._release(client)
+            raise
+        try:
+            yield
+        finally:
+            self._release(client)
+    
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        """各令牌当前排队和处理中的任务数"""
+        return {
+            name: {"queued": len(queue.waiters), "in_flight": queue.running}
+            for name, queue in self._clients.items()
+        }
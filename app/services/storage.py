@@ -1,80 +1,307 @@
 import os
+import re
 import json
-import aiofiles
+import uuid
+import shutil
+import time
+import secrets
+import asyncio
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
 from ..config import settings
+from . import metrics
+
+TERMINAL_STATUSES = ("completed", "failed")
+TASK_FILES = ("status.json", "original.jpg", "calendar.ics", "result.json")
+
+# 任务ID：yyyymmdd_hhmmss_mmm_随机8位十六进制_文件名，按字典序即按时间排序
+TASK_ID_PATTERN = re.compile(r"^(\d{4})(\d{2})(\d{2})_\d{6}_\d{3}_([0-9a-f]{8})(?:_|$)")
+
+
+class ResultCache:
+    """已结束任务状态的LRU缓存，以及未知任务ID的短期负缓存"""
+    
+    def __init__(self):
+        self._results: OrderedDict[str, Dict] = OrderedDict()
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        # 正在从磁盘读取状态的ID → 并发读取数；读取期间被写入的ID不能记为未知
+        self._reading: Dict[str, int] = {}
+        self._written: set = set()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, folder_name: str) -> Dict | None:
+        status = self._results.get(folder_name)
+        if status is not None:
+            self._results.move_to_end(folder_name)
+            self.hits += 1
+            return status
+        expires = self._missing.get(folder_name)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.hits += 1
+                return {"status": "not_found"}
+            del self._missing[folder_name]
+        self.misses += 1
+        return None
+    
+    def begin_read(self, folder_name: str) -> None:
+        self._reading[folder_name] = self._reading.get(folder_name, 0) + 1
+    
+    def end_read(self, folder_name: str) -> bool:
+        """结束一次磁盘读取，返回读取期间该ID是否被写入"""
+        written = folder_name in self._written
+        self._reading[folder_name] -= 1
+        if not self._reading[folder_name]:
+            del self._reading[folder_name]
+            self._written.discard(folder_name)
+        return written
+    
+    def written(self, folder_name: str) -> None:
+        """记录状态写入，使并发读取的未找到结果失效"""
+        if folder_name in self._reading:
+            self._written.add(folder_name)
+    
+    def put(self, folder_name: str, status: Dict) -> None:
+        """只缓存不会再变化的终态"""
+        self._missing.pop(folder_name, None)
+        if status.get("status") not in TERMINAL_STATUSES:
+            self._results.pop(folder_name, None)
+            return
+        self._results[folder_name] = status
+        self._results.move_to_end(folder_name)
+        self._trim(self._results)
+    
+    def put_missing(self, folder_name: str) -> None:
+        ttl = settings.storage_negative_ttl
+        if ttl <= 0:
+            return
+        self._missing[folder_name] = time.monotonic() + ttl
+        self._missing.move_to_end(folder_name)
+        self._trim(self._missing)
+    
+    def discard(self, folder_name: str) -> None:
+        self._results.pop(folder_name, None)
+        self._missing.pop(folder_name, None)
+    
+    def _trim(self, entries: OrderedDict) -> None:
+        while len(entries) > settings.storage_cache_size:
+            entries.popitem(last=False)
+
 
 class StorageService:
     def __init__(self):
         self.base_path = Path(settings.storage_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        self.cache = ResultCache()
     
-    def _create_task_folder(self, filename: str) -> str:
-        """创建任务文件夹：yyyy_mm_dd_hh_mm_ss_filename"""
-        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+    def new_task_id(self, filename: str) -> str:
+        """生成唯一且可按时间排序的任务ID"""
+        now = datetime.now()
         # 清理文件名，移除扩展名和特殊字符
-        clean_name = Path(filename).stem.replace(" ", "_").replace("-", "_")
-        folder_name = f"{timestamp}_{clean_name}"
-        folder_path = self.base_path / folder_name
-        folder_path.mkdir(parents=True, exist_ok=True)
+        clean_name = Path(filename or "").stem.replace(" ", "_").replace("-", "_").replace("/", "_")
+        task_id = f"{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}_{secrets.token_hex(4)}"
+        return f"{task_id}_{clean_name}" if clean_name else task_id
+    
+    def task_path(self, folder_name: str) -> Path:
+        """任务ID → 任务目录：新ID按 年/月/日/随机前缀 分片，旧版文件夹名位于存储根目录"""
+        # 以"."开头的是 .archive 等内部目录，不是任务
+        if not folder_name or folder_name.startswith(".") or "/" in folder_name or "\\" in folder_name:
+            raise ValueError(f"无效的任务ID: {folder_name}")
+        match = TASK_ID_PATTERN.match(folder_name)
+        if match:
+            year, month, day, token = match.groups()
+            return self.base_path / year / month / day / token[:2] / folder_name
+        return self.base_path / folder_name
+    
+    def relative_path(self, folder_name: str) -> str:
+        """任务目录相对存储根目录的路径，用于 /storage 静态文件URL"""
+        return self.task_path(folder_name).relative_to(self.base_path).as_posix()
+    
+    def iter_task_dirs(self) -> Iterator[Path]:
+        """遍历所有任务目录（分片目录和旧版平铺目录），不进入任务目录内部"""
+        for dirpath, dirnames, filenames in os.walk(self.base_path):
+            if any(name in filenames for name in TASK_FILES):
+                dirnames.clear()
+                yield Path(dirpath)
+            else:
+                dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+    
+    def _create_task_folder(self, filename: str) -> str:
+        """创建任务文件夹，返回任务ID"""
+        folder_name = self.new_task_id(filename)
+        self.task_path(folder_name).mkdir(parents=True, exist_ok=True)
         return folder_name
     
+    @staticmethod
+    def dumps(data: dict) -> bytes:
+        """紧凑序列化，状态文件会被频繁轮询读取"""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    @staticmethod
+    def write_atomic(file_path: Path, content: bytes) -> None:
+        """先写同目录临时文件再rename，读取方不会看到写了一半的文件"""
+        tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        with metrics.time_stage("storage_write"):
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+    
+    def _write_files(self, files: List[Tuple[Path, bytes]]) -> None:
+        for file_path, content in files:
+            self.write_atomic(file_path, content)
+    
+    @staticmethod
+    def _read_json(file_path: Path) -> dict | None:
+        try:
+            with open(file_path, 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+    
+    def _status_record(self, folder_name: str, status: str, data: dict = None, timings: dict = None) -> Dict:
+        record = {
+            "folder": folder_name,
+            "status": status,
+            "timestamp": datetime.now().isoformat(),
+            "data": data
+        }
+        if timings:
+            record["timings"] = timings
+        return record
+    
     async def save_image(self, task_id: str, filename: str, file_content: bytes) -> str:
         """保存上传的图片"""
         folder_name = self._create_task_folder(filename)
-        file_path = self.base_path / folder_name / "original.jpg"
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
+        self.cache.discard(folder_name)
+        file_path = self.task_path(folder_name) / "original.jpg"
+        await asyncio.to_thread(self.write_atomic, file_path, file_content)
         return folder_name
     
     async def save_result(self, folder_name: str, data: dict) -> str:
         """保存识别结果JSON"""
-        file_path = self.base_path / folder_name / "result.json"
-        async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        file_path = self.task_path(folder_name) / "result.json"
+        await asyncio.to_thread(self.write_atomic, file_path, self.dumps(data))
         return str(file_path)
     
+    def _read_archived(self, folder_name: str, key: str):
+        """任务文件已被归档时从段文件读取"""
+        from .archive import archive_service
+        record = archive_service.read(folder_name)
+        return record.get(key) if record else None
+    
+    def _read_task_json(self, folder_name: str, file_name: str, archive_key: str) -> dict | None:
+        data = self._read_json(self.task_path(folder_name) / file_name)
+        if data is None:
+            data = self._read_archived(folder_name, archive_key)
+        return data
+    
     async def load_result(self, folder_name: str) -> dict:
         """加载识别结果"""
-        file_path = self.base_path / folder_name / "result.json"
-        if not file_path.exists():
-            return None
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            return json.loads(content)
+        return await asyncio.to_thread(self._read_task_json, folder_name, "result.json", "result")
     
-    async def save_task_status(self, folder_name: str, status: str, data: dict = None) -> str:
-        """保存任务状态"""
-        task_data = {
-            "folder": folder_name,
-            "status": status,
-            "timestamp": datetime.now().isoformat(),
-            "data": data
-        }
-        file_path = self.base_path / folder_name / "status.json"
-        async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(task_data, ensure_ascii=False, indent=2))
+    async def save_task_status(self, folder_name: str, status: str, data: dict = None, timings: dict = None) -> str:
+        """保存任务状态，结束时附带耗时分段"""
+        file_path = self.task_path(folder_name) / "status.json"
+        record = self._status_record(folder_name, status, data, timings)
+        await asyncio.to_thread(self.write_atomic, file_path, self.dumps(record))
+        self.cache.written(folder_name)
+        self.cache.put(folder_name, record)
         return str(file_path)
     
     async def get_task_status(self, folder_name: str) -> dict:
-        """获取任务状态"""
-        file_path = self.base_path / folder_name / "status.json"
-        if not file_path.exists():
+        """获取任务状态，已结束的任务和未知ID优先从内存缓存返回"""
+        cached = self.cache.get(folder_name)
+        if cached is not None:
+            return cached
+        
+        try:
+            self.task_path(folder_name)
+        except ValueError:
             return {"status": "not_found"}
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            return json.loads(content)
+        self.cache.begin_read(folder_name)
+        try:
+            status = await asyncio.to_thread(self._read_task_json, folder_name, "status.json", "status")
+        finally:
+            written = self.cache.end_read(folder_name)
+        if status is None:
+            if not written:
+                self.cache.put_missing(folder_name)
+            return {"status": "not_found"}
+        # 读取期间任务被改写或删除时，读到的可能已是旧值，不缓存
+        if not written:
+            self.cache.put(folder_name, status)
+        return status
+    
+    def _delete_task_dir(self, folder_name: str) -> bool:
+        try:
+            shutil.rmtree(self.task_path(folder_name))
+        except FileNotFoundError:
+            return False
+        return True
+    
+    async def delete_task(self, folder_name: str) -> bool:
+        """删除任务目录并清除缓存的状态，任务目录不存在时返回False"""
+        self.cache.written(folder_name)
+        deleted = await asyncio.to_thread(self._delete_task_dir, folder_name)
+        self.cache.discard(folder_name)
+        return deleted
     
     async def save_ics(self, folder_name: str, ics_content: bytes) -> str:
         """保存ICS文件"""
-        file_path = self.base_path / folder_name / "calendar.ics"
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(ics_content)
+        file_path = self.task_path(folder_name) / "calendar.ics"
+        await asyncio.to_thread(self.write_atomic, file_path, ics_content)
         return str(file_path)
     
+    async def commit_task(self, folder_name: str, result: dict, ics_content: bytes, timings: dict = None) -> Dict:
+        """任务完成时一次性写入结果、ICS和状态；状态最后写入，轮询方看到completed时其余文件已就绪"""
+        folder_path = self.task_path(folder_name)
+        record = self._status_record(folder_name, "completed", result, timings)
+        await asyncio.to_thread(self._write_files, [
+            (folder_path / "result.json", self.dumps(result)),
+            (folder_path / "calendar.ics", ics_content),
+            (folder_path / "status.json", self.dumps(record))
+        ])
+        self.cache.written(folder_name)
+        self.cache.put(folder_name, record)
+        return record
+    
+    def _read_ics(self, folder_name: str) -> bytes | None:
+        try:
+            return self.get_ics_path(folder_name).read_bytes()
+        except FileNotFoundError:
+            ics = self._read_archived(folder_name, "ics")
+            return ics.encode('utf-8') if ics is not None else None
+    
+    async def load_ics(self, folder_name: str) -> bytes | None:
+        """读取ICS内容（含已归档任务）"""
+        return await asyncio.to_thread(self._read_ics, folder_name)
+    
+    def get_preview_path(self, folder_name: str, name: str) -> Path:
+        """获取预览图路径"""
+        return self.task_path(folder_name) / f"preview_{name}.jpg"
+    
+    async def save_previews(self, folder_name: str, previews: Dict[str, bytes]) -> None:
+        """一次写入所有尺寸的预览图"""
+        await asyncio.to_thread(self._write_files, [
+            (self.get_preview_path(folder_name, name), content) for name, content in previews.items()
+        ])
+    
+    async def save_profile(self, folder_name: str, profile: str) -> None:
+        """保存单个请求的采样结果（折叠栈）"""
+        file_path = self.task_path(folder_name) / "profile.txt"
+        await asyncio.to_thread(self.write_atomic, file_path, profile.encode("utf-8"))
+    
     def get_ics_path(self, folder_name: str) -> Path:
         """获取ICS文件路径"""
-        return self.base_path / folder_name / "calendar.ics"
+        return self.task_path(folder_name) / "calendar.ics"
 
-storage_service = StorageService()
\ No newline at end of file
+storage_service = StorageService()
+metrics.cache_hits.set_function(lambda: storage_service.cache.hits)
+metrics.cache_misses.set_function(lambda: storage_service.cache.misses)
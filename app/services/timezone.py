@@ -1,39 +1,125 @@
-import airportsdata
-from timezonefinder import TimezoneFinder
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from zoneinfo import ZoneInfo
+
+from .gazetteer import Gazetteer
+
+# 构建期生成的紧凑索引：{"PEK": ["Asia/Shanghai", "机场名称", "城市", "国家代码"], ...}
+AIRPORT_INDEX_PATH = Path(__file__).resolve().parent.parent / "data" / "airports.json"
+
+
+def build_airport_index() -> Dict[str, List[str]]:
+    """从airportsdata构建IATA→时区索引（airportsdata已自带IANA时区，无需坐标反查）"""
+    import airportsdata
+    
+    index = {}
+    for code, airport in airportsdata.load('IATA').items():
+        if airport.get('tz'):
+            index[code] = [airport['tz'], airport['name'], airport['city'], airport['country']]
+    return index
+
+
+def save_airport_index(index: Dict[str, List[str]], path: Path = AIRPORT_INDEX_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
 
 class TimezoneService:
     def __init__(self):
-        self.airports = airportsdata.load('IATA')
-        self.tf = TimezoneFinder()
+        self._airports = None
+        self.gazetteer = Gazetteer(lambda: self.airports)
+    
+    @property
+    def airports(self) -> Dict[str, List[str]]:
+        """首次使用时加载机场索引"""
+        if self._airports is None:
+            self._airports = self._load_airports()
+        return self._airports
+    
+    def _load_airports(self) -> Dict[str, List[str]]:
+        if AIRPORT_INDEX_PATH.exists():
+            with open(AIRPORT_INDEX_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        
+        # 未在构建期生成索引时现场构建，并尽量写回供下次使用
+        index = build_airport_index()
+        try:
+            save_airport_index(index)
+        except OSError:
+            pass
+        return index
+    
+    def get_airport(self, iata_code: str) -> Optional[Dict[str, str]]:
+        """根据机场IATA代码获取机场信息"""
+        entry = self.airports.get((iata_code or "").strip().upper())
+        if not entry:
+            return None
+        tz, name, city, country = entry
+        return {"tz": tz, "name": name, "city": city, "country": country}
     
     def get_timezone_by_airport(self, iata_code: str) -> str:
         """根据机场IATA代码获取时区"""
-        airport = self.airports.get(iata_code.upper())
-        if airport:
-            lat, lon = airport['lat'], airport['lon']
-            return self.tf.timezone_at(lat=lat, lng=lon)
-        return None
-    
-    def get_timezone_by_city(self, city_name: str, country: str = None) -> str:
-        """根据城市名获取时区（需要地理编码，这里简化处理）"""
-        # 简化的城市时区映射
-        city_timezone_map = {
-            '北京': 'Asia/Shanghai',
-            '上海': 'Asia/Shanghai',
-            '广州': 'Asia/Shanghai',
-            '深圳': 'Asia/Shanghai',
-            '香港': 'Asia/Hong_Kong',
-            '台北': 'Asia/Taipei',
-            '东京': 'Asia/Tokyo',
-            '首尔': 'Asia/Seoul',
-            '新加坡': 'Asia/Singapore',
-            '纽约': 'America/New_York',
-            '洛杉矶': 'America/Los_Angeles',
-            '伦敦': 'Europe/London',
-            '巴黎': 'Europe/Paris',
-            '悉尼': 'Australia/Sydney',
-        }
+        airport = self.get_airport(iata_code)
+        return airport["tz"] if airport else None
+    
+    def enrich(self, ticket: Dict[str, Any]) -> Dict[str, Any]:
+        """识别后处理：用起降机场或场馆所在城市的时区修正模型推断的时区"""
+        details = ticket.get("details") or {}
+        location = ticket.get("location") or {}
+        place_text = " ".join(filter(None, [location.get("name"), location.get("address")]))
+        place_tz = self.gazetteer.find_in_text(place_text)
+        # 仅匹配到机场城市单词的结果不可靠，只用于补全缺失或无效的时区
+        fallback_tz = None if place_tz else self.gazetteer.find_in_text(place_text, airport_words=True)
         
-        return city_timezone_map.get(city_name, 'Asia/Shanghai')
+        start_tz = end_tz = None
+        if ticket.get("type") == "flight":
+            start_tz = self.get_timezone_by_airport(details.get("departure_airport"))
+            end_tz = self.get_timezone_by_airport(details.get("arrival_airport"))
+        start_tz = start_tz or place_tz
+        end_fallback = None
+        if ticket.get("type") in ("concert", "theater", "generic"):
+            # 演出类票据开始和结束在同一场馆
+            end_tz = end_tz or place_tz
+            end_fallback = fallback_tz
+        
+        self._correct_timezone(ticket.get("start"), start_tz, fallback_tz)
+        self._correct_timezone(ticket.get("end"), end_tz, end_fallback)
+        return ticket
+    
+    @staticmethod
+    def _valid_timezone(name: Any) -> bool:
+        try:
+            ZoneInfo(name)
+            return True
+        except (TypeError, ValueError, KeyError):
+            return False
+    
+    def _correct_timezone(self, time_info: Optional[Dict[str, Any]], tz: Optional[str],
+                          fallback: Optional[str] = None) -> None:
+        """票面时间为当地时间，只需更正时区标注；与模型时区同偏移时保持不变。
+        fallback 只在模型未给出有效时区时使用"""
+        if not time_info:
+            return
+        if not tz:
+            if fallback and not self._valid_timezone(time_info.get("timezone")):
+                time_info["timezone"] = fallback
+            return
+        if time_info.get("timezone") == tz:
+            return
+        try:
+            local = datetime.fromisoformat(time_info["datetime"])
+            current = local.replace(tzinfo=ZoneInfo(time_info["timezone"])).utcoffset()
+            if current == local.replace(tzinfo=ZoneInfo(tz)).utcoffset():
+                return
+        except (KeyError, TypeError, ValueError):
+            pass
+        time_info["timezone"] = tz
+    
+    def get_timezone_by_city(self, city_name: str, country: str = None) -> Optional[str]:
+        """根据城市名（中文或拉丁文，支持别名、前缀和模糊匹配）获取时区，未知城市返回None"""
+        return self.gazetteer.lookup(city_name, country)
 
-timezone_service = TimezoneService()
\ No newline at end of file
+timezone_service = TimezoneService()
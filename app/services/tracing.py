@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict
+
+# 流水线阶段归入的任务耗时分段
+STAGE_SPANS = {
+    "decode": "preprocess",
+    "resize": "preprocess",
+    "encode": "preprocess",
+    "previews": "preprocess",
+    "upstream": "upstream",
+    "parse": "parse",
+    "ics": "ics",
+    "storage_write": "persist"
+}
+SPAN_ORDER = ("queued", "preprocess", "upstream", "parse", "ics", "persist")
+
+
+class TaskTrace:
+    """单个任务的耗时分段、图片尺寸和token用量"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.images: Dict[str, Dict[str, int]] = {}
+        self.tokens: Dict[str, int] = {}
+    
+    def add_span(self, span: str, seconds: float) -> None:
+        self.spans[span] = self.spans.get(span, 0.0) + seconds
+    
+    def add_tokens(self, prompt: int, completion: int) -> None:
+        self.tokens["prompt"] = self.tokens.get("prompt", 0) + prompt
+        self.tokens["completion"] = self.tokens.get("completion", 0) + completion
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """写入状态记录的摘要（秒，保留3位小数）"""
+        spans = {name: round(self.spans[name], 3) for name in SPAN_ORDER if name in self.spans}
+        record: Dict[str, Any] = {
+            "total": round(time.perf_counter() - self.started, 3),
+            "spans": spans
+        }
+        if self.images:
+            record["images"] = self.images
+        if self.tokens:
+            record["tokens"] = self.tokens
+        return record
+
+
+_current_trace: ContextVar[TaskTrace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def task_trace():
+    """在此范围内记录当前任务；asyncio.to_thread会复制上下文，线程中的阶段同样计入"""
+    trace = TaskTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> TaskTrace | None:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None and stage in STAGE_SPANS:
+        trace.add_span(STAGE_SPANS[stage], seconds)
+
+
+def record_tokens(prompt: int, completion: int) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt, completion)
+
+
+def record_image(name: str, width: int, height: int, size: int | None = None) -> None:
+    """记录预处理前后的图片尺寸（size为编码后字节数）"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    info = trace.images.setdefault(name, {})
+    info.update({"width": width, "height": height})
+    if size is not None:
+        info["bytes"] = size
@@ -1,99 +1,411 @@
+import asyncio
 import base64
-from openai import OpenAI
+import json
+import re
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+from pydantic import ValidationError
 from ..config import settings
+from ..models.ticket import TicketData
+from . import metrics
+from .recording import RecordingClient, RecordingStore, ReplayClient
+
+TICKET_TEMPLATE = """{
+  "type": "flight|train|concert|theater|generic",
+  "title": "事件标题",
+  "start": {
+    "datetime": "2025-01-01T10:00:00",
+    "timezone": "Asia/Shanghai"
+  },
+  "end": {
+    "datetime": "2025-01-01T12:00:00",
+    "timezone": "Asia/Shanghai"
+  },
+  "location": {
+    "name": "场馆名称",
+    "address": "详细地址"
+  },
+  "details": {
+    "seat": "座位信息",
+    "gate": "登机口/入口",
+    "reference": "订单号/PNR",
+    "departure_airport": "出发机场IATA三字码（仅航班）",
+    "arrival_airport": "到达机场IATA三字码（仅航班）"
+  },
+  "confidence": 0.9
+}"""
+
+TICKET_PROMPT = f"""
+请分析这张票据图片，提取以下信息并以JSON格式返回：
+
+{TICKET_TEMPLATE}
+
+注意：
+1. 根据票据类型识别type字段
+2. 时间格式必须是ISO 8601格式
+3. 时区根据地点推断，中国使用Asia/Shanghai
+4. 如果信息不明确，对应字段设为null
+5. confidence表示识别置信度(0-1)
+6. 只返回JSON，不要其他文字
+"""
+
+REPAIR_PROMPT = """
+下面是从票据图片识别得到的JSON，但未能通过校验：
+
+{content}
+
+校验错误：
+{errors}
+
+请修正上述内容，只返回符合以下结构的JSON，不要其他文字：
+
+{template}
+
+注意：title、start.datetime、start.timezone、location.name为必填；时间为ISO 8601格式；时区为IANA时区名（如Asia/Shanghai）；无法确定的可选字段设为null。
+"""
+
+CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+# 流式识别过程中提前发布的字段
+PARTIAL_FIELDS = ("type", "title", "start")
+# 只在数据块包含可能结束一个字段的字符时重新解析，避免每个数据块都解析整个缓冲区
+PARTIAL_BOUNDARIES = (",", "}", "\n")
+# 部分字段的发布间隔（秒）；字段不变时按心跳间隔重复发布，表明生成仍在进行
+PARTIAL_MIN_INTERVAL = 1.0
+PARTIAL_HEARTBEAT = 10.0
+
+
+def parse_partial_json(text: str) -> dict:
+    """解析尚未生成完整的JSON：截断到最后一个完整值并补齐括号"""
+    start = text.find("{")
+    if start < 0:
+        return {}
+    
+    stack = []
+    in_string = False
+    escaped = False
+    cuts = []
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            cuts.append((index + 1, "".join(reversed(stack))))
+            if not stack:
+                break
+        elif char == ",":
+            cuts.append((index, "".join(reversed(stack))))
+    
+    for end, closing in reversed(cuts):
+        try:
+            data = json.loads(text[start:end] + closing)
+        except ValueError:
+            continue
+        return data if isinstance(data, dict) else {}
+    return {}
+
 
 class VisionService:
     def __init__(self):
         self.client = None
+        self._client_key = None
     
     def _get_client(self):
-        if self.client is None:
-            try:
-                self.client = OpenAI(
-                    api_key=settings.openai_api_key,
-                    base_url=settings.openai_base_url
-                )
-            except TypeError:
-                # 兼容旧版本OpenAI客户端
-                import openai
-                openai.api_key = settings.openai_api_key
-                openai.api_base = settings.openai_base_url
-                self.client = openai
+        # 配置热加载后密钥或地址变化时重建客户端
+        # openai.backend 为 record/replay 时在真实客户端外包装录制或替换为离线回放
+        key = (
+            settings.openai_api_key,
+            settings.openai_base_url,
+            settings.openai_backend,
+            settings.openai_recordings_path
+        )
+        if self.client is None or key != self._client_key:
+            store = RecordingStore(Path(settings.openai_recordings_path))
+            if settings.openai_backend == "replay":
+                self.client = ReplayClient(store)
+            else:
+                # 延迟导入：openai及其类型定义导入耗时较长
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(api_key=key[0], base_url=key[1])
+                self.client = RecordingClient(client, store) if settings.openai_backend == "record" else client
+            self._client_key = key
         return self.client
     
     def encode_image(self, image_content: bytes) -> str:
         """将图片编码为base64"""
         return base64.b64encode(image_content).decode('utf-8')
     
-    async def extract_ticket_info(self, image_content: bytes) -> dict:
-        """从票据图片中提取信息"""
-        base64_image = self.encode_image(image_content)
+    def _image_message(self, prompt: str, base64_image: str) -> list:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+    
+    def _ticket_schema(self) -> dict:
+        """模型输出的JSON Schema（id由服务端生成）"""
+        schema = TicketData.model_json_schema()
+        schema["properties"].pop("id", None)
+        schema["required"] = [name for name in schema.get("required", []) if name != "id"]
+        return schema
+    
+    def _response_format(self, schema: dict | None) -> dict | None:
+        """根据配置请求JSON输出模式"""
+        mode = settings.openai_response_format
+        if mode == "json_schema" and schema:
+            return {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "ticket",
+                    "schema": schema
+                }
+            }
+        if mode in ("json_object", "json_schema"):
+            return {"type": "json_object"}
+        return None
+    
+    def _request_kwargs(self, messages: list, max_tokens: int, schema: dict | None) -> dict:
+        kwargs = {
+            "model": settings.openai_model,
+            "messages": messages,
+            "max_tokens": max_tokens
+        }
+        response_format = self._response_format(schema)
+        if response_format:
+            kwargs["response_format"] = response_format
+        return kwargs
+    
+    async def _complete(self, messages: list, max_tokens: int, schema: dict | None = None) -> str:
+        """调用模型并返回文本内容"""
+        client = self._get_client()
+        with metrics.upstream_call("complete"):
+            response = await client.chat.completions.create(**self._request_kwargs(messages, max_tokens, schema))
+        metrics.record_usage(getattr(response, "usage", None))
+        return response.choices[0].message.content
+    
+    async def _stream_complete(
+        self,
+        messages: list,
+        max_tokens: int,
+        schema: dict | None = None,
+        on_partial: Callable[[dict], Awaitable[None]] | None = None
+    ) -> str:
+        """流式调用模型，增量解析并回调已生成的字段；流停滞超时则中止"""
+        with metrics.upstream_call("stream"):
+            return await self._read_stream(messages, max_tokens, schema, on_partial)
+    
+    async def _read_stream(
+        self,
+        messages: list,
+        max_tokens: int,
+        schema: dict | None,
+        on_partial: Callable[[dict], Awaitable[None]] | None
+    ) -> str:
+        client = self._get_client()
+        kwargs = self._request_kwargs(messages, max_tokens, schema)
+        if settings.openai_stream_usage:
+            # 最后一个数据块附带token用量（choices为空）
+            kwargs["stream_options"] = {"include_usage": True}
+        stream = await client.chat.completions.create(stream=True, **kwargs)
         
-        prompt = """
-        请分析这张票据图片，提取以下信息并以JSON格式返回：
+        idle_timeout = settings.openai_stream_idle_timeout
+        chunks = stream.__aiter__()
+        parts = []
+        published = {}
+        pending = None
+        fields_done = False
+        last_publish = 0.0
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=idle_timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"模型响应流超过{idle_timeout}秒无新内容")
+                
+                metrics.record_usage(getattr(chunk, "usage", None))
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                if not on_partial:
+                    continue
+                
+                if not fields_done and any(mark in delta for mark in PARTIAL_BOUNDARIES):
+                    partial = parse_partial_json("".join(parts))
+                    partial = {key: partial[key] for key in PARTIAL_FIELDS if partial.get(key)}
+                    if partial and partial != published:
+                        pending = partial
+                    # 发布字段都已完整后不再解析
+                    start = partial.get("start")
+                    fields_done = len(partial) == len(PARTIAL_FIELDS) and isinstance(start, dict) \
+                        and bool(start.get("datetime")) and bool(start.get("timezone"))
+                
+                now = time.monotonic()
+                if pending and now - last_publish >= PARTIAL_MIN_INTERVAL:
+                    published, pending, last_publish = pending, None, now
+                    await on_partial(published)
+                elif published and now - last_publish >= PARTIAL_HEARTBEAT:
+                    last_publish = now
+                    await on_partial(published)
+        finally:
+            await stream.close()
         
-        {
-          "type": "flight|train|concert|theater|generic",
-          "title": "事件标题",
-          "start": {
-            "datetime": "2025-01-01T10:00:00",
-            "timezone": "Asia/Shanghai"
-          },
-          "end": {
-            "datetime": "2025-01-01T12:00:00",
-            "timezone": "Asia/Shanghai"
-          },
-          "location": {
-            "name": "场馆名称",
-            "address": "详细地址"
-          },
-          "details": {
-            "seat": "座位信息",
-            "gate": "登机口/入口",
-            "reference": "订单号/PNR"
-          },
-          "confidence": 0.9
-        }
+        return "".join(parts)
+    
+    def extract_json(self, content: str) -> dict:
+        """从模型输出中容错提取JSON对象（兼容代码块和多余文字）"""
+        if not content:
+            raise ValueError("模型返回内容为空")
         
-        注意：
-        1. 根据票据类型识别type字段
-        2. 时间格式必须是ISO 8601格式
-        3. 时区根据地点推断，中国使用Asia/Shanghai
-        4. 如果信息不明确，对应字段设为null
-        5. confidence表示识别置信度(0-1)
-        6. 只返回JSON，不要其他文字
-        """
+        text = content.strip()
+        fence = CODE_FENCE_PATTERN.search(text)
+        if fence:
+            text = fence.group(1)
+        
+        start = text.find("{")
+        if start < 0:
+            raise ValueError("模型返回内容中没有JSON对象")
+        
+        data, _ = json.JSONDecoder().raw_decode(text[start:])
+        if not isinstance(data, dict):
+            raise ValueError("模型返回的JSON不是对象")
+        return data
+    
+    def validate_ticket(self, data: dict) -> dict:
+        """按TicketData校验识别结果，返回规范化后的字典（不含id）"""
+        ticket = TicketData.model_validate({**data, "id": data.get("id") or ""})
+        return ticket.model_dump(exclude={"id"})
+    
+    def parse_ticket(self, content: str) -> dict:
+        """解析并校验模型输出，失败时抛出ValueError"""
+        with metrics.time_stage("parse"):
+            data = self.extract_json(content)
+            try:
+                return self.validate_ticket(data)
+            except ValidationError as e:
+                raise ValueError(self._format_errors(e)) from e
+    
+    def _format_errors(self, error: ValidationError) -> str:
+        lines = []
+        for item in error.errors():
+            field = ".".join(str(part) for part in item["loc"])
+            lines.append(f"- {field}: {item['msg']}")
+        return "\n".join(lines)
+    
+    async def repair_ticket(self, content: str, errors: str) -> dict:
+        """仅发送文本请求修复JSON，不重新发送图片"""
+        prompt = REPAIR_PROMPT.format(content=content, errors=errors, template=TICKET_TEMPLATE)
+        repaired = await self._complete(
+            [{"role": "user", "content": prompt}],
+            settings.openai_max_tokens,
+            self._ticket_schema()
+        )
+        return self.parse_ticket(repaired)
+    
+    async def extract_ticket_info(
+        self,
+        image_content: bytes,
+        on_partial: Callable[[dict], Awaitable[None]] | None = None
+    ) -> dict:
+        """从票据图片中提取信息，流式模式下通过on_partial提前发布部分字段"""
+        base64_image = self.encode_image(image_content)
+        messages = self._image_message(TICKET_PROMPT, base64_image)
         
         try:
-            client = self._get_client()
-            response = client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000
-            )
-            
-            result = response.choices[0].message.content
-            # 尝试解析JSON
-            import json
-            return json.loads(result)
-            
+            if settings.openai_stream:
+                content = await self._stream_complete(
+                    messages,
+                    settings.openai_max_tokens,
+                    self._ticket_schema(),
+                    on_partial
+                )
+            else:
+                content = await self._complete(messages, settings.openai_max_tokens, self._ticket_schema())
         except Exception as e:
+            metrics.errors.inc(cause=metrics.classify_error(e))
             return {
                 "error": str(e),
                 "confidence": 0.0
             }
+        
+        return await self.parse_or_repair(content)
+    
+    async def parse_or_repair(self, content: str) -> dict:
+        """解析模型输出，校验失败时进行文本修复，仍失败则返回error"""
+        try:
+            return self.parse_ticket(content)
+        except ValueError as e:
+            last_error = str(e)
+        
+        for _ in range(settings.openai_repair_attempts):
+            try:
+                return await self.repair_ticket(content, last_error)
+            except Exception as e:
+                last_error = str(e)
+        
+        metrics.errors.inc(cause="validation")
+        return {
+            "error": f"识别结果校验失败: {last_error}",
+            "confidence": 0.0
+        }
+    
+    def build_ticket_request(self, image_content: bytes) -> dict:
+        """构建完整识别请求体（供批处理任务文件使用）"""
+        messages = self._image_message(TICKET_PROMPT, self.encode_image(image_content))
+        return self._request_kwargs(messages, settings.openai_max_tokens, self._ticket_schema())
+    
+    async def extract_flight_times(self, image_content: bytes, boarding_pass: dict) -> dict:
+        """登机牌条码已识别时，仅询问条码中缺失的起降时间"""
+        base64_image = self.encode_image(image_content)
+        
+        flight_date = boarding_pass.get("flight_date")
+        date_hint = f"，日期 {flight_date.isoformat()}" if flight_date else ""
+        date_field = "" if flight_date else '"departure_date": "YYYY-MM-DD",\n          '
+        prompt = f"""
+        这是一张登机牌，已从条码读取航班 {boarding_pass['flight']}，
+        {boarding_pass['from_airport']} → {boarding_pass['to_airport']}{date_hint}。
+        请只从图片中读取以下字段并以JSON格式返回：
+        
+        {{
+          {date_field}"departure_time": "HH:MM",
+          "arrival_time": "HH:MM",
+          "gate": "登机口"
+        }}
+        
+        注意：时间为当地时间24小时制；无法确定的字段设为null；只返回JSON，不要其他文字
+        """
+        
+        # 上游错误直接抛出，由调用方使任务失败，不再重发完整识别请求
+        content = await self._complete(self._image_message(prompt, base64_image), 100)
+        try:
+            return self.extract_json(content)
+        except ValueError as e:
+            return {
+                "error": str(e)
+            }
 
-vision_service = VisionService()
\ No newline at end of file
+vision_service = VisionService()
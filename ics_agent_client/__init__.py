@@ -0,0 +1,10 @@
+"""票据识别转ICS服务的异步Python客户端。
+
+    from ics_agent_client import ICSAgentClient
+
+    async with ICSAgentClient("http://localhost:8000", token="...") as client:
+        result = await client.process("ticket.jpg")
+"""
+from .client import ICSAgentClient, ICSAgentError
+
+__all__ = ["ICSAgentClient", "ICSAgentError"]
@@ -0,0 +1,235 @@
+import asyncio
+import mimetypes
+import random
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+
+import httpx
+
+# 文件路径、原始字节，或 (文件名, 字节)
+FileInput = Union[str, Path, bytes, Tuple[str, bytes]]
+T = TypeVar("T")
+
+RETRY_STATUS = (429, 503)
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class ICSAgentError(Exception):
+    """API返回非2xx状态"""
+    
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析Retry-After（秒数或HTTP日期）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_file(file: FileInput) -> Tuple[str, bytes, str]:
+    if isinstance(file, (str, Path)):
+        path = Path(file)
+        name, content = path.name, path.read_bytes()
+    elif isinstance(file, bytes):
+        name, content = "ticket.jpg", file
+    else:
+        name, content = file
+    content_type = mimetypes.guess_type(name)[0] or "image/jpeg"
+    return name, content, content_type
+
+
+class ICSAgentClient:
+    """异步客户端：复用长连接、限制并发、自动重试429/503并遵循Retry-After"""
+    
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        token: Optional[str] = None,
+        max_concurrency: int = 8,
+        timeout: float = 120.0,
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0
+    ):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency
+            )
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+    
+    async def __aenter__(self) -> "ICSAgentClient":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def aclose(self) -> None:
+        await self._client.aclose()
+    
+    def _delay(self, attempt: int) -> float:
+        # 指数退避加随机抖动，避免大量客户端同时重试
+        return min(self.backoff * (2 ** attempt), self.max_backoff) * (0.5 + random.random() / 2)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """发送请求；429/503及连接失败时重试，其余错误抛出ICSAgentError"""
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # 请求尚未发出，POST重试也不会重复创建任务
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            except httpx.TransportError:
+                if method != "GET" or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                delay = _retry_after(response)
+                await asyncio.sleep(min(delay, self.max_backoff) if delay is not None else self._delay(attempt))
+                attempt += 1
+                continue
+            
+            if response.status_code >= 400:
+                try:
+                    detail = response.json().get("detail")
+                except ValueError:
+                    detail = response.text
+                raise ICSAgentError(response.status_code, detail)
+            return response
+    
+    async def _post_file(self, url: str, file: FileInput, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        name, content, content_type = await asyncio.to_thread(_read_file, file)
+        response = await self._request("POST", url, files={"file": (name, content, content_type)}, params=params)
+        return response.json()
+    
+    async def upload(self, file: FileInput, batch: bool = False) -> Dict[str, Any]:
+        """POST /upload，返回 {"id", "status"}；batch=True 加入服务端延迟批处理"""
+        return await self._post_file("/upload", file, {"batch": "true"} if batch else None)
+    
+    async def process(self, file: FileInput) -> Dict[str, Any]:
+        """POST /process，同步等待识别结果"""
+        return await self._post_file("/process", file)
+    
+    async def result(self, task_id: str, include_timings: bool = False) -> Dict[str, Any]:
+        """GET /result/{id}，include_timings 时附带耗时分段"""
+        params = {"include_timings": "true"} if include_timings else None
+        response = await self._request("GET", f"/result/{task_id}", params=params)
+        return response.json()
+    
+    async def download_ics(self, task_id: str) -> bytes:
+        """GET /ics/{id}，返回ICS内容"""
+        response = await self._request("GET", f"/ics/{task_id}")
+        return response.content
+    
+    async def wait_for_result(
+        self,
+        task_id: str,
+        timeout: Optional[float] = 300.0,
+        poll_interval: float = 0.5,
+        max_interval: float = 10.0
+    ) -> Dict[str, Any]:
+        """轮询直到任务完成或失败；轮询间隔逐步加长，等待期间不占用并发名额"""
+        deadline = time.monotonic() + timeout if timeout else None
+        interval = poll_interval
+        while True:
+            result = await self.result(task_id)
+            if result.get("status") in TERMINAL_STATUSES:
+                return result
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise asyncio.TimeoutError(f"等待任务 {task_id} 超时")
+            await asyncio.sleep(interval)
+            # 批处理任务可能数小时后才完成，间隔放宽到上限
+            interval = min(interval * 1.5, max_interval)
+    
+    async def _map(
+        self,
+        func: Callable[[Any], Awaitable[T]],
+        items: Iterable[Any],
+        return_exceptions: bool
+    ) -> List[Union[T, BaseException]]:
+        """以固定数量的工作协程处理大量输入，结果按输入顺序返回"""
+        items = list(items)
+        results: List[Any] = [None] * len(items)
+        next_index = 0
+        
+        async def worker() -> None:
+            nonlocal next_index
+            while next_index < len(items):
+                index = next_index
+                next_index += 1
+                try:
+                    results[index] = await func(items[index])
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+        
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_concurrency, len(items)) or 1)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # 一个工作协程出错（或调用方取消）时停止其余协程，不留下后台请求
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        return results
+    
+    async def upload_many(
+        self,
+        files: Iterable[FileInput],
+        batch: bool = False,
+        return_exceptions: bool = True
+    ) -> List[Union[Dict[str, Any], BaseException]]:
+        """并发上传多个文件，返回与输入顺序一致的结果（失败项为异常对象）"""
+        return await self._map(lambda file: self.upload(file, batch=batch), files, return_exceptions)
+    
+    async def process_many(
+        self,
+        files: Iterable[FileInput],
+        batch: bool = False,
+        timeout: Optional[float] = None,
+        return_exceptions: bool = True
+    ) -> List[Union[Dict[str, Any], BaseException]]:
+        """上传多个文件并等待全部结果；大量文件可设 batch=True 使用服务端批处理降低成本"""
+        tasks = await self.upload_many(files, batch=batch, return_exceptions=return_exceptions)
+        
+        async def wait(task: Union[Dict[str, Any], BaseException]) -> Dict[str, Any]:
+            if isinstance(task, BaseException):
+                return task
+            return await self.wait_for_result(task["id"], timeout=timeout)
+        
+        # 上传完成后统一等待；轮询请求同样受并发上限约束
+        return await asyncio.gather(*(wait(task) for task in tasks), return_exceptions=return_exceptions)
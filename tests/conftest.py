@@ -0,0 +1,22 @@
+import dataclasses
+
+import pytest
+
+from app.config import settings
+from app.services.storage import ResultCache, storage_service
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """替换当前配置快照中的若干项，测试结束后恢复"""
+    def apply(**changes):
+        monkeypatch.setattr(settings, "_snapshot", dataclasses.replace(settings._snapshot, **changes))
+    return apply
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """存储根目录指向临时目录，并使用空的结果缓存"""
+    monkeypatch.setattr(storage_service, "base_path", tmp_path)
+    monkeypatch.setattr(storage_service, "cache", ResultCache())
+    return storage_service
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from app.services import archive as archive_module
+from app.services.archive import INDEX_FILE, ArchiveService
+from app.services.storage import ResultCache
+
+RESULT = {"type": "concert", "title": "演唱会", "confidence": 0.9}
+ICS = "BEGIN:VCALENDAR\r\nSUMMARY:演唱会\r\nEND:VCALENDAR\r\n"
+
+
+@pytest.fixture
+def archive(storage, configure, monkeypatch):
+    configure(archive_after_days=0, archive_segment_mb=64)
+    service = ArchiveService()
+    monkeypatch.setattr(archive_module, "archive_service", service)
+    return service
+
+
+def make_task(storage, folder_name, status, with_image=True):
+    folder = storage.task_path(folder_name)
+    folder.mkdir(parents=True)
+    if with_image:
+        (folder / "original.jpg").write_bytes(b"jpeg")
+    if status == "completed":
+        asyncio.run(storage.commit_task(folder_name, RESULT, ICS.encode("utf-8")))
+    else:
+        asyncio.run(storage.save_task_status(folder_name, status, {"error": "x"} if status == "failed" else None))
+    # 状态文件早于归档截止时间
+    past = time.time() - 60
+    os.utime(folder / "status.json", (past, past))
+    return folder
+
+
+def test_round_trip_through_segment_and_index(storage, archive):
+    done = make_task(storage, "done", "completed")
+    failed = make_task(storage, "failed", "failed", with_image=False)
+    running = make_task(storage, "running", "processing")
+    status_before = json.loads((done / "status.json").read_bytes())
+
+    report = archive.compact()
+    assert report["archived"] == 2 and report["files"] == 4 and report["errors"] == 0
+    # 原图保留，小文件删除；没有剩余文件的任务目录整个删除
+    assert [path.name for path in done.iterdir()] == ["original.jpg"]
+    assert not failed.exists()
+    assert (running / "status.json").exists() and not archive.contains("running")
+
+    assert archive.read_file("done", "calendar.ics").decode("utf-8") == ICS
+    assert json.loads(archive.read_file("done", "result.json")) == RESULT
+    assert json.loads(archive.read_file("done", "status.json")) == status_before
+    assert archive.read_file("failed", "calendar.ics") is None
+    assert archive.read_file("done", "original.jpg") is None
+    assert archive.entries()["failed"]["status"] == "failed"
+
+    # 存储层对归档任务透明
+    storage.cache = ResultCache()
+    assert asyncio.run(storage.get_task_status("done")) == status_before
+    assert asyncio.run(storage.load_result("done")) == RESULT
+    assert asyncio.run(storage.load_ics("done")).decode("utf-8") == ICS
+
+
+def test_dry_run_only_reports(storage, archive):
+    done = make_task(storage, "done", "completed")
+    report = archive.compact(dry_run=True)
+    assert report["archived"] == 1 and report["bytes_out"] > 0
+    assert (done / "result.json").exists() and not archive.contains("done")
+
+
+def test_records_stay_readable_across_segments(storage, archive, configure):
+    configure(archive_after_days=0, archive_segment_mb=1)
+    # 随机内容几乎不可压缩，每条记录都超过1MB，写完后段文件即满
+    results = {name: {"title": name, "blob": os.urandom(1100 * 1024).hex()} for name in ("a", "b", "c")}
+    for name, result in results.items():
+        make_task(storage, name, "completed")
+        (storage.task_path(name) / "result.json").write_bytes(storage.dumps(result))
+    archive.compact()
+    assert sorted(entry["segment"] for entry in archive.entries().values()) == [1, 2, 3]
+    for name, result in results.items():
+        assert json.loads(archive.read_file(name, "result.json")) == result
+
+
+def test_index_is_rebuilt_from_segments(storage, archive):
+    make_task(storage, "a", "completed")
+    make_task(storage, "b", "failed")
+    archive.compact()
+    original = archive.entries()
+    (archive.root / INDEX_FILE).unlink()
+
+    reopened = ArchiveService()
+    assert reopened.entries() == original
+    assert json.loads(reopened.read_file("a", "result.json")) == RESULT
+
+
+def test_partial_index_line_and_duplicates(storage, archive):
+    make_task(storage, "a", "completed")
+    archive.compact()
+    index_path = archive.root / INDEX_FILE
+    line = index_path.read_text(encoding="utf-8")
+    # 重复归档时以最后一条为准；写入中断的半行被忽略
+    entry = json.loads(line)
+    entry["status"] = "superseded"
+    index_path.write_text(line + json.dumps(entry) + "\n" + line[:20], encoding="utf-8")
+
+    reopened = ArchiveService()
+    assert reopened.entries()["a"]["status"] == "superseded"
+    assert json.loads(reopened.read_file("a", "result.json")) == RESULT
+
+
+def test_index_appended_by_another_process_is_reloaded(storage, archive):
+    make_task(storage, "a", "completed")
+    reader = ArchiveService()
+    assert reader.entries() == {}
+    archive.compact()
+    assert "a" in reader.entries()
+
+
+def test_concurrent_compaction_is_refused(storage, archive):
+    make_task(storage, "a", "completed")
+    with archive._compact_lock:
+        assert archive.compact() is None
+    assert archive.compact()["archived"] == 1
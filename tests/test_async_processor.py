@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+from app.services import async_processor as async_module
+from app.services import tracing
+from app.services.async_processor import AsyncProcessor
+
+
+def test_upload_waiting_for_a_slot_reports_queued(storage, configure, monkeypatch):
+    configure(max_in_flight=1)
+    processor = AsyncProcessor()
+    released = asyncio.Event()
+    
+    async def fake_pipeline(folder_name, image_content, persist_status):
+        await storage.save_task_status(folder_name, "completed", {"title": "ok"})
+        return {"id": folder_name, "status": "completed"}
+    
+    monkeypatch.setattr(processor, "_run_pinned_pipeline", fake_pipeline)
+    
+    async def scenario():
+        async def hold_slot():
+            async with processor.scheduler.slot("other"):
+                await released.wait()
+        
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        folder_name = await processor.submit_task("ticket.jpg", b"image")
+        await asyncio.sleep(0.01)
+        
+        assert processor.queued == 1
+        assert (await storage.get_task_status(folder_name))["status"] == "queued"
+        
+        released.set()
+        await holder
+        for _ in range(100):
+            status = await storage.get_task_status(folder_name)
+            if status["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        assert status["status"] == "completed"
+    
+    asyncio.run(scenario())
+
+
+def test_image_processing_runs_off_the_event_loop(storage, configure, monkeypatch):
+    configure(barcode_enabled=False)
+    processor = AsyncProcessor()
+    threads = []
+    
+    def slow_processing(image_content):
+        threads.append(threading.get_ident())
+        time.sleep(0.2)
+        tracing.record_stage("resize", 0.2)
+        return b"processed", {"thumb": b"thumb"}
+    
+    async def extract(processed_image, on_partial):
+        return {"error": "skip"}
+    
+    async def finish(folder_name, result, persist_status=True):
+        return {"id": folder_name, "status": "failed"}
+    
+    monkeypatch.setattr(async_module.image_processor, "process_with_previews", slow_processing)
+    monkeypatch.setattr(async_module.vision_service, "extract_ticket_info", extract)
+    monkeypatch.setattr(processor, "finish_task", finish)
+    storage.task_path("task").mkdir()
+    
+    async def scenario():
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+        
+        ticking = asyncio.create_task(ticker())
+        with tracing.task_trace() as trace:
+            await processor._run_pinned_pipeline("task", b"image", False)
+        ticking.cancel()
+        return ticks, trace
+    
+    ticks, trace = asyncio.run(scenario())
+    assert threads and threads[0] != threading.get_ident()
+    # 处理图片期间事件循环仍在调度其他协程
+    assert ticks >= 5
+    # 线程中记录的阶段耗时仍计入当前任务
+    assert trace.spans["preprocess"] >= 0.2
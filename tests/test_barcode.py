@@ -0,0 +1,120 @@
+from datetime import date
+
+import pytest
+
+from app.models.ticket import TicketData
+from app.services.barcode import BarcodeService
+
+# IATA BCBP示例登机牌：单航段，YUL→FRA，AC834，第326天，座位1A
+SINGLE_LEG = "M1DESMARAIS/LUC       EABC123 YULFRAAC 0834 326J001A0025 100"
+SECOND_LEG = "ABC123 FRAPEKLH 0720 327C012C0011 100"
+
+
+@pytest.fixture
+def service():
+    return BarcodeService()
+
+
+def test_single_leg_fields_are_normalized(service):
+    bcbp = service.parse_bcbp(SINGLE_LEG)
+    assert bcbp["passenger_name"] == "DESMARAIS/LUC"
+    leg = bcbp["legs"][0]
+    assert leg["pnr"] == "ABC123"
+    assert (leg["from_airport"], leg["to_airport"]) == ("YUL", "FRA")
+    assert leg["flight"] == "AC834"
+    assert leg["compartment"] == "J"
+    assert leg["seat"] == "1A"
+    assert (leg["flight_date"].month, leg["flight_date"].day) == (11, 22)
+
+
+def test_conditional_section_is_skipped_to_reach_the_next_leg(service):
+    text = "M2" + SINGLE_LEG[2:] + SECOND_LEG
+    legs = service.parse_bcbp(text)["legs"]
+    assert [leg["flight"] for leg in legs] == ["AC834", "LH720"]
+    assert legs[1]["from_airport"] == "FRA" and legs[1]["seat"] == "12C"
+
+
+def test_flight_number_suffix_is_kept(service):
+    text = SINGLE_LEG.replace("AC 0834 ", "AC 0834A")
+    assert service.parse_bcbp(text)["legs"][0]["flight"] == "AC834A"
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "https://example.com/ticket/123",
+    SINGLE_LEG[:50],
+    "X" + SINGLE_LEG[1:],
+    SINGLE_LEG.replace("YULFRA", "123456"),
+    SINGLE_LEG.replace(" 100", " 1ZZ"),
+])
+def test_non_bcbp_content_is_rejected(service, text):
+    assert service.parse_bcbp(text) is None
+
+
+@pytest.mark.parametrize("day, today, expected", [
+    (326, date(2025, 11, 1), date(2025, 11, 22)),
+    # 年初扫描上一年年末的登机牌
+    (365, date(2026, 1, 2), date(2025, 12, 31)),
+    # 年末扫描下一年年初的登机牌
+    (3, date(2025, 12, 30), date(2026, 1, 3)),
+    (366, date(2025, 6, 1), date(2024, 12, 31)),
+    (0, date(2025, 6, 1), None),
+])
+def test_julian_date_resolves_to_the_nearest_year(service, day, today, expected):
+    assert service._resolve_julian_date(day, today) == expected
+
+
+def boarding_pass(service, flight_date=date(2025, 11, 22)):
+    leg = dict(service.parse_bcbp(SINGLE_LEG)["legs"][0])
+    leg.update({
+        "flight_date": flight_date,
+        "from_timezone": "America/Toronto",
+        "to_timezone": "Europe/Berlin",
+        "from_name": "Montréal-Trudeau",
+    })
+    return leg
+
+
+def test_build_ticket_produces_valid_ticket_data(service):
+    ticket = service.build_ticket(boarding_pass(service), {"departure_time": "18:40", "arrival_time": "07:55", "gate": "52"})
+    TicketData(id="t", **ticket)
+    assert ticket["title"] == "AC834 YUL → FRA"
+    assert ticket["start"] == {"datetime": "2025-11-22T18:40:00", "timezone": "America/Toronto"}
+    # 当地时间到达早于出发，视为次日到达
+    assert ticket["end"] == {"datetime": "2025-11-23T07:55:00", "timezone": "Europe/Berlin"}
+    assert ticket["details"]["seat"] == "1A" and ticket["details"]["gate"] == "52"
+    assert ticket["details"]["reference"] == "ABC123"
+
+
+def test_build_ticket_compares_arrival_in_utc(service):
+    # 多伦多18:40出发即UTC 23:40，柏林23:30到达即UTC 22:30，按当地时间比较会误判为当天到达
+    ticket = service.build_ticket(boarding_pass(service), {"departure_time": "10:00", "arrival_time": "23:30"})
+    assert ticket["end"]["datetime"] == "2025-11-22T23:30:00"
+    ticket = service.build_ticket(boarding_pass(service), {"departure_time": "18:40", "arrival_time": "23:30"})
+    assert ticket["end"]["datetime"] == "2025-11-23T23:30:00"
+
+
+def test_build_ticket_falls_back_to_extracted_date(service):
+    ticket = service.build_ticket(
+        boarding_pass(service, flight_date=None),
+        {"departure_date": "2025-12-01", "departure_time": "09:05"}
+    )
+    assert ticket["start"]["datetime"] == "2025-12-01T09:05:00"
+    assert ticket["end"] is None
+
+
+@pytest.mark.parametrize("times", [
+    {},
+    {"departure_time": "soon"},
+    {"departure_date": "not a date", "departure_time": "09:05"},
+])
+def test_build_ticket_requires_date_and_departure_time(service, times):
+    assert service.build_ticket(boarding_pass(service, flight_date=None), times) is None
+
+
+def test_scan_uses_the_first_bcbp_barcode(service, monkeypatch):
+    monkeypatch.setattr(service, "decode", lambda image: ["https://example.com", SINGLE_LEG])
+    leg = service.scan(b"image")
+    assert leg["flight"] == "AC834" and leg["passenger_name"] == "DESMARAIS/LUC"
+    assert leg["from_timezone"] == "America/Toronto" and leg["to_timezone"] == "Europe/Berlin"
+    assert service.can_build(leg)
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.services import batch as batch_module
+from app.services import metrics
+from app.services.batch import BatchProcessor
+
+TICKET = {
+    "type": "concert",
+    "title": "Concert",
+    "start": {"datetime": "2025-07-01T19:30:00", "timezone": "Asia/Shanghai"},
+    "location": {"name": "Arena"},
+    "details": {},
+    "confidence": 0.9,
+}
+
+
+def output_line(custom_id, content, usage=None):
+    body = {"choices": [{"message": {"content": content}}]}
+    if usage:
+        body["usage"] = usage
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": body}})
+
+
+class FakeClient:
+    def __init__(self, text, download_failures=0):
+        self.text = text
+        self.download_failures = download_failures
+        self.batches = SimpleNamespace(retrieve=self.retrieve)
+        self.files = SimpleNamespace(content=self.content)
+    
+    async def retrieve(self, batch_id):
+        return SimpleNamespace(status="completed", output_file_id="out", error_file_id=None)
+    
+    async def content(self, file_id):
+        if self.download_failures:
+            self.download_failures -= 1
+            raise ConnectionError("reset")
+        return SimpleNamespace(text=self.text)
+
+
+def run_poll(client, folders, storage, monkeypatch, owners=None):
+    processor = BatchProcessor()
+    processor._owners.update(owners or {})
+    monkeypatch.setattr(processor, "_get_client", lambda: client)
+    finished = {}
+    
+    async def finish_task(folder_name, result):
+        finished[folder_name] = result
+        return {"id": folder_name, "status": "failed" if "error" in result else "completed"}
+    
+    monkeypatch.setattr(batch_module.async_processor, "finish_task", finish_task)
+    asyncio.run(processor._poll("batch_1", folders))
+    return finished
+
+
+def test_malformed_output_line_only_affects_its_task(storage, configure, monkeypatch):
+    configure(batch_poll_interval=0, openai_repair_attempts=0)
+    text = "\n".join([output_line("a", json.dumps(TICKET)), '{"custom_id": "b", "resp', ""])
+    finished = run_poll(FakeClient(text), ["a", "b"], storage, monkeypatch)
+    assert finished["a"]["title"] == "Concert"
+    assert "error" in finished["b"]
+
+
+def test_transient_download_failure_is_retried(storage, configure, monkeypatch):
+    configure(batch_poll_interval=0, openai_repair_attempts=0)
+    client = FakeClient(output_line("a", json.dumps(TICKET)), download_failures=2)
+    finished = run_poll(client, ["a"], storage, monkeypatch)
+    assert finished["a"]["title"] == "Concert"
+
+
+def test_download_failing_every_attempt_fails_tasks_with_the_cause(storage, configure, monkeypatch):
+    configure(batch_poll_interval=0, openai_repair_attempts=0)
+    storage.task_path("a").mkdir()
+    client = FakeClient("", download_failures=batch_module.BATCH_DOWNLOAD_ATTEMPTS)
+    finished = run_poll(client, ["a"], storage, monkeypatch)
+    assert finished == {}
+    status = asyncio.run(storage.get_task_status("a"))
+    assert status["status"] == "failed" and "下载失败" in status["data"]["error"]
+
+
+def test_finished_tasks_are_counted_against_their_token(storage, configure, monkeypatch):
+    configure(batch_poll_interval=0, openai_repair_attempts=0)
+    usage = {"prompt_tokens": 100, "completion_tokens": 20}
+    text = "\n".join([output_line("a", json.dumps(TICKET), usage), output_line("b", "not json")])
+    before = dict(metrics.client_tasks._values), dict(metrics.client_tokens._values)
+    run_poll(FakeClient(text), ["a", "b"], storage, monkeypatch, owners={"a": "bulk", "b": "bulk"})
+    
+    def delta(counter, snapshot, *labels):
+        return counter._values.get(labels, 0) - snapshot.get(labels, 0)
+    
+    assert delta(metrics.client_tasks, before[0], "bulk", "completed") == 1
+    assert delta(metrics.client_tasks, before[0], "bulk", "failed") == 1
+    assert delta(metrics.client_tokens, before[1], "bulk", "prompt") == 100
+    assert delta(metrics.client_tokens, before[1], "bulk", "completion") == 20
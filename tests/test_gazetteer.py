@@ -0,0 +1,81 @@
+import pytest
+
+from app.services.gazetteer import Gazetteer
+from app.services.timezone import TimezoneService
+
+# 与真实机场索引同形：{"IATA": [时区, 机场名称, 城市, 国家代码]}
+AIRPORTS = {
+    "HWO": ["America/New_York", "North Perry Airport", "Hollywood", "US"],
+    "IDP": ["America/Chicago", "Independence Municipal Airport", "Independence", "US"],
+    "YYJ": ["America/Vancouver", "Victoria International Airport", "Victoria", "CA"],
+    "YWH": ["America/Vancouver", "Victoria Inner Harbour Airport", "Victoria", "CA"],
+    "MSN": ["America/Chicago", "Dane County Regional Airport", "Madison", "US"],
+    "BIL": ["America/Denver", "Billings Logan International Airport", "Billings", "US"],
+    "LAX": ["America/Los_Angeles", "Los Angeles International Airport", "Los Angeles", "US"],
+}
+
+
+@pytest.fixture
+def service():
+    service = TimezoneService()
+    service._airports = AIRPORTS
+    return service
+
+
+@pytest.mark.parametrize("text", [
+    "Hollywood Bowl",
+    "Independence Hall",
+    "Victoria Theatre",
+    "Madison Square Garden",
+])
+def test_airport_city_word_is_ignored_in_text(text):
+    assert Gazetteer(lambda: AIRPORTS).find_in_text(text) is None
+
+
+def test_airport_city_word_used_on_request():
+    gazetteer = Gazetteer(lambda: AIRPORTS)
+    assert gazetteer.find_in_text("Billings Arena", airport_words=True) == "America/Denver"
+
+
+def test_multi_word_airport_city_still_matches():
+    gazetteer = Gazetteer(lambda: AIRPORTS)
+    assert gazetteer.find_in_text("Hollywood Bowl, Los Angeles, CA") == "America/Los_Angeles"
+
+
+@pytest.mark.parametrize("name, model_tz", [
+    ("Hollywood Bowl", "America/Los_Angeles"),
+    ("Independence Hall", "America/New_York"),
+    ("Victoria Theatre", "Asia/Singapore"),
+    ("Madison Square Garden", "America/New_York"),
+])
+def test_valid_model_timezone_is_kept(service, name, model_tz):
+    ticket = {
+        "type": "concert",
+        "location": {"name": name},
+        "start": {"datetime": "2025-07-01T19:30:00", "timezone": model_tz},
+        "end": {"datetime": "2025-07-01T22:00:00", "timezone": model_tz},
+    }
+    service.enrich(ticket)
+    assert ticket["start"]["timezone"] == model_tz
+    assert ticket["end"]["timezone"] == model_tz
+
+
+@pytest.mark.parametrize("model_tz", [None, "", "Pacific/Nowhere"])
+def test_airport_city_word_fills_missing_timezone(service, model_tz):
+    ticket = {
+        "type": "concert",
+        "location": {"name": "Billings Arena"},
+        "start": {"datetime": "2025-07-01T19:30:00", "timezone": model_tz},
+    }
+    service.enrich(ticket)
+    assert ticket["start"]["timezone"] == "America/Denver"
+
+
+def test_curated_city_overrides_wrong_model_timezone(service):
+    ticket = {
+        "type": "concert",
+        "location": {"name": "Royal Albert Hall", "address": "Kensington Gore, London"},
+        "start": {"datetime": "2025-07-01T19:30:00", "timezone": "Asia/Shanghai"},
+    }
+    service.enrich(ticket)
+    assert ticket["start"]["timezone"] == "Europe/London"
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.async_processor import async_processor
+from app.services.health import HealthService
+
+
+def test_concurrent_storage_probes_do_not_interfere(storage):
+    health = HealthService()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: health._check_storage(), range(200)))
+    assert all(result["writable"] for result in results)
+    assert not list(storage.base_path.iterdir())
+
+
+def test_queue_saturates_without_a_global_cap(configure, monkeypatch):
+    configure(max_in_flight=0, max_workers=4, health_max_queued=5)
+    monkeypatch.setattr(async_processor.scheduler, "queued", 0)
+    monkeypatch.setattr(async_processor.scheduler, "in_flight", 8)
+    check = HealthService()._check_queue()
+    assert check["backlog"] == 4 and check["ok"]
+    
+    monkeypatch.setattr(async_processor.scheduler, "in_flight", 9)
+    assert not HealthService()._check_queue()["ok"]
+
+
+def test_queue_counts_waiting_tasks_with_a_global_cap(configure, monkeypatch):
+    configure(max_in_flight=2, health_max_queued=3)
+    monkeypatch.setattr(async_processor.scheduler, "queued", 3)
+    monkeypatch.setattr(async_processor.scheduler, "in_flight", 2)
+    check = HealthService()._check_queue()
+    assert check["backlog"] == 3 and not check["ok"]
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image
+
+from app.services import image_processor as image_module
+from app.services.image_processor import ImageProcessor
+
+
+def jpeg(width, height):
+    output = BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def test_each_stage_is_timed_once_without_nesting(configure, monkeypatch):
+    configure(image_resize=True, image_max_width=1024, image_max_height=1024, image_preview_sizes={"thumb": 160, "preview": 640})
+    active = []
+    timed = []
+    
+    @contextmanager
+    def time_stage(stage):
+        # 嵌套计时会把内层耗时重复计入同一任务的preprocess分段
+        assert not active, f"{stage} 在 {active[-1]} 内计时"
+        active.append(stage)
+        try:
+            yield
+        finally:
+            active.pop()
+            timed.append(stage)
+    
+    monkeypatch.setattr(image_module, "time_stage", time_stage)
+    processed, previews = ImageProcessor().process_with_previews(jpeg(2000, 1000))
+    assert timed == ["decode", "resize", "encode", "previews"]
+    assert set(previews) == {"thumb", "preview"}
+    assert Image.open(BytesIO(previews["thumb"])).size == (160, 80)
+    assert Image.open(BytesIO(processed)).size == (1024, 512)
@@ -0,0 +1,47 @@
+import pytest
+
+from app.config import ApiClient
+from app.services import quota as quota_module
+from app.services.quota import QuotaService
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(quota_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_retry_after_counts_from_the_oldest_request_in_the_window(configure, clock):
+    configure(api_clients=(ApiClient("bulk", "b", requests_per_minute=2),))
+    quota = QuotaService()
+    assert quota.acquire("bulk") is None
+    clock[0] += 10
+    assert quota.acquire("bulk") is None
+    clock[0] += 10
+    assert quota.acquire("bulk") == pytest.approx(40)
+    # 被拒绝的请求不计入窗口
+    assert quota.recent("bulk") == 2
+
+
+def test_window_slides_instead_of_resetting(configure, clock):
+    configure(api_clients=(ApiClient("bulk", "b", requests_per_minute=2),))
+    quota = QuotaService()
+    quota.acquire("bulk")
+    clock[0] += 10
+    quota.acquire("bulk")
+    clock[0] += 50
+    # 第一个请求恰好滑出窗口
+    assert quota.acquire("bulk") is None
+    clock[0] += 1
+    assert quota.acquire("bulk") == pytest.approx(9)
+    assert quota.recent("bulk") == 2
+
+
+def test_unlimited_and_unknown_clients_are_never_rejected(configure, clock):
+    configure(api_clients=(ApiClient("ui", "u"),))
+    quota = QuotaService()
+    for _ in range(100):
+        assert quota.acquire("ui") is None
+        assert quota.acquire("anonymous") is None
+    assert quota.recent("ui") == 100
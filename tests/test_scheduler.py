@@ -0,0 +1,155 @@
+import asyncio
+
+from app.config import ApiClient
+from app.services.scheduler import FairScheduler
+
+CLIENTS = (ApiClient("bulk", "b", weight=1), ApiClient("ui", "u", weight=3))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_slots_are_shared_by_weight(configure):
+    configure(max_in_flight=1, api_clients=CLIENTS)
+    scheduler = FairScheduler()
+    order = []
+    
+    async def work(client):
+        async with scheduler.slot(client):
+            order.append(client)
+            await asyncio.sleep(0)
+    
+    async def main():
+        async with scheduler.slot("anonymous"):
+            tasks = [asyncio.create_task(work("bulk")) for _ in range(4)]
+            tasks += [asyncio.create_task(work("ui")) for _ in range(6)]
+            await settle()
+            assert scheduler.queued == 10 and scheduler.in_flight == 1
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(main())
+    # 虚拟时间相同时按令牌名称排序；ui每个名额只增加1/3
+    assert order == ["bulk", "ui", "ui", "ui", "bulk", "ui", "ui", "ui", "bulk", "bulk"]
+    assert scheduler.queued == scheduler.in_flight == 0 and scheduler.usage() == {}
+
+
+def test_idle_client_does_not_bank_credit(configure):
+    configure(max_in_flight=1, api_clients=(ApiClient("bulk", "b"), ApiClient("ui", "u")))
+    scheduler = FairScheduler()
+    order = []
+    
+    async def work(client):
+        async with scheduler.slot(client):
+            order.append(client)
+            await asyncio.sleep(0)
+    
+    async def main():
+        async with scheduler.slot("bulk"):
+            tasks = [asyncio.create_task(work("bulk")) for _ in range(6)]
+            await settle()
+        while len(order) < 3:
+            await asyncio.sleep(0)
+        tasks += [asyncio.create_task(work("ui")) for _ in range(3)]
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(main())
+    # ui空闲期间bulk用掉的名额不折算成ui的额度，ui开始提交后两者轮流
+    assert order == ["bulk"] * 4 + ["ui", "bulk", "ui", "bulk", "ui"]
+
+
+def test_per_client_concurrency_cap(configure):
+    configure(max_in_flight=0, api_clients=(ApiClient("bulk", "b", max_concurrency=2),))
+    scheduler = FairScheduler()
+    
+    async def main():
+        gate = asyncio.Event()
+        
+        async def work():
+            async with scheduler.slot("bulk"):
+                await gate.wait()
+        
+        tasks = [asyncio.create_task(work()) for _ in range(5)]
+        await settle()
+        assert scheduler.usage() == {"bulk": {"queued": 3, "in_flight": 2}}
+        gate.set()
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
+
+
+def test_cancel_while_queued_frees_the_queue_entry(configure):
+    configure(max_in_flight=1, api_clients=CLIENTS)
+    scheduler = FairScheduler()
+    
+    async def waiting():
+        async with scheduler.slot("ui"):
+            raise AssertionError("已取消的任务不应分到名额")
+    
+    async def main():
+        async with scheduler.slot("bulk"):
+            task = asyncio.create_task(waiting())
+            await settle()
+            assert scheduler.usage()["ui"] == {"queued": 1, "in_flight": 0}
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert scheduler.queued == 0 and "ui" not in scheduler.usage()
+        # 取消的任务没有占用名额，后续请求立即可用
+        async with scheduler.slot("ui"):
+            assert scheduler.in_flight == 1
+    
+    asyncio.run(main())
+    assert scheduler.queued == scheduler.in_flight == 0
+
+
+def test_cancel_after_dispatch_releases_the_slot(configure):
+    configure(max_in_flight=1, api_clients=CLIENTS)
+    scheduler = FairScheduler()
+    entered = []
+    
+    async def work(client):
+        async with scheduler.slot(client):
+            entered.append(client)
+    
+    async def main():
+        async with scheduler.slot("bulk"):
+            dispatched = asyncio.create_task(work("ui"))
+            following = asyncio.create_task(work("bulk"))
+            await settle()
+        # 退出时名额已交给ui，但ui的任务尚未恢复执行就被取消
+        assert scheduler.in_flight == 1 and scheduler.queued == 1
+        dispatched.cancel()
+        await asyncio.gather(dispatched, following, return_exceptions=True)
+    
+    asyncio.run(main())
+    assert entered == ["bulk"]
+    assert scheduler.queued == scheduler.in_flight == 0 and scheduler.usage() == {}
+
+
+def test_new_event_loop_discards_state_of_the_old_one(configure):
+    configure(max_in_flight=1, api_clients=CLIENTS)
+    scheduler = FairScheduler()
+    
+    async def hold():
+        async with scheduler.slot("bulk"):
+            await asyncio.Event().wait()
+    
+    async def abandon():
+        asyncio.create_task(hold())
+        asyncio.create_task(hold())
+        await settle()
+    
+    # 模拟命令行工具：事件循环结束时仍有任务占着名额和排队
+    loop = asyncio.new_event_loop()
+    loop.set_exception_handler(lambda loop, context: None)
+    loop.run_until_complete(abandon())
+    loop.close()
+    assert scheduler.in_flight == 1 and scheduler.queued == 1
+    
+    async def main():
+        async with scheduler.slot("bulk"):
+            return scheduler.in_flight
+    
+    assert asyncio.run(asyncio.wait_for(main(), 1)) == 1
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import result as result_api
+from app.services.storage import ResultCache
+
+
+@pytest.mark.parametrize("folder_name", ["", ".", "..", ".archive", ".profiles", "a/b", "a\\b"])
+def test_task_path_rejects_internal_and_unsafe_names(storage, folder_name):
+    with pytest.raises(ValueError):
+        storage.task_path(folder_name)
+
+
+def test_task_path_shards_new_ids_and_keeps_legacy_names_flat(storage):
+    assert storage.relative_path("20250115_143025_123_3fa9c2d1_ticket") == "2025/01/15/3f/20250115_143025_123_3fa9c2d1_ticket"
+    assert storage.relative_path("2024_05_01_08_30_00_ticket") == "2024_05_01_08_30_00_ticket"
+
+
+def finished_task(storage, folder_name):
+    storage.task_path(folder_name).mkdir(parents=True)
+    asyncio.run(storage.commit_task(folder_name, {"title": "Concert"}, b"BEGIN:VCALENDAR"))
+
+
+def test_deleted_task_is_not_served_from_cache(storage):
+    finished_task(storage, "done")
+    assert asyncio.run(storage.get_task_status("done"))["status"] == "completed"
+    assert asyncio.run(storage.delete_task("done"))
+    assert not storage.task_path("done").exists()
+    assert asyncio.run(storage.get_task_status("done")) == {"status": "not_found"}
+    assert not asyncio.run(storage.delete_task("done"))
+
+
+def test_status_read_during_delete_is_not_cached(storage, monkeypatch):
+    finished_task(storage, "done")
+    storage.cache = ResultCache()
+    read = storage._read_task_json
+    
+    def read_then_delete(folder_name, file_name, archive_key):
+        # 读取完成后、写入缓存前任务被删除
+        data = read(folder_name, file_name, archive_key)
+        asyncio.run(storage.delete_task(folder_name))
+        return data
+    
+    monkeypatch.setattr(storage, "_read_task_json", read_then_delete)
+    assert asyncio.run(storage.get_task_status("done"))["status"] == "completed"
+    monkeypatch.setattr(storage, "_read_task_json", read)
+    assert asyncio.run(storage.get_task_status("done")) == {"status": "not_found"}
+
+
+def test_delete_endpoint_refuses_unfinished_and_archived_tasks(storage, monkeypatch):
+    storage.task_path("running").mkdir(parents=True)
+    asyncio.run(storage.save_task_status("running", "processing"))
+    finished_task(storage, "archived")
+    monkeypatch.setattr(result_api.archive_service, "contains", lambda folder_name: folder_name == "archived")
+    for folder_name, code in (("missing", 404), ("running", 409), ("archived", 409)):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(result_api.delete_result(folder_name))
+        assert error.value.status_code == code
+    assert storage.task_path("running").exists() and storage.task_path("archived").exists()
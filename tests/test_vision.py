@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from app.services.vision import parse_partial_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", {}),
+    ("模型还没有输出JSON", {}),
+    ('{"title": "Con', {}),
+    ('{"title": "Concert", "type": "con', {"title": "Concert"}),
+    ('{"title": "Concert", "start": {"datetime": "2025-07-01T19:30', {"title": "Concert"}),
+    ('{"details": {"seats": ["A1", "A2", "A', {"details": {"seats": ["A1", "A2"]}}),
+    ('{"details": {"seats": ["A1"]}, ', {"details": {"seats": ["A1"]}}),
+    ('{"title": "Concert", "ok": tr', {"title": "Concert"}),
+])
+def test_truncated_output_keeps_complete_values(text, expected):
+    assert parse_partial_json(text) == expected
+
+
+def test_separators_inside_strings_are_not_cut_points():
+    text = '{"title": "A, B {and} [C] \\"D,\\"", "venue": "Hall, 2'
+    assert parse_partial_json(text) == {"title": 'A, B {and} [C] "D,"'}
+
+
+def test_surrounding_text_is_ignored():
+    ticket = {"title": "Concert", "confidence": 0.9}
+    text = "```json\n" + json.dumps(ticket) + "\n```\n以上为识别结果"
+    assert parse_partial_json(text) == ticket
+
+
+def test_every_prefix_of_a_complete_document_parses():
+    ticket = {
+        "type": "flight",
+        "title": "CA1234 北京-上海",
+        "start": {"datetime": "2025-07-01T08:00:00", "timezone": "Asia/Shanghai"},
+        "details": {"seats": ["12A", "12B"], "note": "含\"引号\", 和逗号"},
+        "confidence": 0.95,
+    }
+    text = json.dumps(ticket, ensure_ascii=False)
+    previous = {}
+    for end in range(len(text) + 1):
+        data = parse_partial_json(text[:end])
+        assert isinstance(data, dict)
+        # 已经解析出的顶层字段不会在后续前缀中消失
+        assert set(previous) <= set(data)
+        previous = data
+    assert previous == ticket
+
+
+def test_top_level_array_is_not_a_ticket():
+    assert parse_partial_json("[1, 2, 3]") == {}
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""热点函数微基准：图片预处理、ICS生成、存储读写和base64编码。
+
+用法:
+    python -m tools.benchmark                              # 运行全部并打印结果
+    python -m tools.benchmark --output bench.json          # 保存为JSON
+    python -m tools.benchmark --compare baseline.json      # 与基线对比，退化超过阈值时退出码为1
+    python -m tools.benchmark --filter process_image --quick
+
+需在项目根目录运行。存储基准写入临时目录；输入图片为固定随机种子生成的合成图片，
+各次运行之间可比。每项先自动确定循环次数（单轮不少于 --min-time 秒），再重复多轮取中位数。
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+IMAGE_SIZES = {"small": (800, 600), "medium": (1600, 1200), "large": (3024, 4032)}
+IMAGE_FORMATS = ("JPEG", "PNG")
+BULK_TICKETS = 100
+DEFAULT_THRESHOLD = 0.15
+
+
+def make_image(width: int, height: int, image_format: str) -> bytes:
+    """带色块和噪点的合成票据图片（纯色图片的编码耗时不具代表性）"""
+    import random
+    from PIL import Image, ImageDraw
+    
+    rng = random.Random(width * height)
+    image = Image.effect_noise((width, height), 24).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle((x, y, x + rng.randrange(20, 400), y + rng.randrange(10, 80)), fill=(rng.randrange(256), 60, 120))
+    output = BytesIO()
+    image.save(output, format=image_format, quality=90)
+    return output.getvalue()
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """先倍增循环次数直到单轮耗时不少于min_time，再重复repeat轮，返回每次调用的耗时统计"""
+    func()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat
+    }
+
+
+class BenchmarkSuite:
+    def __init__(self, storage_dir: Path):
+        from app.config import settings
+        from app.services.ics import ics_service
+        from app.services.image_processor import image_processor
+        from app.services.storage import StorageService
+        from app.services.vision import vision_service
+        
+        self.settings = settings
+        self.ics = ics_service
+        self.images = image_processor
+        self.vision = vision_service
+        self.storage = StorageService()
+        self.storage.base_path = storage_dir
+        self.loop = asyncio.new_event_loop()
+    
+    def close(self) -> None:
+        self.loop.close()
+    
+    def _run(self, coro_factory: Callable[[], Any]) -> Callable[[], Any]:
+        return lambda: self.loop.run_until_complete(coro_factory())
+    
+    def _configs(self) -> Dict[str, Any]:
+        base = self.settings.snapshot()
+        configs = {
+            "default": dataclasses.replace(base, image_resize=True, image_denoise=False, image_auto_rotate=True),
+            "no_resize": dataclasses.replace(base, image_resize=False, image_denoise=False)
+        }
+        try:
+            import cv2  # noqa: F401
+            configs["denoise"] = dataclasses.replace(base, image_resize=True, image_denoise=True)
+        except ImportError:
+            pass
+        return configs
+    
+    def _tickets(self) -> List[Dict[str, Any]]:
+        from tools.stub_openai import CANNED_TICKETS
+        
+        return [
+            {**self.vision.validate_ticket(ticket), "id": f"bench_{name}"}
+            for name, ticket in CANNED_TICKETS.items()
+        ]
+    
+    def cases(self) -> List[Tuple[str, Callable[[], Any]]]:
+        cases = []
+        images = {
+            (size, image_format): make_image(*IMAGE_SIZES[size], image_format)
+            for size in IMAGE_SIZES for image_format in IMAGE_FORMATS
+        }
+        
+        for config_name, snapshot in self._configs().items():
+            for (size, image_format), content in images.items():
+                def process(content=content, snapshot=snapshot):
+                    with self.settings.pinned(snapshot):
+                        return self.images.process_image(content)
+                cases.append((f"process_image[{config_name}-{size}-{image_format.lower()}]", process))
+        
+        for size in IMAGE_SIZES:
+            content = images[(size, "JPEG")]
+            cases.append((f"encode_image[{size}]", lambda content=content: self.vision.encode_image(content)))
+        
+        tickets = self._tickets()
+        cases.append(("generate_ics[single]", lambda: self.ics.generate_ics(tickets[0])))
+        bulk = [tickets[index % len(tickets)] for index in range(BULK_TICKETS)]
+        cases.append((f"generate_ics[bulk{BULK_TICKETS}]", lambda: [self.ics.generate_ics(ticket) for ticket in bulk]))
+        
+        cases.extend(self._storage_cases(tickets[0], images[("medium", "JPEG")]))
+        return cases
+    
+    def _storage_cases(self, ticket: Dict[str, Any], image: bytes) -> List[Tuple[str, Callable[[], Any]]]:
+        storage = self.storage
+        folder_name = self.loop.run_until_complete(storage.save_image("", "bench.jpg", image))
+        ics_content = self.ics.generate_ics(ticket)
+        self.loop.run_until_complete(storage.commit_task(folder_name, ticket, ics_content))
+        
+        def read_uncached():
+            storage.cache.discard(folder_name)
+            return storage.get_task_status(folder_name)
+        
+        return [
+            ("storage.write_atomic[4KB]", lambda: storage.write_atomic(storage.base_path / "bench.bin", b"x" * 4096)),
+            ("storage.save_image", self._run(lambda: storage.save_image("", "bench.jpg", image))),
+            ("storage.save_task_status", self._run(lambda: storage.save_task_status(folder_name, "processing"))),
+            ("storage.commit_task", self._run(lambda: storage.commit_task(folder_name, ticket, ics_content))),
+            ("storage.get_task_status[cached]", self._run(lambda: storage.get_task_status(folder_name))),
+            ("storage.get_task_status[uncached]", self._run(read_uncached)),
+            ("storage.load_result", self._run(lambda: storage.load_result(folder_name))),
+            ("storage.load_ics", self._run(lambda: storage.load_ics(folder_name)))
+        ]
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine()
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict[str, Any]]:
+    """按中位数对比；变化超过阈值记为退化或提升"""
+    rows = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        change = stats["median"] / baseline[name]["median"] - 1
+        verdict = "regression" if change > threshold else "improvement" if change < -threshold else "same"
+        rows.append({
+            "name": name,
+            "baseline": baseline[name]["median"],
+            "current": stats["median"],
+            "change": round(change, 4),
+            "verdict": verdict
+        })
+    return rows
+
+
+def format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.3f}s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.3f}ms"
+    return f"{value * 1e6:.1f}µs"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--filter", action="append", default=[], help="只运行名称包含该字符串的基准（可重复）")
+    parser.add_argument("--repeat", type=int, default=7, help="重复轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="单轮最少耗时（秒）")
+    parser.add_argument("--quick", action="store_true", help="快速模式（3轮，单轮0.05秒），用于冒烟检查")
+    parser.add_argument("--output", type=Path, help="结果保存为JSON")
+    parser.add_argument("--compare", type=Path, help="与基线JSON对比")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="中位数变慢超过该比例视为退化（默认0.15）")
+    parser.add_argument("--list", action="store_true", help="只列出基准名称")
+    args = parser.parse_args()
+    
+    if args.quick:
+        args.repeat, args.min_time = 3, 0.05
+    baseline = None
+    if args.compare:
+        if not args.compare.exists():
+            parser.error(f"基线文件不存在: {args.compare}")
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["results"]
+    
+    with tempfile.TemporaryDirectory(prefix="ics_bench_") as storage_dir:
+        suite = BenchmarkSuite(Path(storage_dir))
+        try:
+            cases = [
+                (name, func) for name, func in suite.cases()
+                if not args.filter or any(pattern in name for pattern in args.filter)
+            ]
+            if args.list:
+                for name, _ in cases:
+                    print(name)
+                return
+            
+            results = {}
+            for name, func in cases:
+                results[name] = measure(func, args.repeat, args.min_time)
+                stats = results[name]
+                print(f"{name:48s} {format_seconds(stats['median']):>12s}  ±{stats['stdev'] / stats['median']:.1%}", flush=True)
+        finally:
+            suite.close()
+    
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.output}")
+    
+    if baseline is None:
+        return
+    rows = compare(results, baseline, args.threshold)
+    regressions = [row for row in rows if row["verdict"] == "regression"]
+    print(f"\n与基线对比（阈值 ±{args.threshold:.0%}）:")
+    for row in rows:
+        marker = {"regression": "▲ 退化", "improvement": "▼ 提升", "same": ""}[row["verdict"]]
+        print(f"{row['name']:48s} {format_seconds(row['baseline']):>12s} → {format_seconds(row['current']):>12s}  "
+              f"{row['change']:+.1%} {marker}")
+    missing = sorted(set(baseline) - set(results))
+    if missing and not args.filter:
+        print(f"\n基线中有但本次未运行: {', '.join(missing)}")
+    if regressions:
+        print(f"\n{len(regressions)} 项退化超过阈值", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
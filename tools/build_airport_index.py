@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""构建机场IATA→时区的紧凑索引，供TimezoneService直接加载。
+
+在镜像构建时运行一次:
+    python -m tools.build_airport_index
+"""
+import argparse
+from pathlib import Path
+
+from app.services.timezone import AIRPORT_INDEX_PATH, build_airport_index, save_airport_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="构建机场时区索引")
+    parser.add_argument("--output", type=Path, default=AIRPORT_INDEX_PATH, help="输出文件路径")
+    args = parser.parse_args()
+    
+    index = build_airport_index()
+    save_airport_index(index, args.output)
+    print(f"已写入 {len(index)} 个机场到 {args.output}（{args.output.stat().st_size} 字节）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""命令行工具共用的小函数：延迟分位数统计和图片扩展名。"""
+from typing import Dict, List, Optional
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def percentile(values: List[float], quantile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(quantile * len(ordered)))
+    return round(ordered[index], 3)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 3) if values else None,
+        "mean": round(sum(values) / len(values), 3) if values else None
+    }
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""黄金集评测：对带标注的票据图片运行识别流水线，报告字段级准确率和延迟。
+
+用法:
+    # 首次对真实模型运行并录制响应
+    python -m tools.evaluate golden/ --backend record --output eval/baseline.json
+    
+    # 离线回放（按录制时的耗时），修改后与基线对比
+    python -m tools.evaluate golden/ --backend replay --compare eval/baseline.json
+    
+    # 评测另一个模型（需联网，可同时录制）
+    python -m tools.evaluate golden/ --backend record --model gpt-4o-mini
+
+黄金集目录中每张图片配一个同名JSON标注（ticket.jpg + ticket.json），内容为期望的票据字段，
+可只写需要校验的字段，例如 {"type": "flight", "start": {"datetime": "2024-05-01T08:30:00"}}。
+流水线与 /process 相同（预处理 → 模型识别 → 校验/修复 → 时区补全），不写入存储，不走条码快速通道。
+需在项目根目录运行，默认使用 config/config.json 中的配置。
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from tools.benchmark import environment
+from tools.common import IMAGE_EXTENSIONS, summarize
+
+IGNORED_FIELDS = ("id", "confidence")
+DATETIME_FIELDS = ("start.datetime", "end.datetime")
+DEFAULT_MAX_ACCURACY_DROP = 0.02
+DEFAULT_LATENCY_THRESHOLD = 0.15
+
+
+def load_golden_set(directory: Path) -> List[Tuple[str, bytes, Dict[str, Any]]]:
+    """读取图片及同名JSON标注，缺少标注的图片跳过"""
+    samples = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        label = path.with_suffix(".json")
+        if not label.exists():
+            print(f"跳过（缺少标注）: {path}", file=sys.stderr)
+            continue
+        expected = json.loads(label.read_text(encoding="utf-8"))
+        samples.append((path.relative_to(directory).as_posix(), path.read_bytes(), expected))
+    if not samples:
+        raise SystemExit(f"目录中没有带标注的图片: {directory}")
+    return samples
+
+
+def flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """嵌套字段展开为 start.datetime 形式的路径"""
+    fields = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            fields.update(flatten(value, f"{path}."))
+        elif path not in IGNORED_FIELDS:
+            fields[path] = value
+    return fields
+
+
+def normalize(field: str, value: Any) -> Any:
+    """比较前规范化：空值统一为None，字符串忽略大小写和多余空白，时间按解析后的值比较"""
+    if value is None or value == "":
+        return None
+    if field in DATETIME_FIELDS:
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            return str(value)
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    return value
+
+
+def score(expected: Dict[str, Any], actual: Dict[str, Any] | None) -> Dict[str, bool]:
+    """只校验标注中出现的字段；识别失败时全部记为错误"""
+    actual_fields = flatten(actual) if actual else {}
+    return {
+        field: actual is not None and normalize(field, value) == normalize(field, actual_fields.get(field))
+        for field, value in flatten(expected).items()
+    }
+
+
+class Evaluator:
+    def __init__(self, concurrency: int):
+        from app.config import settings
+        from app.services import tracing
+        from app.services.image_processor import image_processor
+        from app.services.timezone import timezone_service
+        from app.services.vision import vision_service
+        
+        self.settings = settings
+        self.tracing = tracing
+        self.images = image_processor
+        self.timezone = timezone_service
+        self.vision = vision_service
+        self.semaphore = asyncio.Semaphore(concurrency)
+    
+    async def _recognize(self, name: str, content: bytes) -> Dict[str, Any]:
+        """与 AsyncProcessor 相同的识别步骤，不生成ICS、不写存储"""
+        processed = self.images.process_image(content)
+        result = await self.vision.extract_ticket_info(processed)
+        if "error" not in result:
+            result["id"] = name
+            if self.settings.timezone_enrich:
+                result = self.timezone.enrich(result)
+        return result
+    
+    async def evaluate(self, name: str, content: bytes, expected: Dict[str, Any]) -> Dict[str, Any]:
+        async with self.semaphore:
+            with self.tracing.task_trace() as trace:
+                try:
+                    result = await self._recognize(name, content)
+                except Exception as e:
+                    result = {"error": str(e)}
+                timings = trace.to_dict()
+        
+        actual = None if "error" in result else result
+        fields = score(expected, actual)
+        sample = {
+            "name": name,
+            "ok": actual is not None,
+            "fields": fields,
+            "exact": actual is not None and all(fields.values()),
+            "timings": timings
+        }
+        if actual is None:
+            sample["error"] = result["error"]
+        else:
+            actual_fields = flatten(actual)
+            sample["mismatches"] = {
+                field: {"expected": value, "actual": actual_fields.get(field)}
+                for field, value in flatten(expected).items() if not fields[field]
+            }
+        return sample
+
+
+def build_report(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    field_totals: Dict[str, List[int]] = {}
+    for sample in samples:
+        for field, correct in sample["fields"].items():
+            totals = field_totals.setdefault(field, [0, 0])
+            totals[0] += int(correct)
+            totals[1] += 1
+    correct_fields = sum(correct for correct, _ in field_totals.values())
+    total_fields = sum(total for _, total in field_totals.values())
+    
+    spans: Dict[str, List[float]] = {}
+    for sample in samples:
+        for span, seconds in sample["timings"]["spans"].items():
+            spans.setdefault(span, []).append(seconds)
+    tokens = {"prompt": 0, "completion": 0}
+    for sample in samples:
+        for kind, count in sample["timings"].get("tokens", {}).items():
+            tokens[kind] += count
+    
+    return {
+        "samples": len(samples),
+        "failed": sum(not sample["ok"] for sample in samples),
+        "exact_match": round(sum(sample["exact"] for sample in samples) / len(samples), 4),
+        "field_accuracy": round(correct_fields / total_fields, 4) if total_fields else None,
+        "fields": {
+            field: {"accuracy": round(correct / total, 4), "correct": correct, "total": total}
+            for field, (correct, total) in sorted(field_totals.items())
+        },
+        "latency": {
+            "total": summarize([sample["timings"]["total"] for sample in samples]),
+            **{span: summarize(values) for span, values in spans.items()}
+        },
+        "tokens": tokens
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_drop: float, threshold: float) -> List[str]:
+    """准确率下降超过max_drop、p95总耗时变慢超过threshold时返回退化说明"""
+    regressions = []
+    for key in ("field_accuracy", "exact_match"):
+        if report[key] is not None and baseline.get(key) is not None and baseline[key] - report[key] > max_drop:
+            regressions.append(f"{key}: {baseline[key]:.1%} → {report[key]:.1%}")
+    for field, stats in report["fields"].items():
+        previous = baseline.get("fields", {}).get(field)
+        if previous and previous["accuracy"] - stats["accuracy"] > max_drop:
+            regressions.append(f"{field}: {previous['accuracy']:.1%} → {stats['accuracy']:.1%}")
+    current_p95 = report["latency"]["total"]["p95"]
+    previous_p95 = baseline.get("latency", {}).get("total", {}).get("p95")
+    if current_p95 and previous_p95 and current_p95 / previous_p95 - 1 > threshold:
+        regressions.append(f"latency.total.p95: {previous_p95}s → {current_p95}s")
+    return regressions
+
+
+def print_report(report: Dict[str, Any], samples: List[Dict[str, Any]], show_mismatches: bool) -> None:
+    # 标注中没有可比较的字段时准确率为None
+    field_accuracy = "-" if report["field_accuracy"] is None else f"{report['field_accuracy']:.1%}"
+    print(f"样本 {report['samples']}，识别失败 {report['failed']}，"
+          f"完全正确 {report['exact_match']:.1%}，字段准确率 {field_accuracy}")
+    print("\n字段准确率:")
+    for field, stats in report["fields"].items():
+        print(f"  {field:32s} {stats['accuracy']:7.1%}  ({stats['correct']}/{stats['total']})")
+    print("\n延迟（秒）:")
+    for name, stats in report["latency"].items():
+        print(f"  {name:12s} p50 {stats['p50']}  p95 {stats['p95']}  max {stats['max']}")
+    print(f"\ntoken: 输入 {report['tokens']['prompt']}，输出 {report['tokens']['completion']}")
+    if not show_mismatches:
+        return
+    for sample in samples:
+        if not sample["ok"]:
+            print(f"\n✗ {sample['name']}: {sample['error']}")
+        elif sample["mismatches"]:
+            print(f"\n✗ {sample['name']}")
+            for field, values in sample["mismatches"].items():
+                print(f"    {field}: 期望 {values['expected']!r}，实际 {values['actual']!r}")
+
+
+async def run(samples: List[Tuple[str, bytes, Dict[str, Any]]], concurrency: int) -> List[Dict[str, Any]]:
+    evaluator = Evaluator(concurrency)
+    return await asyncio.gather(*(evaluator.evaluate(*sample) for sample in samples))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="黄金集字段级准确率与延迟评测")
+    parser.add_argument("golden", type=Path, help="黄金集目录（图片 + 同名JSON标注）")
+    parser.add_argument("--backend", choices=("live", "record", "replay"), help="覆盖 openai.backend")
+    parser.add_argument("--recordings", help="覆盖 openai.recordings_path")
+    parser.add_argument("--replay-speed", type=float, help="覆盖 openai.replay_speed（0为不等待）")
+    parser.add_argument("--model", help="覆盖 openai.model")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发识别数（默认1，延迟不受排队影响）")
+    parser.add_argument("--output", type=Path, help="结果保存为JSON")
+    parser.add_argument("--compare", type=Path, help="与基线JSON对比，退化时退出码为1")
+    parser.add_argument("--max-accuracy-drop", type=float, default=DEFAULT_MAX_ACCURACY_DROP,
+                        help="准确率下降超过该值视为退化（默认0.02）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_LATENCY_THRESHOLD,
+                        help="p95总耗时变慢超过该比例视为退化（默认0.15）")
+    parser.add_argument("--min-accuracy", type=float, help="字段准确率低于该值时退出码为1")
+    parser.add_argument("--show-mismatches", action="store_true", help="列出每个样本的错误字段")
+    args = parser.parse_args()
+    
+    baseline = None
+    if args.compare:
+        if not args.compare.exists():
+            parser.error(f"基线文件不存在: {args.compare}")
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["report"]
+    
+    from app.config import settings
+    
+    overrides = {
+        "openai_backend": args.backend,
+        "openai_recordings_path": args.recordings,
+        "openai_replay_speed": args.replay_speed,
+        "openai_model": args.model
+    }
+    snapshot = dataclasses.replace(
+        settings.snapshot(), **{key: value for key, value in overrides.items() if value is not None}
+    )
+    golden = load_golden_set(args.golden)
+    with settings.pinned(snapshot):
+        samples = asyncio.run(run(golden, args.concurrency))
+    
+    report = build_report(samples)
+    print_report(report, samples, args.show_mismatches)
+    if args.output:
+        output = {
+            "environment": {
+                **environment(),
+                "backend": snapshot.openai_backend,
+                "model": snapshot.openai_model
+            },
+            "report": report,
+            "samples": samples
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.output}")
+    
+    failed = False
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_accuracy_drop, args.threshold)
+        if regressions:
+            print("\n相对基线退化:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            failed = True
+        else:
+            print("\n与基线相比无退化")
+    if args.min_accuracy is not None and (report["field_accuracy"] or 0) < args.min_accuracy:
+        print(f"\n字段准确率低于 {args.min_accuracy:.1%}", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
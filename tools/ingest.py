@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""离线批量导入票据图片，直接运行识别流水线并写入存储。
+
+用法:
+    python -m tools.ingest /path/to/images
+    python -m tools.ingest --manifest files.txt --concurrency 8
+    python -m tools.ingest /path/to/images --retry-failed
+
+需在项目根目录运行（读取 config/config.json，写入配置的存储目录）。
+进度逐条追加到检查点文件（JSONL），中断后重新运行同一命令会跳过已完成的
+文件；已开始但未记录结果的任务若在存储中已完成，直接采用其结果而不重新
+调用模型。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".heic")
+DEFAULT_CHECKPOINT = "ingest_checkpoint.jsonl"
+PROGRESS_EVERY = 20
+
+
+def iter_inputs(directory: Optional[Path], manifest: Optional[Path], extensions: tuple) -> Iterator[Path]:
+    """按文件名顺序遍历目录中的图片，或按清单逐行读取路径"""
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield Path(line).expanduser()
+        return
+    for path in sorted(directory.rglob("*")):
+        if path.is_file() and path.suffix.lower() in extensions:
+            yield path
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """读取检查点：每个文件以最后一条记录为准"""
+    entries: Dict[str, Dict[str, Any]] = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中断时写了一半的行
+                    continue
+                entries[entry["path"]] = entry
+    return entries
+
+
+class Ingestor:
+    def __init__(self, checkpoint_path: Path, concurrency: int, retry_failed: bool):
+        # 延迟导入，使 --help 不加载应用
+        from app.services.async_processor import async_processor
+        from app.services.storage import storage_service
+        
+        self.processor = async_processor
+        self.storage = storage_service
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.retry_failed = retry_failed
+        self.done = load_checkpoint(checkpoint_path)
+        self.counts = Counter()
+        self.errors = Counter()
+        self.task_seconds = 0.0
+        self.started = time.monotonic()
+        self._checkpoint = None
+    
+    def _record(self, entry: Dict[str, Any]) -> None:
+        self.done[entry["path"]] = entry
+        self._checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._checkpoint.flush()
+    
+    async def _resume(self, key: str, entry: Dict[str, Any]) -> bool:
+        """检查上次中断的任务是否已在存储中完成"""
+        status = await self.storage.get_task_status(entry["id"])
+        if status.get("status") not in ("completed", "failed"):
+            if status.get("status") != "not_found":
+                # 中断时仍在处理的任务标记为失败，随后重新导入
+                await self.storage.save_task_status(entry["id"], "failed", {"error": "导入中断"})
+            return False
+        error = (status.get("data") or {}).get("error") if status["status"] == "failed" else None
+        self._record({**entry, "status": status["status"], "error": error, "resumed": True})
+        if status["status"] == "failed" and self.retry_failed:
+            # 随后重新处理，由重新处理的结果计数
+            return False
+        self.counts[status["status"]] += 1
+        if error:
+            self.errors[error[:80]] += 1
+        return True
+    
+    async def _process(self, path: Path) -> None:
+        key = str(path.resolve())
+        entry = self.done.get(key)
+        if entry:
+            if entry["status"] == "completed" or (entry["status"] == "failed" and not self.retry_failed):
+                self.counts["skipped"] += 1
+                return
+            if entry["status"] == "started" and await self._resume(key, entry):
+                return
+        
+        started = time.monotonic()
+        try:
+            content = await asyncio.to_thread(path.read_bytes)
+            folder_name = await self.storage.save_image("", path.name, content)
+            self._record({"path": key, "id": folder_name, "status": "started"})
+            result = await self.processor.process_ticket(folder_name, content)
+            status, error = result["status"], result.get("error")
+        except Exception as e:
+            folder_name, status, error = None, "failed", str(e)
+        
+        elapsed = time.monotonic() - started
+        self.task_seconds += elapsed
+        self._record({
+            "path": key,
+            "id": folder_name,
+            "status": status,
+            "error": error,
+            "seconds": round(elapsed, 3)
+        })
+        self.counts[status] += 1
+        if error:
+            self.errors[error[:80]] += 1
+    
+    def _progress(self) -> None:
+        processed = self.counts["completed"] + self.counts["failed"]
+        elapsed = time.monotonic() - self.started
+        rate = processed / elapsed * 60 if elapsed else 0
+        print(
+            f"[{elapsed:7.1f}s] 完成 {self.counts['completed']}  失败 {self.counts['failed']}  "
+            f"跳过 {self.counts['skipped']}  {rate:.1f} 张/分钟",
+            flush=True
+        )
+    
+    async def run(self, inputs: Iterator[Path], limit: int = 0) -> None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        
+        async def worker() -> None:
+            while True:
+                path = await queue.get()
+                try:
+                    await self._process(path)
+                    total = sum(self.counts.values())
+                    if total % PROGRESS_EVERY == 0:
+                        self._progress()
+                finally:
+                    queue.task_done()
+        
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as self._checkpoint:
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                for index, path in enumerate(inputs):
+                    if limit and index >= limit:
+                        break
+                    await queue.put(path)
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        processed = self.counts["completed"] + self.counts["failed"]
+        return {
+            "completed": self.counts["completed"],
+            "failed": self.counts["failed"],
+            "skipped": self.counts["skipped"],
+            "seconds": round(elapsed, 1),
+            "per_minute": round(processed / elapsed * 60, 1) if elapsed else 0,
+            "avg_task_seconds": round(self.task_seconds / processed, 2) if processed else 0,
+            "top_errors": self.errors.most_common(10)
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线批量导入票据图片")
+    parser.add_argument("directory", nargs="?", type=Path, help="图片目录（递归遍历）")
+    parser.add_argument("--manifest", type=Path, help="文件清单，每行一个图片路径")
+    parser.add_argument("--concurrency", type=int, default=0, help="并发任务数，默认取 async.max_workers")
+    parser.add_argument("--checkpoint", type=Path, default=Path(DEFAULT_CHECKPOINT), help="检查点文件路径")
+    parser.add_argument("--retry-failed", action="store_true", help="重新处理上次失败的文件")
+    parser.add_argument("--limit", type=int, default=0, help="最多处理的文件数（调试用）")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出汇总")
+    args = parser.parse_args()
+    
+    if not args.directory and not args.manifest:
+        parser.error("需要指定图片目录或 --manifest")
+    if args.directory and not args.directory.is_dir():
+        parser.error(f"目录不存在: {args.directory}")
+    
+    from app.config import settings
+    from app.services.profiler import install_signal_handler
+    
+    # kill -USR2 <pid> 采样导入进程
+    install_signal_handler()
+    concurrency = args.concurrency or settings.max_workers
+    ingestor = Ingestor(args.checkpoint, concurrency, args.retry_failed)
+    inputs = iter_inputs(args.directory, args.manifest, IMAGE_EXTENSIONS)
+    try:
+        asyncio.run(ingestor.run(inputs, args.limit))
+    except KeyboardInterrupt:
+        print("\n已中断，重新运行同一命令即可从检查点继续", file=sys.stderr)
+    
+    summary = ingestor.summary()
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"\n完成 {summary['completed']}  失败 {summary['failed']}  跳过 {summary['skipped']}  "
+              f"耗时 {summary['seconds']}s  吞吐 {summary['per_minute']} 张/分钟  "
+              f"单任务平均 {summary['avg_task_seconds']}s")
+        if summary["top_errors"]:
+            print("\n失败原因:")
+            for error, count in summary["top_errors"]:
+                print(f"  {count:5d}  {error}")
+    
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
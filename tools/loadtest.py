@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""端到端压测：启动本地模型替身服务，按目标速率驱动 /upload+轮询 或 /process。
+
+用法:
+    # 启动替身服务和独立的API实例（临时目录，不影响现有存储），压测60秒
+    python -m tools.loadtest --start-api --rate 5 --duration 60 --corpus /path/to/images
+    
+    # 对已运行的API压测（其 openai.base_url 需指向替身服务）
+    python -m tools.stub_openai --port 9000 --latency lognormal:1.5,0.4 &
+    python -m tools.loadtest --api http://127.0.0.1:8000 --token <token> --mode upload --no-stub
+    
+    # 作为容量回归门禁
+    python -m tools.loadtest --start-api --rate 8 --max-p95 6 --max-error-rate 0.01 --json
+
+需在项目根目录运行。未指定 --corpus 时生成若干合成图片。
+报告吞吐、端到端延迟 p50/p95/p99，以及服务端（来自 /metrics）和压测端的事件循环延迟。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from tools.common import IMAGE_EXTENSIONS, summarize
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODES = ("process", "upload", "mixed")
+LAG_METRIC = "ics_event_loop_lag_seconds"
+LAG_INTERVAL = 0.25
+
+
+def load_corpus(directory: Optional[Path], synthetic: int) -> List[Tuple[str, bytes]]:
+    """读取目录中的图片；未指定目录时生成尺寸和内容各不相同的合成图片"""
+    if directory:
+        corpus = [
+            (path.name, path.read_bytes())
+            for path in sorted(directory.rglob("*"))
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+        ]
+        if not corpus:
+            raise SystemExit(f"目录中没有图片: {directory}")
+        return corpus
+    
+    from PIL import Image, ImageDraw
+    
+    rng = random.Random(0)
+    corpus = []
+    for index in range(synthetic):
+        width, height = rng.choice([(1600, 1200), (3024, 4032), (1080, 1920), (800, 600)])
+        image = Image.new("RGB", (width, height), (250, 250, 245))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.rectangle((x, y, x + rng.randrange(20, 300), y + rng.randrange(10, 60)), fill=(rng.randrange(200), 40, 90))
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=90)
+        corpus.append((f"synthetic_{index:02d}.jpg", output.getvalue()))
+    return corpus
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"子进程启动失败（退出码 {process.returncode}）: {url}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"等待服务启动超时: {url}")
+
+
+def start_stub(args) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    command = [
+        sys.executable, "-m", "tools.stub_openai",
+        "--port", str(port),
+        "--latency", args.stub_latency,
+        "--error-rate", str(args.stub_error_rate),
+        "--error-status", str(args.stub_error_status)
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    wait_until_up(f"http://127.0.0.1:{port}/docs", process)
+    return process, base_url
+
+
+def start_api(args, stub_url: str, workdir: Path) -> Tuple[subprocess.Popen, str, str]:
+    """在临时目录启动API：复制当前配置，存储写入临时目录，上游指向替身服务"""
+    source = PROJECT_ROOT / "config" / "config.json"
+    if not source.exists():
+        source = PROJECT_ROOT / "config" / "config.sample.json"
+    config = json.loads(source.read_text(encoding="utf-8"))
+    token = secrets.token_hex(16)
+    config.setdefault("storage", {})["path"] = "./storage"
+    config.setdefault("auth", {}).setdefault("api", {})["token"] = token
+    config["auth"].setdefault("admin", {})["token"] = token
+    config.setdefault("openai", {})["base_url"] = stub_url
+    for section in ("batch", "retention", "archive"):
+        config.setdefault(section, {})["enabled"] = False
+    if args.workers:
+        config.setdefault("async", {})["max_in_flight"] = args.workers
+    
+    (workdir / "config").mkdir(parents=True)
+    (workdir / "storage").mkdir()
+    (workdir / "config" / "config.json").write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": str(PROJECT_ROOT), "OPENAI_BASE_URL": stub_url, "OPENAI_API_KEY": "stub"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    api_url = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{api_url}/health/live", process)
+    return process, api_url, token
+
+
+def parse_histogram(text: str, name: str) -> Dict[float, float]:
+    """从Prometheus文本中取无标签直方图的累计桶计数"""
+    buckets = {}
+    pattern = re.compile(rf'^{name}_bucket\{{le="([^"]+)"\}} (\S+)$', re.MULTILINE)
+    for bound, count in pattern.findall(text):
+        buckets[float("inf") if bound == "+Inf" else float(bound)] = float(count)
+    return buckets
+
+
+def histogram_quantiles(before: Dict[float, float], after: Dict[float, float]) -> Dict[str, Optional[float]]:
+    """压测期间新增样本的分位数（取所在桶的上界）"""
+    bounds = sorted(after)
+    delta = [(bound, after[bound] - before.get(bound, 0)) for bound in bounds]
+    total = delta[-1][1] if delta else 0
+    result: Dict[str, Optional[float]] = {"samples": int(total)}
+    for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = None
+        if total:
+            value = next(bound for bound, count in delta if count >= quantile * total)
+        result[name] = value if value != float("inf") else None
+    return result
+
+
+class LoadTest:
+    def __init__(self, api_url: str, token: str, corpus: List[Tuple[str, bytes]], args):
+        self.api_url = api_url
+        self.token = token
+        self.corpus = corpus
+        self.args = args
+        self.latencies: List[float] = []
+        self.counts = Counter()
+        self.errors = Counter()
+        self.client_lag: List[float] = []
+        self._outstanding = 0
+    
+    async def _monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.client_lag.append(max(0.0, loop.time() - started - LAG_INTERVAL))
+    
+    async def _scrape_lag(self, client: httpx.AsyncClient) -> Dict[float, float]:
+        try:
+            response = await client.get("/metrics")
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return {}
+        return parse_histogram(response.text, LAG_METRIC)
+    
+    async def _process(self, client: httpx.AsyncClient, name: str, content: bytes) -> Tuple[bool, str]:
+        response = await client.post("/process", files={"file": (name, content, "image/jpeg")})
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}"
+        body = response.json()
+        return body["status"] == "completed", body.get("error") or body["status"]
+    
+    async def _upload(self, client: httpx.AsyncClient, name: str, content: bytes) -> Tuple[bool, str]:
+        response = await client.post("/upload", files={"file": (name, content, "image/jpeg")})
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}"
+        task_id = response.json()["id"]
+        deadline = time.monotonic() + self.args.task_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            response = await client.get(f"/result/{task_id}")
+            if response.status_code != 200:
+                continue
+            body = response.json()
+            if body["status"] in ("completed", "failed"):
+                return body["status"] == "completed", body.get("error") or body["status"]
+        return False, "轮询超时"
+    
+    async def _one(self, client: httpx.AsyncClient, index: int) -> None:
+        name, content = self.corpus[index % len(self.corpus)]
+        mode = self.args.mode
+        if mode == "mixed":
+            mode = "upload" if index % 2 else "process"
+        started = time.perf_counter()
+        try:
+            ok, detail = await (self._upload if mode == "upload" else self._process)(client, name, content)
+        except httpx.HTTPError as e:
+            ok, detail = False, type(e).__name__
+        finally:
+            self._outstanding -= 1
+        if ok:
+            self.latencies.append(time.perf_counter() - started)
+            self.counts["completed"] += 1
+        else:
+            self.counts["failed"] += 1
+            self.errors[detail[:80]] += 1
+    
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        limits = httpx.Limits(max_connections=args.concurrency + 4)
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        async with httpx.AsyncClient(base_url=self.api_url, headers=headers, limits=limits, timeout=args.task_timeout) as client:
+            lag_before = await self._scrape_lag(client)
+            monitor = asyncio.create_task(self._monitor_lag())
+            rng = random.Random(args.seed)
+            tasks = []
+            started = time.perf_counter()
+            next_at = started
+            index = 0
+            # 开环发压：按计划时间发出请求，不等待前一个完成；在途请求达到上限时记为丢弃
+            while next_at - started < args.duration:
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                if self._outstanding >= args.concurrency:
+                    self.counts["dropped"] += 1
+                else:
+                    self._outstanding += 1
+                    self.counts["sent"] += 1
+                    tasks.append(asyncio.create_task(self._one(client, index)))
+                index += 1
+                next_at += rng.expovariate(args.rate) if args.poisson else 1 / args.rate
+            send_seconds = time.perf_counter() - started
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            monitor.cancel()
+            lag_after = await self._scrape_lag(client)
+        
+        finished = self.counts["completed"] + self.counts["failed"]
+        return {
+            "mode": args.mode,
+            "target_rate": args.rate,
+            "duration": round(send_seconds, 1),
+            "elapsed": round(elapsed, 1),
+            "sent": self.counts["sent"],
+            "completed": self.counts["completed"],
+            "failed": self.counts["failed"],
+            "dropped": self.counts["dropped"],
+            "error_rate": round(self.counts["failed"] / finished, 4) if finished else 0.0,
+            "throughput": round(self.counts["completed"] / elapsed, 2) if elapsed else 0.0,
+            "latency": summarize(self.latencies),
+            "server_loop_lag": histogram_quantiles(lag_before, lag_after) if lag_after else None,
+            "client_loop_lag": summarize(self.client_lag),
+            "top_errors": self.errors.most_common(10)
+        }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(f"\n模式 {report['mode']}  目标 {report['target_rate']}/s  发压 {report['duration']}s  总耗时 {report['elapsed']}s")
+    print(f"发送 {report['sent']}  完成 {report['completed']}  失败 {report['failed']}  丢弃 {report['dropped']}  "
+          f"错误率 {report['error_rate']:.2%}  吞吐 {report['throughput']}/s")
+    print(f"端到端延迟  p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    lag = report["server_loop_lag"]
+    if lag:
+        print(f"服务端事件循环延迟  p50 ≤{lag['p50']}s  p95 ≤{lag['p95']}s  p99 ≤{lag['p99']}s（{lag['samples']}个样本）")
+    client_lag = report["client_loop_lag"]
+    print(f"压测端事件循环延迟  p95 {client_lag['p95']}s  max {client_lag['max']}s")
+    if report["top_errors"]:
+        print("\n失败原因:")
+        for error, count in report["top_errors"]:
+            print(f"  {count:5d}  {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端压测（本地模型替身服务）")
+    parser.add_argument("--api", default="http://127.0.0.1:8000", help="被测API地址（与 --start-api 互斥）")
+    parser.add_argument("--token", default=os.getenv("API_AUTH_TOKEN", ""), help="API令牌，默认取环境变量 API_AUTH_TOKEN")
+    parser.add_argument("--start-api", action="store_true", help="在临时目录启动独立API实例，上游指向替身服务")
+    parser.add_argument("--no-stub", action="store_true", help="不启动替身服务（被测API已配置上游）")
+    parser.add_argument("--workers", type=int, default=0, help="--start-api 时设置 async.max_in_flight")
+    parser.add_argument("--mode", choices=MODES, default="process", help="process、upload（上传后轮询）或 mixed")
+    parser.add_argument("--rate", type=float, default=2.0, help="目标请求速率（次/秒）")
+    parser.add_argument("--poisson", action="store_true", help="按泊松过程发压（默认等间隔）")
+    parser.add_argument("--duration", type=float, default=30.0, help="发压时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=64, help="在途请求上限，超出时丢弃")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="upload模式的轮询间隔（秒）")
+    parser.add_argument("--task-timeout", type=float, default=120.0, help="单个请求/任务的超时（秒）")
+    parser.add_argument("--corpus", type=Path, help="图片目录（递归遍历）")
+    parser.add_argument("--synthetic", type=int, default=8, help="未指定 --corpus 时生成的合成图片数")
+    parser.add_argument("--stub-latency", default="lognormal:1.5,0.4", help="替身服务延迟分布")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="替身服务错误比例")
+    parser.add_argument("--stub-error-status", type=int, default=500, help="替身服务注入错误的状态码")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--max-p95", type=float, default=0, help="p95延迟超过该秒数时以非零状态退出")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="错误率超过该值时以非零状态退出")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出报告")
+    args = parser.parse_args()
+    
+    if args.rate <= 0 or args.duration <= 0:
+        parser.error("--rate 和 --duration 必须大于0")
+    if args.corpus and not args.corpus.is_dir():
+        parser.error(f"目录不存在: {args.corpus}")
+    
+    corpus = load_corpus(args.corpus, args.synthetic)
+    processes: List[subprocess.Popen] = []
+    workdir = None
+    try:
+        api_url, token = args.api, args.token
+        stub_url = None
+        if not args.no_stub:
+            stub, stub_url = start_stub(args)
+            processes.append(stub)
+        if args.start_api:
+            if stub_url is None:
+                parser.error("--start-api 需要替身服务，不能与 --no-stub 同时使用")
+            workdir = Path(tempfile.mkdtemp(prefix="ics_loadtest_"))
+            api, api_url, token = start_api(args, stub_url, workdir)
+            processes.append(api)
+        elif stub_url:
+            print(f"替身服务: {stub_url}（被测API的 openai.base_url 需指向此地址）", file=sys.stderr)
+        
+        report = asyncio.run(LoadTest(api_url, token, corpus, args).run())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    
+    p95 = report["latency"]["p95"]
+    if args.max_p95 and (p95 is None or p95 > args.max_p95):
+        sys.exit(1)
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""启动耗时与导入分析报告，用于控制容器冷启动时间。
+
+用法:
+    python -m tools.profile_startup
+    python -m tools.profile_startup --top 20 --forbid cv2 --forbid openai
+
+在独立子进程中以 -X importtime 导入目标模块，输出总耗时、常驻内存、
+耗时最多的顶层包，以及重型依赖是否在启动时被加载。--forbid 指定的模块
+若在启动时被导入则以非零状态退出，可用于CI检查。
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "openai", "icalendar", "airportsdata", "timezonefinder", "zxingcpp")
+
+CHILD_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": sorted(sys.modules)
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """汇总 -X importtime 输出，按顶层包统计自身导入耗时（微秒）"""
+    totals = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us)
+    return dict(totals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="启动耗时与导入分析")
+    parser.add_argument("--module", default="app.main", help="要导入的模块")
+    parser.add_argument("--top", type=int, default=15, help="显示耗时最多的顶层包数量")
+    parser.add_argument("--forbid", action="append", default=[], help="启动时不允许导入的模块，可多次指定")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+    
+    root = Path(__file__).resolve().parent.parent
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT.format(module=args.module)],
+        cwd=root,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        sys.exit(proc.returncode)
+    
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    loaded = set(child["modules"])
+    packages = sorted(parse_importtime(proc.stderr).items(), key=lambda item: item[1], reverse=True)
+    heavy = {name: name in loaded for name in HEAVY_MODULES}
+    violations = [name for name in args.forbid if name in loaded]
+    
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "seconds": child["seconds"],
+            "max_rss_kb": child["max_rss_kb"],
+            "module_count": len(loaded),
+            "top_packages": [{"name": name, "ms": us / 1000} for name, us in packages[:args.top]],
+            "heavy_modules": heavy,
+            "violations": violations
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"导入 {args.module}: {child['seconds'] * 1000:.0f} ms, "
+              f"最大RSS {child['max_rss_kb'] / 1024:.1f} MB, 已加载模块 {len(loaded)} 个")
+        print(f"\n耗时最多的顶层包（前{args.top}）:")
+        for name, us in packages[:args.top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+        print("\n重型依赖:")
+        for name, is_loaded in heavy.items():
+            print(f"  {'已加载' if is_loaded else '未加载'}  {name}")
+    
+    if violations:
+        sys.stderr.write(f"启动时导入了禁止的模块: {', '.join(violations)}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""本地OpenAI兼容替身服务，用于离线测试批处理、识别接口和压测。
+
+用法:
+    python -m tools.stub_openai --port 9000 --batch-delay 5
+    python -m tools.stub_openai --port 9000 --latency lognormal:1.5,0.4 --error-rate 0.02
+
+然后在config.json中设置 batch.base_url 或 openai.base_url 为 http://127.0.0.1:9000/v1
+（也可通过环境变量 OPENAI_BASE_URL 指定）。
+
+识别请求按图片内容哈希稳定地选择一种票据类型的固定结果，同一张图片每次返回相同类型。
+延迟分布格式：fixed:秒、uniform:最小,最大、normal:均值,标准差、lognormal:中位数,sigma。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from typing import Callable, Dict, Any, List
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+CANNED_TICKETS = {
+    "flight": {
+        "type": "flight",
+        "title": "CA1234 北京首都(T3) → 上海虹桥(T2)",
+        "start": {"datetime": "2025-06-10T08:00:00", "timezone": "Asia/Shanghai"},
+        "end": {"datetime": "2025-06-10T10:15:00", "timezone": "Asia/Shanghai"},
+        "location": {"name": "北京首都国际机场 (T3)", "address": None},
+        "details": {"seat": "32A", "gate": "E12", "reference": "ABC123"},
+        "confidence": 0.9
+    },
+    "train": {
+        "type": "train",
+        "title": "G102 北京南 → 上海虹桥",
+        "start": {"datetime": "2025-06-11T07:10:00", "timezone": "Asia/Shanghai"},
+        "end": {"datetime": "2025-06-11T12:48:00", "timezone": "Asia/Shanghai"},
+        "location": {"name": "北京南站", "address": None},
+        "details": {"seat": "05车12F", "gate": "检票口A8", "reference": "E123456789"},
+        "confidence": 0.92
+    },
+    "concert": {
+        "type": "concert",
+        "title": "周杰伦嘉年华世界巡回演唱会",
+        "start": {"datetime": "2025-07-05T19:30:00", "timezone": "Asia/Shanghai"},
+        "end": {"datetime": "2025-07-05T22:30:00", "timezone": "Asia/Shanghai"},
+        "location": {"name": "上海体育场", "address": "上海市徐汇区天钥桥路666号"},
+        "details": {"seat": "内场A区8排12号", "gate": "3号口", "reference": None},
+        "confidence": 0.85
+    },
+    "theater": {
+        "type": "theater",
+        "title": "话剧《茶馆》",
+        "start": {"datetime": "2025-08-20T19:30:00", "timezone": "Asia/Shanghai"},
+        "end": {"datetime": "2025-08-20T22:00:00", "timezone": "Asia/Shanghai"},
+        "location": {"name": "北京人民艺术剧院首都剧场", "address": "北京市东城区王府井大街22号"},
+        "details": {"seat": "一层6排15号", "gate": None, "reference": None},
+        "confidence": 0.88
+    },
+    "generic": {
+        "type": "generic",
+        "title": "博物馆参观预约",
+        "start": {"datetime": "2025-09-01T09:00:00", "timezone": "Asia/Shanghai"},
+        "end": {"datetime": "2025-09-01T11:00:00", "timezone": "Asia/Shanghai"},
+        "location": {"name": "故宫博物院", "address": "北京市东城区景山前街4号"},
+        "details": {"seat": None, "gate": "午门", "reference": "GG20250901"},
+        "confidence": 0.8
+    }
+}
+CANNED_TICKET = CANNED_TICKETS["flight"]
+# 流式响应的分块大小（字符）
+STREAM_CHUNK = 24
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """解析延迟分布描述，返回采样函数（秒，不小于0）"""
+    kind, _, params = spec.partition(":")
+    values = [float(item) for item in params.split(",") if item.strip()] if params else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"无法解析延迟分布: {spec}")
+
+
+def _image_digest(messages: List[Dict[str, Any]]) -> str | None:
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                return hashlib.sha256(part["image_url"]["url"].encode("utf-8")).hexdigest()
+    return None
+
+
+def _estimate_usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+    """粗略估算token数：文字按4字符1个token，每张图片按765个token"""
+    prompt = 0
+    for message in messages:
+        parts = message.get("content")
+        parts = parts if isinstance(parts, list) else [{"type": "text", "text": parts or ""}]
+        for part in parts:
+            prompt += 765 if part.get("type") == "image_url" else len(part.get("text", "")) // 4
+    completion = max(1, len(content) // 4)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def chat_completion_body(model: str, content: str) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+
+
+def chat_chunk_body(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: str | None = None) -> Dict[str, Any]:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+
+def create_app(
+    batch_delay: float = 5.0,
+    latency: str = "fixed:0",
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    ticket_types: List[str] | None = None,
+    seed: int | None = None
+) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+    files: Dict[str, Dict[str, Any]] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+    rng = random.Random(seed)
+    sample_latency = parse_latency(latency, rng)
+    types = ticket_types or list(CANNED_TICKETS)
+    
+    def pick_ticket(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        digest = _image_digest(messages)
+        if digest is None:
+            # 文本修复请求等不带图片的请求
+            return CANNED_TICKETS[types[0]]
+        return CANNED_TICKETS[types[int(digest[:8], 16) % len(types)]]
+    
+    def store_file(filename: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content
+        }
+        return files[file_id]
+    
+    def public(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in record.items() if not key.startswith("_") and key != "content"}
+    
+    def complete_batch(batch: Dict[str, Any]) -> None:
+        """到达延迟后为输入文件中的每个请求生成固定结果"""
+        output = []
+        for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            model = request.get("body", {}).get("model", "stub")
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": chat_completion_body(model, json.dumps(CANNED_TICKET, ensure_ascii=False))
+                },
+                "error": None
+            }, ensure_ascii=False))
+        output_file = store_file("batch_output.jsonl", "batch_output", "\n".join(output).encode("utf-8"))
+        batch.update({
+            "status": "completed",
+            "output_file_id": output_file["id"],
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(output), "completed": len(output), "failed": 0}
+        })
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "stub")
+        messages = payload.get("messages", [])
+        delay = sample_latency()
+        
+        if rng.random() < error_rate:
+            await asyncio.sleep(delay)
+            headers = {"Retry-After": "1"} if error_status == 429 else None
+            return JSONResponse(
+                status_code=error_status,
+                content={"error": {"message": "stub injected error", "type": "server_error", "code": None}},
+                headers=headers
+            )
+        
+        content = json.dumps(pick_ticket(messages), ensure_ascii=False)
+        usage = _estimate_usage(messages, content)
+        if not payload.get("stream"):
+            await asyncio.sleep(delay)
+            body = chat_completion_body(model, content)
+            body["usage"] = usage
+            return body
+        
+        include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = [content[i:i + STREAM_CHUNK] for i in range(0, len(content), STREAM_CHUNK)]
+        
+        async def events():
+            # 一半延迟作为首字延迟，其余均摊到各分块
+            await asyncio.sleep(delay / 2)
+            yield f"data: {json.dumps(chat_chunk_body(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+            for piece in pieces:
+                await asyncio.sleep(delay / 2 / len(pieces))
+                yield f"data: {json.dumps(chat_chunk_body(completion_id, model, {'content': piece}), ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps(chat_chunk_body(completion_id, model, {}, 'stop'))}\n\n"
+            if include_usage:
+                final = chat_chunk_body(completion_id, model, {})
+                final["choices"] = []
+                final["usage"] = usage
+                yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return public(store_file(file.filename, purpose, await file.read()))
+    
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return Response(content=files[file_id]["content"], media_type="application/octet-stream")
+    
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        payload = await request.json()
+        if payload.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="input file not found")
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload.get("endpoint"),
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "_ready_at": time.time() + batch_delay
+        }
+        return public(batches[batch_id])
+    
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        batch = batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="batch not found")
+        if batch["status"] == "in_progress" and time.time() >= batch["_ready_at"]:
+            complete_batch(batch)
+        return public(batch)
+    
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="批处理任务完成前的延迟秒数")
+    parser.add_argument("--latency", default="fixed:0", help="识别请求延迟分布，如 lognormal:1.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="识别请求返回错误的比例（0-1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码，429时附带Retry-After")
+    parser.add_argument("--types", default="", help="逗号分隔的票据类型，限制返回结果的类型")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现延迟和错误序列")
+    args = parser.parse_args()
+    
+    ticket_types = [item.strip() for item in args.types.split(",") if item.strip()] or None
+    unknown = [item for item in ticket_types or [] if item not in CANNED_TICKETS]
+    if unknown:
+        parser.error(f"未知票据类型: {', '.join(unknown)}")
+    try:
+        parse_latency(args.latency, random.Random())
+    except ValueError as e:
+        parser.error(str(e))
+    
+    import uvicorn
+    app = create_app(
+        batch_delay=args.batch_delay,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        ticket_types=ticket_types,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()